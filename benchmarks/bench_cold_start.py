@@ -0,0 +1,72 @@
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Entry points and how long a cold import of each may take
+BUDGETS_MS = {
+    'main': 150,
+    'mainwindow': 600,
+    'creategroups': 500,
+    'groupsview': 500,
+    'sendmessage': 600,
+    'cli': 150,
+}
+
+# Modules an entry point must not load at import time
+HEAVY_MODULES = ['PyQt5.QtWebEngineWidgets', 'bs4', 'mainwindow', 'creategroups', 'groupsview', 'sendmessage']
+# Entry points that must not load Qt at all
+QT_FREE_MODULES = ['cli']
+
+# Runs in a fresh interpreter: import one module and report its cost and what it pulled in
+PROBE = """
+import sys, json, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'ms': elapsed * 1000, 'heavy': [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+def measure(module, runs):
+    """ Return (median ms, heavy modules loaded) or None if the module cannot be imported here """
+    timings, heavy = [], []
+    heavy_modules = [name for name in HEAVY_MODULES if name != module]
+    if module in QT_FREE_MODULES:
+        heavy_modules.append('PyQt5')
+    probe = PROBE.format(module=module, heavy=heavy_modules)
+    for _ in range(runs):
+        completed = subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True, cwd=REPO_DIR)
+        if completed.returncode != 0:
+            return None
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        timings.append(result['ms'])
+        heavy = result['heavy']
+    return statistics.median(timings), heavy
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start import time of each entry point against a budget")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--scale', type=float, default=1.0, help="multiply every budget, e.g. for slow CI machines")
+    args = parser.parse_args()
+
+    over_budget = False
+    for module, budget in BUDGETS_MS.items():
+        result = measure(module, args.runs)
+        if result is None:
+            print(f"{module:<14} skipped, cannot be imported here")
+            continue
+        median, heavy = result
+        budget *= args.scale
+        verdict = 'ok' if median <= budget and not heavy else 'OVER BUDGET'
+        print(f"{module:<14} {median:8.1f} ms  (budget {budget:.0f} ms)  {verdict}")
+        if heavy:
+            print(f"{'':<14} loaded eagerly: {', '.join(heavy)}")
+        over_budget = over_budget or verdict != 'ok'
+    sys.exit(1 if over_budget else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+import os
+import time
+import random
+import argparse
+import tempfile
+
+import database
+from contactsync import import_contacts
+
+def synthetic_contacts(count, seed=0):
+    """ Yield `count` (name, phone) pairs in the mixed formats a real address book has """
+    rng = random.Random(seed)
+    formats = ['+254 7{:02d} {:06d}', '07{:02d}{:06d}', '2547{:02d}{:06d}', '002547{:02d}{:06d}']
+    for index in range(count):
+        prefix, number = divmod(index, 1000000)
+        yield f"Contact {index}", rng.choice(formats).format(prefix, number)
+
+def timed(label, function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed:8.2f} s   {result}")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bulk contact import into contacts.db")
+    parser.add_argument('--count', type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_connection = database.connect(os.path.join(tmp_dir, 'contacts.db'))
+        elapsed = timed(f"import {args.count} contacts", import_contacts, db_connection, synthetic_contacts(args.count))
+        print(f"{'':<28} {args.count / elapsed:8.0f} contacts/s")
+        # A re-login re-imports the same address book; nothing may be duplicated
+        timed("re-import (all conflicts)", import_contacts, db_connection, synthetic_contacts(args.count, seed=1))
+        rows = db_connection.execute("SELECT COUNT(*) FROM contacts").fetchone()[0]
+        assert rows == args.count, rows
+        db_connection.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+import time
+import argparse
+
+from dispatch import Dispatcher, RateLimiter
+from faketransport import FakeTransport
+
+def run_once(count, concurrency, latency):
+    """ Send `count` messages through a fake transport and return messages per second """
+    transport = FakeTransport(latency=latency, workers=concurrency)
+    dispatcher = Dispatcher(transport, max_in_flight=concurrency, limiter=RateLimiter(None, None))
+    items = ((index, f"2547{index:08d}@c.us", "Hello World") for index in range(count))
+    start = time.perf_counter()
+    stats = dispatcher.run(items)
+    elapsed = time.perf_counter() - start
+    transport.close()
+    assert stats['sent'] == count, stats
+    return count / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the dispatcher against a fake transport")
+    parser.add_argument('--count', type=int, default=1000, help="messages per run")
+    parser.add_argument('--latency', type=float, default=0.01, help="simulated seconds per send")
+    parser.add_argument('--levels', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32, 64])
+    args = parser.parse_args()
+
+    print(f"{args.count} messages, {args.latency * 1000:.0f} ms simulated latency")
+    print(f"{'in flight':>10} {'msg/s':>10}")
+    for concurrency in args.levels:
+        rate = run_once(args.count, concurrency, args.latency)
+        print(f"{concurrency:>10} {rate:>10.1f}")
+
+if __name__ == '__main__':
+    main()
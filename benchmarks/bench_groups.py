@@ -0,0 +1,41 @@
+import os
+import time
+import argparse
+import tempfile
+
+import database
+import groupmanager
+from contactsync import import_contacts
+
+def timed(label, function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    print(f"{label:<40} {time.perf_counter() - start:8.3f} s")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bulk group creation and set operations")
+    parser.add_argument('--members', type=int, default=100000)
+    args = parser.parse_args()
+    count = args.members
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_connection = database.connect(os.path.join(tmp_dir, 'contacts.db'))
+        import_contacts(db_connection, ((f"Contact {index}", f"2547{index:08d}") for index in range(count * 2)))
+        contact_ids = [row[0] for row in db_connection.execute("SELECT id FROM contacts ORDER BY id")]
+
+        first = timed(f"create group, {count} contact IDs", groupmanager.create_group,
+                      db_connection, 'First', contact_ids[:count])
+        second = timed(f"create group, {count} phone numbers", groupmanager.create_group_from_phones,
+                       db_connection, 'Second', [f"07{index:08d}" for index in range(count // 2, count // 2 + count)])
+        timed("create group, country code filter", groupmanager.create_group_from_filter,
+              db_connection, 'Kenya', None, '254')
+        for operation in ('union', 'intersection', 'difference'):
+            timed(f"create group, {operation}", groupmanager.create_group_from_set_operation,
+                  db_connection, operation, operation, [first, second])
+        timed(f"add {count} members", groupmanager.add_members, db_connection, first, contact_ids[count:])
+        timed(f"remove {count} members", groupmanager.remove_members, db_connection, first, contact_ids[count:])
+        db_connection.close()
+
+if __name__ == '__main__':
+    main()
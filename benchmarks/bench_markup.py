@@ -0,0 +1,41 @@
+import time
+import argparse
+
+import whatsappmarkup
+
+PARAGRAPH = ("<p>Dear <strong>customer</strong>, our <em>new branch</em> opens on "
+             "<s>Monday</s> <strong>Tuesday</strong> &amp; we would love to see you.</p>")
+LIST = "<ul><li>Free <strong>delivery</strong></li><li>10% off</li><li>Open <em>late</em></li></ul>"
+
+def build_document(blocks):
+    return ''.join(PARAGRAPH if index % 3 else LIST for index in range(blocks))
+
+def timed(label, function, html, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function(html)
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{label:<40} {elapsed * 1000:10.2f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HTML to WhatsApp markup conversion")
+    parser.add_argument('--blocks', type=int, default=5000, help="paragraphs and lists in the document")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    html = build_document(args.blocks)
+    print(f"document size: {len(html) / 1024:.0f} KiB")
+
+    timed("streaming converter (uncached)", whatsappmarkup.convert, html, args.repeat)
+    whatsappmarkup.html_to_whatsapp(html)
+    timed("streaming converter (cached)", whatsappmarkup.html_to_whatsapp, html, args.repeat)
+    try:
+        import bs4
+    except ImportError:
+        print("BeautifulSoup get_text: skipped, bs4 is not installed")
+        return
+    timed("BeautifulSoup get_text", lambda content: bs4.BeautifulSoup(content, 'html.parser').get_text().strip(),
+          html, args.repeat)
+
+if __name__ == '__main__':
+    main()
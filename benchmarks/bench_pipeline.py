@@ -0,0 +1,196 @@
+""" End-to-end load test: contacts.db through queueing, validation and dispatch to progress reporting.
+
+Each campaign size runs in fresh processes against the simulator, one to
+build its database and one to send, so peak RSS is the send path's alone.
+For CI, save a run with --json and compare later runs against it:
+
+    python -m benchmarks.bench_pipeline --sizes 1000 100000 --json baseline.json
+    python -m benchmarks.bench_pipeline --sizes 1000 100000 --baseline baseline.json --tolerance 0.25
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def prepare(db_path, count, unregistered):
+    """ Build a database with one group of `count` contacts, every `unregistered`-th not on WhatsApp """
+    import database
+    import groupmanager
+    from contactsync import import_contacts
+
+    def contacts():
+        for index in range(count):
+            prefix = '999' if unregistered and index % unregistered == 0 else '2547'
+            yield f"Contact {index}", f"{prefix}{index:08d}"
+
+    db_connection = database.connect(db_path)
+    import_contacts(db_connection, contacts())
+    groupmanager.create_group_from_filter(db_connection, 'Everyone')
+    db_connection.close()
+
+def run(db_path, args):
+    """ Queue and send one campaign to the database's group; returns the measurements """
+    import database
+    import metrics
+    from campaign import run_campaign
+    from dispatch import Dispatcher, RateLimiter
+    from progress import ProgressAggregator, ThrottledReporter
+    from retry import RetryPolicy
+    from sendqueue import SendQueue
+    from senderclient import SenderClient
+    from simulator import SimulatedTransport
+
+    db_connection = database.connect(db_path)
+    group_id = db_connection.execute("SELECT id FROM groups").fetchone()[0]
+    queue = SendQueue(db_connection)
+    started = time.perf_counter()
+    job_id = queue.create_job(group_id, "Hello {name}, our offer ends on Friday.")
+    queued = time.perf_counter() - started
+    total = sum(queue.counts(job_id).values())
+
+    simulation = dict(latency=args.latency, jitter=args.jitter, workers=args.workers, failure_rate=args.failure_rate,
+                      permanent_rate=args.permanent_rate, throttle_rate=args.throttle_rate, check_latency=0.0)
+    if args.service:
+        options = [f"--{name.replace('_', '-')}={value}" for name, value in simulation.items()]
+        transport = SenderClient(command=[sys.executable, '-m', 'simulator', *options])
+        transport.wait_ready(30)
+    else:
+        transport = SimulatedTransport(record=False, **simulation)
+
+    snapshots = []
+    aggregator = ProgressAggregator(total)
+    reporter = ThrottledReporter(aggregator, snapshots.append)
+    campaign_metrics = metrics.Metrics()
+    # No pacing: the point is how fast the pipeline itself goes
+    dispatcher = Dispatcher(transport, max_in_flight=args.in_flight, limiter=RateLimiter(0, 0),
+                            metrics=campaign_metrics, retry_policy=RetryPolicy(base_delay=0.01))
+    started = time.perf_counter()
+    stats = run_campaign(db_connection, job_id, transport, dispatcher=dispatcher,
+                         on_event=lambda item_id, event: reporter.feed(event),
+                         metrics=campaign_metrics)
+    reporter.flush()
+    elapsed = time.perf_counter() - started
+    transport.stop()
+    db_connection.close()
+
+    stages = campaign_metrics.report()['stages']
+    round_trip = stages.get('round_trip', {})
+    return {
+        'recipients': total,
+        'sent': stats['sent'],
+        'failed': stats['failed'],
+        'retried': stats['retried'],
+        'skipped': stats['skipped'],
+        'queue_s': round(queued, 3),
+        'send_s': round(elapsed, 3),
+        'throughput_per_s': round(total / elapsed, 1),
+        'p50_ms': round_trip.get('p50_ms'),
+        'p95_ms': round_trip.get('p95_ms'),
+        'p99_ms': round_trip.get('p99_ms'),
+        'progress_reports': len(snapshots),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+def measure(count, args):
+    """ Run one campaign size in child processes and return its measurements """
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'contacts.db')
+        command = [sys.executable, '-m', 'benchmarks.bench_pipeline', '--db', db_path] + child_options(args)
+        subprocess.run(command + ['--prepare', str(count)], cwd=repo, check=True)
+        # Reports and the number cache land in the temporary directory, not the repository
+        output = subprocess.run(command + ['--run'], cwd=repo, check=True, stdout=subprocess.PIPE, text=True,
+                                env=dict(os.environ, PYTHONPATH=repo)).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def child_options(args):
+    options = ['--latency', str(args.latency), '--jitter', str(args.jitter), '--workers', str(args.workers),
+               '--in-flight', str(args.in_flight), '--failure-rate', str(args.failure_rate),
+               '--permanent-rate', str(args.permanent_rate), '--throttle-rate', str(args.throttle_rate),
+               '--unregistered', str(args.unregistered)]
+    return options + (['--service'] if args.service else [])
+
+def regressions(results, baseline, tolerance):
+    """ Return descriptions of the sizes that got slower or bigger than the baseline allows """
+    problems = []
+    previous = {entry['recipients']: entry for entry in baseline['results']}
+    for result in results:
+        before = previous.get(result['recipients'])
+        if before is None:
+            continue
+        if result['throughput_per_s'] < before['throughput_per_s'] * (1 - tolerance):
+            problems.append(f"{result['recipients']:,} recipients: throughput {result['throughput_per_s']:,.0f}/s, "
+                            f"baseline {before['throughput_per_s']:,.0f}/s")
+        if result['peak_rss_mb'] and before['peak_rss_mb'] and \
+                result['peak_rss_mb'] > before['peak_rss_mb'] * (1 + tolerance):
+            problems.append(f"{result['recipients']:,} recipients: peak RSS {result['peak_rss_mb']} MB, "
+                            f"baseline {before['peak_rss_mb']} MB")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark whole campaigns against the simulated sender service")
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help="recipients per campaign")
+    parser.add_argument('--latency', type=float, default=0.0, help="simulated seconds per send")
+    parser.add_argument('--jitter', type=float, default=0.5, help="log-normal sigma of the simulated latency")
+    parser.add_argument('--workers', type=int, default=0, help="sends the simulator handles at once, 0 for no limit")
+    parser.add_argument('--in-flight', type=int, default=64, help="the dispatcher's sends in flight")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="transient failures, retried")
+    parser.add_argument('--permanent-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--unregistered', type=int, default=0, help="make every Nth number not on WhatsApp")
+    parser.add_argument('--service', action='store_true',
+                        help="run the simulator as a separate process behind SenderClient, like the real service")
+    parser.add_argument('--json', help="write the results to this file")
+    parser.add_argument('--baseline', help="results from an earlier --json run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed regression, as a fraction")
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    parser.add_argument('--prepare', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--run', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.prepare is not None:
+        prepare(args.db, args.prepare, args.unregistered)
+        return 0
+    if args.run:
+        os.chdir(os.path.dirname(args.db))
+        print(json.dumps(run(args.db, args)))
+        return 0
+
+    print(f"{'recipients':>10} {'queue s':>8} {'send s':>8} {'msg/s':>9} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'failed':>7} {'peak MB':>8}")
+    results = []
+    for count in args.sizes:
+        result = measure(count, args)
+        results.append(result)
+        print(f"{result['recipients']:>10,} {result['queue_s']:>8.2f} {result['send_s']:>8.2f} "
+              f"{result['throughput_per_s']:>9,.0f} {result['p50_ms'] or 0:>8.2f} {result['p95_ms'] or 0:>8.2f} "
+              f"{result['p99_ms'] or 0:>8.2f} {result['failed'] + result['skipped']:>7,} "
+              f"{result['peak_rss_mb'] or 0:>8.1f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump({'options': child_options(args), 'results': results}, file, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            problems = regressions(results, json.load(file), args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        return 1 if problems else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
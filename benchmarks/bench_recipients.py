@@ -0,0 +1,74 @@
+import os
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+import database
+import groupmanager
+from campaign import to_chat_id
+from contactsync import import_contacts
+from sendqueue import SendQueue
+from suppression import SuppressionList
+from templating import render_stream
+
+MESSAGE = "Our offer ends on Friday."
+
+def legacy(db_connection, group_id, message):
+    """ The original path: every phone fetched into a list, then a chat ID list and one JSON blob """
+    cursor = db_connection.execute("""
+        SELECT contacts.phone FROM contacts
+        INNER JOIN group_contacts ON contacts.id = group_contacts.contact_id
+        WHERE group_contacts.group_id = ?
+    """, (group_id,))
+    contacts = [row[0] for row in cursor.fetchall()]
+    chat_ids = [f"{phone}@c.us" for phone in contacts]
+    payload = json.dumps({'contacts': chat_ids, 'message': message})
+    return len(chat_ids) if payload else 0
+
+def streaming(db_connection, group_id, message):
+    """ The current path: recipients checked, queued in SQL and rendered chunk by chunk, as run_campaign does """
+    suppressions = SuppressionList(db_connection)
+    if next(suppressions.filter(groupmanager.iter_group_phones(db_connection, group_id), group_id), None) is None:
+        return 0
+    queue = SendQueue(db_connection)
+    job_id = queue.create_job(group_id, message)
+    count = 0
+    for _, phone, _ in render_stream(db_connection, message, queue.pending_items(job_id)):
+        to_chat_id(phone)
+        count += 1
+    return count
+
+def measure(label, function, *args):
+    start = time.perf_counter()
+    count = function(*args)
+    elapsed = time.perf_counter() - start
+    # Run again to measure memory, since tracing allocations slows the run down
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"  {label:<10} {elapsed:7.3f} s  {count / elapsed:>10,.0f} recipients/s  peak {peak / 1e6:7.1f} MB")
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark preparing a group's recipients for sending")
+    parser.add_argument('--members', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--personalised', action='store_true',
+                        help="use a template with the contact's name, rendered for every recipient")
+    args = parser.parse_args()
+    message = "Hello {name}, " + MESSAGE if args.personalised else MESSAGE
+
+    for count in args.members:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_connection = database.connect(os.path.join(tmp_dir, 'contacts.db'))
+            import_contacts(db_connection, ((f"Contact {index}", f"2547{index:08d}") for index in range(count)))
+            group_id = groupmanager.create_group_from_filter(db_connection, 'Everyone', None, '254')
+            print(f"{count:,} members")
+            expected = measure('legacy', legacy, db_connection, group_id, message)
+            assert measure('streaming', streaming, db_connection, group_id, message) == expected
+            db_connection.close()
+
+if __name__ == '__main__':
+    main()
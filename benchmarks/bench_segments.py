@@ -0,0 +1,49 @@
+import os
+import time
+import random
+import argparse
+import tempfile
+
+import database
+import groupmanager
+import segments
+from contactsync import import_contacts
+from sendqueue import SendQueue
+
+def timed(label, function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    print(f"{label:<40} {time.perf_counter() - start:8.3f} s  {result:>12,}")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark counting and queueing campaigns to many overlapping groups")
+    parser.add_argument('--contacts', type=int, default=500_000)
+    parser.add_argument('--groups', type=int, default=30)
+    parser.add_argument('--members', type=int, default=50_000, help="members per group")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_connection = database.connect(os.path.join(tmp_dir, 'contacts.db'))
+        import_contacts(db_connection, ((f"Contact {index}", f"2547{index:08d}") for index in range(args.contacts)))
+        # Groups are random ranges of contacts, so they overlap like real audiences do
+        rng = random.Random(1)
+        group_ids = []
+        for index in range(args.groups):
+            start = rng.randrange(1, max(2, args.contacts - args.members))
+            group_ids.append(groupmanager.create_group(db_connection, f"Group {index}",
+                                                       range(start, start + args.members)))
+        print(f"{args.groups} groups of {args.members:,} members from {args.contacts:,} contacts")
+
+        counter = segments.RecipientCounter(db_connection)
+        timed("summed member counts", segments.member_total, db_connection, group_ids)
+        timed("deduplicated count", counter.count, group_ids)
+        timed("deduplicated count, cached", counter.count, group_ids)
+        timed("deduplicated count, one group", counter.count, group_ids[:1])
+        queue = SendQueue(db_connection)
+        queued = timed("queue the campaign", lambda: sum(queue.counts(queue.create_job(group_ids, "Hi")).values()))
+        assert queued == counter.count(group_ids)
+        db_connection.close()
+
+if __name__ == '__main__':
+    main()
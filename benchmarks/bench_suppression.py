@@ -0,0 +1,53 @@
+import os
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+import database
+from suppression import SuppressionList
+
+def recipients(count):
+    return (f"2547{index:08d}" for index in range(count))
+
+def run(db_connection, count, bloom_threshold):
+    start = time.perf_counter()
+    suppressions = SuppressionList(db_connection, bloom_threshold=bloom_threshold)
+    load = time.perf_counter() - start
+    # Loaded again to measure memory, since tracing allocations slows the load down
+    tracemalloc.start()
+    measured = SuppressionList(db_connection, bloom_threshold=bloom_threshold)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del measured
+
+    start = time.perf_counter()
+    kept = sum(1 for _ in suppressions.filter(recipients(count)))
+    elapsed = time.perf_counter() - start
+    kind = 'bloom filter' if suppressions.uses_bloom_filter else 'set'
+    print(f"{kind:<14} load {load:6.3f} s  {memory / 1e6:6.1f} MB  "
+          f"filter {elapsed:6.3f} s  {count / elapsed:>10,.0f} recipients/s  kept {kept:,}")
+    return kept
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark filtering recipients against the suppression list")
+    parser.add_argument('--recipients', type=int, default=1_000_000)
+    parser.add_argument('--suppressed', type=int, default=100_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_connection = database.connect(os.path.join(tmp_dir, 'contacts.db'))
+        # Every tenth recipient is suppressed, plus numbers that are not recipients at all
+        step = max(1, args.recipients // args.suppressed)
+        with db_connection:
+            db_connection.executemany(
+                "INSERT INTO suppressions (phone, group_id, kind) VALUES (?, 0, 'opt_out')",
+                ((f"2547{index:08d}",) for index in range(0, step * args.suppressed, step))
+            )
+        print(f"{args.recipients:,} recipients against {args.suppressed:,} suppressed numbers")
+        expected = run(db_connection, args.recipients, bloom_threshold=args.suppressed)
+        assert run(db_connection, args.recipients, bloom_threshold=0) == expected
+        db_connection.close()
+
+if __name__ == '__main__':
+    main()
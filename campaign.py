@@ -0,0 +1,137 @@
+import time
+import logging
+from dispatch import Dispatcher
+from sendqueue import SendQueue
+from progress import is_sent, RETRIED
+from templating import render_stream
+from mediacache import MediaCache
+from scheduler import window_limiter
+from validation import validate_job
+from suppression import SuppressionList, SUPPRESSED
+from senderpool import get_sender_transport
+from receipts import get_receipt_writer
+
+# Sends are queued by the service until its session is up; stop waiting to time it after this long
+SESSION_START_TIMEOUT = 120
+
+def to_chat_id(phone):
+    """ Return the WhatsApp chat ID for a stored phone number """
+    return phone if phone.endswith('@c.us') else f"{phone}@c.us"
+
+def start_transport(db_path, transport=None, metrics=None, timeout=SESSION_START_TIMEOUT):
+    """ Return the configured sender transport once its session is up, with receipts recorded in `db_path`.
+
+    The service is started once and reused, so only the first campaign waits
+    for the session. Pass `transport` to use another one, e.g. a fake.
+    """
+    started = time.perf_counter()
+    transport = transport or get_sender_transport()
+    if hasattr(transport, 'wait_ready') and not transport.wait_ready(timeout):
+        logging.warning(f'Sender session not ready after {timeout}s; sends stay queued until it is')
+    if metrics is not None:
+        metrics.observe('session_start', time.perf_counter() - started)
+    if hasattr(transport, 'add_receipt_listener'):
+        transport.add_receipt_listener(get_receipt_writer(db_path).record)
+    return transport
+
+def run_campaign(db_connection, job_id, transport, dispatcher=None, on_event=None, metrics=None, validate=True,
+                 retry_policy=None):
+    """ Send every pending item of a queued job and record each result.
+
+    Safe to call again on an interrupted job: only items still pending are
+    sent. `on_event(item_id, event)` receives every sent, failed and retried
+    event. `metrics` (a metrics.Metrics) collects stage timings for the
+    campaign report. With `validate`, recipients with malformed numbers or
+    without WhatsApp are skipped before sending (see validation.py) and
+    reported as failed events, as are suppressed numbers (see
+    suppression.py). Transient failures are retried with `retry_policy`'s
+    backoff and final failures kept as dead letters (see retry.py). Returns
+    the dispatcher's counts of sent, failed and retried messages, plus the
+    number of skipped recipients.
+    """
+    queue = SendQueue(db_connection)
+    job = queue.job(job_id)
+    if job is None:
+        raise ValueError(f"No send job with ID {job_id}")
+    skipped = 0
+    if validate:
+        def skip(item_id, phone, reason):
+            if on_event is not None:
+                on_event(item_id, {'event': 'failed', 'to': phone, 'error': reason, 'skipped': True})
+        started = time.perf_counter()
+        checked = validate_job(db_connection, job_id, transport, on_skip=skip, metrics=metrics)
+        skipped = checked['malformed'] + checked['unregistered']
+        if metrics is not None:
+            metrics.observe('validate', time.perf_counter() - started)
+            metrics.count('messages', skipped, result='skipped')
+    if dispatcher is None:
+        # Jobs with a delivery window are paced to finish when the window ends
+        limiter = window_limiter(job, queue.counts(job_id).get('pending', 0))
+        if hasattr(transport, 'create_dispatcher'):
+            # A sender pool sizes the dispatcher for all of its sessions
+            dispatcher = transport.create_dispatcher(limiter=limiter, metrics=metrics, retry_policy=retry_policy)
+        else:
+            dispatcher = Dispatcher(transport, limiter=limiter, metrics=metrics, retry_policy=retry_policy)
+    metrics = metrics or dispatcher.metrics
+    # Looked up once; the same payload goes with every recipient's message
+    media = MediaCache(db_connection).descriptor(job['media_sha256']) if job['media_sha256'] else None
+
+    suppressions = SuppressionList(db_connection)
+    group_ids = queue.job_groups(job_id)
+
+    def skip_item(item_id, phone):
+        nonlocal skipped
+        skipped += 1
+        if metrics is not None:
+            metrics.count('messages', result='skipped')
+        if on_event is not None:
+            on_event(item_id, {'event': 'failed', 'to': phone, 'error': SUPPRESSED, 'skipped': True})
+
+    def unsuppressed(rows):
+        # Catches numbers suppressed after the job was queued, before they are rendered
+        for row in rows:
+            if suppressions.is_suppressed_recipient(row[1], row[2], group_ids):
+                queue.skip(row[0], SUPPRESSED)
+                skip_item(row[0], row[1])
+            else:
+                yield row
+
+    def items():
+        # The job's message is a template, rendered per recipient as items are pulled
+        rendered = render_stream(db_connection, job['message'], unsuppressed(queue.pending_items(job_id)))
+        while True:
+            started = time.perf_counter()
+            item = next(rendered, None)
+            if item is None:
+                return
+            item_id, phone, message = item
+            # Results arrive on other threads; write them from this one
+            if queue.flush_if_due():
+                queue.update_stats(job_id)
+            if not queue.is_pending(item_id):
+                # Suppressed since its chunk was read, by SuppressionList.add() on another connection
+                skip_item(item_id, phone)
+                continue
+            if metrics is not None:
+                metrics.observe('prepare', time.perf_counter() - started)
+            yield item_id, to_chat_id(phone), message, media
+
+    def record(item_id, event):
+        if event.get('event') != RETRIED:
+            queue.record(item_id, is_sent(event), event.get('error'), event.get('message_id'), event.get('failure'),
+                         event['attempts'])
+        if on_event is not None:
+            on_event(item_id, event)
+
+    queue.set_job_status(job_id, 'running')
+    try:
+        stats = dispatcher.run(items(), record)
+    finally:
+        queue.flush()
+        queue.update_stats(job_id)
+    stats['skipped'] = skipped
+
+    # A cancelled job stays 'running' so it can be resumed later
+    if not queue.counts(job_id).get('pending'):
+        queue.set_job_status(job_id, 'completed')
+    return stats
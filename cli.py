@@ -0,0 +1,339 @@
+""" Command-line interface for running campaigns without the desktop app.
+
+Shares the GUI's core modules but never imports Qt, so it starts quickly and
+runs from cron or on a server. Results are written to stdout as JSON lines:
+
+    python cli.py import contacts.csv
+    python cli.py groups create Customers --csv customers.csv
+    python cli.py suppress add 254712345678 --kind opt_out
+    python cli.py queue 3 --message-file offer.txt --attach flyer.pdf
+    python cli.py queue 3 5 8 --message "Hi {name}"      # each contact once
+    python cli.py send 12 | jq -c 'select(.type == "progress")'
+    python cli.py send --due          # e.g. every minute from cron
+    python cli.py retry 12 && python cli.py send 12
+"""
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from datetime import datetime
+import database
+import groupmanager
+import segments
+import metrics
+from contactsync import import_contacts, read_csv, DEFAULT_COUNTRY_CODE
+from sendqueue import SendQueue
+from senderclient import SenderClient
+from mediacache import MediaCache
+from scheduler import Scheduler
+from campaign import run_campaign, start_transport
+from progress import ProgressAggregator, ThrottledReporter
+from receipts import campaign_stats
+from suppression import SuppressionList, OPT_OUT, BLOCKED, EXCLUDED
+from retry import DeadLetters, TRANSIENT, RATE_LIMITED, PERMANENT
+from whatsappmarkup import html_to_whatsapp
+
+# Job statuses after which `watch` stops
+FINAL_STATUSES = ('completed', 'cancelled')
+
+_output_lock = threading.Lock()
+
+def emit(kind, **fields):
+    """ Write one JSON line; events come from the dispatcher's threads, so lines are written whole """
+    line = json.dumps(dict(type=kind, **fields))
+    with _output_lock:
+        sys.stdout.write(line + '\n')
+        sys.stdout.flush()
+
+def parse_time(text):
+    """ Parse an ISO 8601 local time such as '2024-05-01 09:30' into a Unix timestamp """
+    try:
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not an ISO 8601 time: {text!r}")
+
+def read_message(args):
+    if args.message_file:
+        with open(args.message_file, 'r', encoding='utf-8') as file:
+            message = file.read()
+    else:
+        message = args.message or ''
+    # Same conversion as the editor's HTML in the send screen
+    return html_to_whatsapp(message) if args.html else message.strip()
+
+def command_import(db_connection, args):
+    result = import_contacts(db_connection, read_csv(args.csv), args.country_code)
+    emit('imported', **result)
+
+def command_groups(db_connection, args):
+    if args.action == 'list':
+        cursor = db_connection.execute("SELECT id, name, member_count FROM groups ORDER BY id")
+        for group_id, name, member_count in cursor:
+            emit('group', id=group_id, name=name, members=member_count)
+    elif args.action == 'create':
+        filtered = args.name_prefix or args.phone_prefix
+        if bool(args.csv or args.phones) == bool(filtered):
+            raise ValueError("Create a group from one of --csv, --phones, or --name-prefix and/or --phone-prefix.")
+        if args.csv:
+            group_id = groupmanager.create_group_from_csv(db_connection, args.name, args.csv, args.country_code)
+        elif args.phones:
+            group_id = groupmanager.create_group_from_phones(db_connection, args.name, args.phones,
+                                                             args.country_code)
+        else:
+            group_id = groupmanager.create_group_from_filter(db_connection, args.name, args.name_prefix,
+                                                             args.phone_prefix)
+        members = db_connection.execute("SELECT member_count FROM groups WHERE id = ?", (group_id,)).fetchone()[0]
+        emit('group', id=group_id, name=args.name, members=members)
+    elif args.action == 'delete':
+        groupmanager.delete_group(db_connection, args.group_id)
+        emit('deleted', id=args.group_id)
+
+def command_suppress(db_connection, args):
+    suppressions = SuppressionList(db_connection)
+    if args.action == 'list':
+        for phone, group_id, kind, created_at in suppressions.entries(args.group):
+            emit('suppression', phone=phone, group_id=group_id or None, kind=kind, created_at=created_at)
+        return
+    phones = list(args.phones)
+    if args.csv:
+        phones.extend(phone for _, phone in read_csv(args.csv))
+    if args.action == 'add':
+        skipped = suppressions.add(phones, args.kind, args.group)
+        emit('suppressed', count=len(phones), group_id=args.group, skipped_items=skipped)
+    else:
+        emit('unsuppressed', count=suppressions.remove(phones, args.group), group_id=args.group)
+
+def command_segments(db_connection, args):
+    if args.action == 'list':
+        for segment_id, name, group_ids in segments.list_segments(db_connection):
+            emit('segment', id=segment_id, name=name, groups=group_ids)
+    elif args.action == 'create':
+        segment_id = segments.create_segment(db_connection, args.name, args.group_ids)
+        emit('segment', id=segment_id, name=args.name, groups=args.group_ids,
+             recipients=segments.count_recipients(db_connection, args.group_ids))
+    elif args.action == 'delete':
+        segments.delete_segment(db_connection, args.segment_id)
+        emit('deleted', id=args.segment_id)
+    elif args.action == 'count':
+        group_ids = segments.segment_groups(db_connection, args.segment) if args.segment else args.group_ids
+        if not group_ids:
+            raise ValueError("Give group IDs or --segment.")
+        emit('count', groups=group_ids, members=segments.member_total(db_connection, group_ids),
+             recipients=segments.count_recipients(db_connection, group_ids))
+
+def command_queue(db_connection, args):
+    message = read_message(args)
+    if not message and not args.attach:
+        raise ValueError("Message content is empty.")
+    group_ids = segments.segment_groups(db_connection, args.segment) if args.segment else args.group_ids
+    if not group_ids:
+        raise ValueError("Give group IDs or --segment.")
+    media_sha256 = MediaCache(db_connection).add(args.attach) if args.attach else None
+    queue = SendQueue(db_connection)
+    job_id = queue.create_job(group_ids, message, media_sha256, args.segment)
+    if args.at is not None or args.until is not None:
+        start_at = args.at if args.at is not None else time.time()
+        try:
+            Scheduler(db_connection).schedule(job_id, start_at, args.until)
+        except ValueError:
+            queue.set_job_status(job_id, 'cancelled')
+            raise
+    job = queue.job(job_id)
+    emit('queued', job_id=job_id, status=job['status'], recipients=sum(queue.counts(job_id).values()),
+         scheduled_at=job['scheduled_at'], window_end=job['window_end'])
+
+def send_job(db_connection, job_id, transport, args):
+    """ Run one job, streaming progress snapshots (and every result with --events); returns its stats """
+    queue = SendQueue(db_connection)
+    if queue.job(job_id) is None:
+        raise ValueError(f"No send job with ID {job_id}")
+    counts = queue.counts(job_id)
+    total = sum(counts.values())
+    aggregator = ProgressAggregator(total, done=total - counts.get('pending', 0))
+    reporter = ThrottledReporter(aggregator, lambda snapshot: emit('progress', job_id=job_id, **snapshot),
+                                 interval=args.interval)
+    campaign_metrics = metrics.Metrics()
+
+    def on_event(item_id, event):
+        reporter.feed(event)
+        if args.events:
+            emit('event', job_id=job_id, item_id=item_id, **event)
+
+    emit('started', job_id=job_id, recipients=total, pending=counts.get('pending', 0))
+    stats = run_campaign(db_connection, job_id, transport, on_event=on_event, metrics=campaign_metrics,
+                         validate=not args.no_validate)
+    reporter.flush()
+    metrics.save_campaign(campaign_metrics, job_id, recipients=total, **stats)
+    emit('finished', job_id=job_id, report=metrics.report_path(job_id), **stats)
+    return stats
+
+def command_send(db_connection, args):
+    if args.due:
+        job_ids = Scheduler(db_connection).pop_due()
+    elif args.job_id is not None:
+        job_ids = [args.job_id]
+    else:
+        job_ids = SendQueue(db_connection).unfinished_jobs()
+    if not job_ids:
+        emit('idle')
+        return 0
+
+    transport = SenderClient(fake=True) if args.fake else None
+    transport = start_transport(database.database_path(db_connection), transport, timeout=args.timeout)
+    failed = 0
+    try:
+        for job_id in job_ids:
+            failed += send_job(db_connection, job_id, transport, args)['failed']
+    finally:
+        if args.fake:
+            transport.stop()
+    return 1 if failed else 0
+
+def command_retry(db_connection, args):
+    """ List a job's dead letters, or queue its failed recipients to be sent again """
+    dead_letters = DeadLetters(db_connection)
+    if args.list:
+        for item_id, phone, failure, error, attempts, created_at in dead_letters.entries(args.job_id):
+            emit('dead_letter', job_id=args.job_id, item_id=item_id, phone=phone, failure=failure, error=error,
+                 attempts=attempts, created_at=created_at)
+        return
+    if SendQueue(db_connection).job(args.job_id) is None:
+        raise ValueError(f"No send job with ID {args.job_id}")
+    counts = dead_letters.counts(args.job_id)
+    requeued = dead_letters.requeue(args.job_id, args.failure)
+    emit('requeued', job_id=args.job_id, count=requeued, dead_letters=counts)
+
+def command_watch(db_connection, args):
+    """ Print a job's progress from the database until it finishes, e.g. while the app or cron sends it """
+    queue = SendQueue(db_connection)
+    previous = None
+    while True:
+        job = queue.job(args.job_id)
+        if job is None:
+            raise ValueError(f"No send job with ID {args.job_id}")
+        counts = queue.counts(args.job_id)
+        snapshot = dict(job_id=args.job_id, status=job['status'], counts=counts,
+                        stats=campaign_stats(db_connection, args.job_id))
+        if snapshot != previous:
+            emit('status', **snapshot)
+            previous = snapshot
+        if job['status'] in FINAL_STATUSES or args.once:
+            return 0
+        time.sleep(args.interval)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Import contacts and run WhatsApp campaigns without the GUI. "
+                                                 "Output is one JSON object per line.")
+    parser.add_argument('--db', default=database.DEFAULT_DB_PATH, help="path to the contacts database")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = commands.add_parser('import', help="import contacts from a CSV with name and phone columns")
+    import_parser.add_argument('csv')
+    import_parser.add_argument('--country-code', default=DEFAULT_COUNTRY_CODE,
+                               help="for numbers written with a leading 0")
+
+    groups_parser = commands.add_parser('groups', help="list, create or delete groups")
+    group_actions = groups_parser.add_subparsers(dest='action', required=True)
+    group_actions.add_parser('list')
+    create_parser = group_actions.add_parser('create', help="from a CSV, a list of phones or a contact filter")
+    create_parser.add_argument('name')
+    source = create_parser.add_mutually_exclusive_group()
+    source.add_argument('--csv')
+    source.add_argument('--phones', nargs='+')
+    create_parser.add_argument('--name-prefix', help="contacts whose name starts with it")
+    create_parser.add_argument('--phone-prefix', help="contacts whose phone starts with it, e.g. a country code; "
+                                                      "with --name-prefix, contacts matching both")
+    create_parser.add_argument('--country-code', default=DEFAULT_COUNTRY_CODE)
+    delete_parser = group_actions.add_parser('delete')
+    delete_parser.add_argument('group_id', type=int)
+
+    suppress_parser = commands.add_parser('suppress', help="numbers never to message: opt-outs, blocklist, "
+                                                           "per-group exclusions")
+    suppress_actions = suppress_parser.add_subparsers(dest='action', required=True)
+    for action in ('add', 'remove'):
+        action_parser = suppress_actions.add_parser(action)
+        action_parser.add_argument('phones', nargs='*')
+        action_parser.add_argument('--csv', help="also the numbers in this CSV's phone column")
+        action_parser.add_argument('--group', type=int, help="only for this group instead of every group")
+        if action == 'add':
+            action_parser.add_argument('--kind', choices=[OPT_OUT, BLOCKED, EXCLUDED],
+                                       help="defaults to excluded with --group, else opt_out")
+    list_parser = suppress_actions.add_parser('list')
+    list_parser.add_argument('--group', type=int, help="only this group's exclusions (0 for global entries)")
+
+    segments_parser = commands.add_parser('segments', help="saved combinations of groups")
+    segment_actions = segments_parser.add_subparsers(dest='action', required=True)
+    segment_actions.add_parser('list')
+    create_segment_parser = segment_actions.add_parser('create')
+    create_segment_parser.add_argument('name')
+    create_segment_parser.add_argument('group_ids', type=int, nargs='+')
+    delete_segment_parser = segment_actions.add_parser('delete')
+    delete_segment_parser.add_argument('segment_id', type=int)
+    count_parser = segment_actions.add_parser('count', help="recipients of some groups, each contact counted once")
+    count_parser.add_argument('group_ids', type=int, nargs='*')
+    count_parser.add_argument('--segment', type=int)
+
+    queue_parser = commands.add_parser('queue', help="queue a campaign for one or more groups")
+    queue_parser.add_argument('group_ids', type=int, nargs='*', help="contacts in several groups get one message")
+    queue_parser.add_argument('--segment', type=int, help="the groups of this saved segment")
+    message = queue_parser.add_mutually_exclusive_group()
+    message.add_argument('--message')
+    message.add_argument('--message-file')
+    queue_parser.add_argument('--html', action='store_true', help="convert the message from HTML")
+    queue_parser.add_argument('--attach', help="file sent with the message as its caption")
+    queue_parser.add_argument('--at', type=parse_time, help="start time, e.g. 2024-05-01T09:00")
+    queue_parser.add_argument('--until', type=parse_time, help="spread the sends evenly until this time")
+
+    send_parser = commands.add_parser('send', help="send a queued job, the jobs that are due, or unfinished jobs")
+    target = send_parser.add_mutually_exclusive_group()
+    target.add_argument('job_id', type=int, nargs='?')
+    target.add_argument('--due', action='store_true', help="send scheduled jobs whose time has come")
+    send_parser.add_argument('--events', action='store_true', help="also print every sent and failed message")
+    send_parser.add_argument('--interval', type=float, default=1.0, help="seconds between progress lines")
+    send_parser.add_argument('--timeout', type=float, default=120, help="seconds to wait for the session")
+    send_parser.add_argument('--no-validate', action='store_true', help="skip the number checks before sending")
+    send_parser.add_argument('--fake', action='store_true', help="use the sender service's fake client")
+
+    retry_parser = commands.add_parser('retry', help="queue a job's failed recipients again; then send the job")
+    retry_parser.add_argument('job_id', type=int)
+    retry_parser.add_argument('--failure', action='append', choices=[TRANSIENT, RATE_LIMITED, PERMANENT, 'unknown'],
+                              help="only failures of this kind; may be repeated")
+    retry_parser.add_argument('--list', action='store_true', help="print the failed recipients instead")
+
+    watch_parser = commands.add_parser('watch', help="follow a job's progress until it finishes")
+    watch_parser.add_argument('job_id', type=int)
+    watch_parser.add_argument('--interval', type=float, default=2.0)
+    watch_parser.add_argument('--once', action='store_true', help="print the current status and exit")
+    return parser
+
+COMMANDS = {
+    'import': command_import,
+    'groups': command_groups,
+    'suppress': command_suppress,
+    'segments': command_segments,
+    'queue': command_queue,
+    'send': command_send,
+    'retry': command_retry,
+    'watch': command_watch,
+}
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    db_connection = None
+    try:
+        db_connection = database.connect(args.db)
+        return COMMANDS[args.command](db_connection, args) or 0
+    except (ValueError, OSError, sqlite3.Error) as e:
+        emit('error', error=str(e))
+        return 1
+    except KeyboardInterrupt:
+        emit('error', error='interrupted')
+        return 130
+    finally:
+        if db_connection is not None:
+            db_connection.close()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+import csv
+import json
+import re
+
+DEFAULT_COUNTRY_CODE = '254'
+UNKNOWN = 'Unknown'
+
+_NON_DIGITS = re.compile(r'\D')
+
+def normalize_phone(raw, default_country_code=DEFAULT_COUNTRY_CODE):
+    """ Normalize a phone number to E.164 digits without the '+', or None if it is not a number.
+
+    '+254 712 345678', '00254712345678', '0712 345 678' and '254712345678@c.us'
+    all become '254712345678'. Numbers with a leading 0 are treated as national
+    numbers in `default_country_code`.
+    """
+    if raw is None:
+        return None
+    text = str(raw).strip()
+    if text.endswith('@c.us'):
+        text = text[:-len('@c.us')]
+    international = text.startswith('+')
+    digits = _NON_DIGITS.sub('', text)
+    if not digits:
+        return None
+    if not international:
+        if digits.startswith('00'):
+            digits = digits[2:]
+        elif digits.startswith('0'):
+            digits = default_country_code + digits[1:]
+    # E.164 allows at most 15 digits; anything under 8 cannot include a country code
+    if not 8 <= len(digits) <= 15 or digits.startswith('0'):
+        return None
+    return digits
+
+def import_contacts(db_connection, contacts, default_country_code=DEFAULT_COUNTRY_CODE):
+    """ Upsert (name, phone) pairs in a single transaction.
+
+    Phones are normalized first, so re-importing an address book never adds
+    duplicates; a known name replaces 'Unknown' or an older name. Returns
+    counts of imported and invalid entries.
+    """
+    rows = {}
+    invalid = 0
+    for name, phone in contacts:
+        phone = normalize_phone(phone, default_country_code)
+        if phone is None:
+            invalid += 1
+            continue
+        name = (name or '').strip() or UNKNOWN
+        if name != UNKNOWN or phone not in rows:
+            rows[phone] = name
+
+    with db_connection:
+        db_connection.executemany("""
+            INSERT INTO contacts (name, phone) VALUES (?, ?)
+            ON CONFLICT (phone) DO UPDATE SET name = excluded.name
+            WHERE excluded.name != 'Unknown' AND excluded.name IS NOT contacts.name
+        """, ((name, phone) for phone, name in rows.items()))
+    return {'imported': len(rows), 'invalid': invalid}
+
+def set_contact_fields(db_connection, rows):
+    """ Upsert custom template fields from (contact_id, key, value) rows in one transaction """
+    with db_connection:
+        db_connection.executemany("""
+            INSERT INTO contact_fields (contact_id, key, value) VALUES (?, ?, ?)
+            ON CONFLICT (contact_id, key) DO UPDATE SET value = excluded.value
+        """, rows)
+
+def read_csv(path):
+    """ Yield (name, phone) from a CSV file with 'name' and 'phone' (or 'number') columns """
+    with open(path, newline='', encoding='utf-8-sig') as csv_file:
+        reader = csv.DictReader(csv_file)
+        fields = {field.strip().lower(): field for field in reader.fieldnames or []}
+        phone_field = fields.get('phone') or fields.get('number')
+        if phone_field is None:
+            raise ValueError(f"{path} has no 'phone' or 'number' column")
+        name_field = fields.get('name')
+        for row in reader:
+            yield (row.get(name_field) if name_field else None), row.get(phone_field)
+
+def read_json(path):
+    """ Yield (name, phone) from a JSON list of objects with 'name' and 'phone' or 'number' """
+    with open(path, encoding='utf-8') as json_file:
+        for contact in json.load(json_file):
+            yield contact.get('name'), contact.get('phone') or contact.get('number')
+
+def deduplicate(db_connection, default_country_code=DEFAULT_COUNTRY_CODE):
+    """ Merge contacts that share a normalized phone and drop duplicate group memberships.
+
+    Used by the schema migration that adds the unique indexes; runs inside the
+    caller's transaction. Group memberships and queued sends are moved to the
+    surviving contact, and phones that are not numbers (e.g. 'Unknown') become NULL.
+    """
+    keep = {}
+    renames = {}
+    merged = []
+    updates = []
+    for contact_id, name, phone in db_connection.execute("SELECT id, name, phone FROM contacts ORDER BY id"):
+        normalized = normalize_phone(phone, default_country_code)
+        if normalized is None:
+            if phone is not None:
+                updates.append((None, contact_id))
+            continue
+        if normalized in keep:
+            kept_id, kept_name = keep[normalized]
+            merged.append((kept_id, contact_id))
+            if kept_name in (None, UNKNOWN) and name not in (None, UNKNOWN):
+                keep[normalized] = (kept_id, name)
+                renames[kept_id] = name
+            continue
+        keep[normalized] = (contact_id, name)
+        if normalized != phone:
+            updates.append((normalized, contact_id))
+
+    # Repoint references in set-based statements; a per-row UPDATE would scan group_contacts each time
+    db_connection.execute("CREATE TEMP TABLE contact_merges (old_id INTEGER PRIMARY KEY, new_id INTEGER)")
+    db_connection.executemany("INSERT INTO contact_merges (new_id, old_id) VALUES (?, ?)", merged)
+    for table in ('group_contacts', 'send_items'):
+        db_connection.execute(f"""
+            UPDATE {table} SET contact_id = (SELECT new_id FROM contact_merges WHERE old_id = contact_id)
+            WHERE contact_id IN (SELECT old_id FROM contact_merges)
+        """)
+    db_connection.execute("DELETE FROM contacts WHERE id IN (SELECT old_id FROM contact_merges)")
+    db_connection.execute("DROP TABLE contact_merges")
+    db_connection.executemany("UPDATE contacts SET phone = ? WHERE id = ?", updates)
+    db_connection.executemany(
+        "UPDATE contacts SET name = ? WHERE id = ?", ((name, contact_id) for contact_id, name in renames.items())
+    )
+    db_connection.execute("""
+        DELETE FROM group_contacts WHERE rowid NOT IN (
+            SELECT MIN(rowid) FROM group_contacts GROUP BY group_id, contact_id
+        )
+    """)
+    return len(merged)
@@ -1,17 +1,108 @@
 from PyQt5.QtWidgets import (
-    QDialog, QWidget, QVBoxLayout, QPushButton, QListWidget, QListWidgetItem, 
-    QLineEdit, QLabel, QDialogButtonBox, QMessageBox, QApplication  # Added QApplication here
+    QDialog, QWidget, QVBoxLayout, QPushButton, QListView,
+    QLineEdit, QLabel, QDialogButtonBox, QMessageBox, QApplication,  # Added QApplication here
+    QFileDialog, QInputDialog
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, QTimer
 import os
 import sys
 import sqlite3  # Assuming you're using SQLite for the database connection
+import database
+import groupmanager
 
 def resource_path(relative_path):
     """ Get absolute path to resource, works for PyInstaller """
     base_path = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
     return os.path.join(base_path, relative_path)
 
+def fts_query(text):
+    """ Turn search box text into an FTS5 prefix query, e.g. 'jo 2547' -> '"jo"* "2547"*' """
+    terms = text.replace('"', ' ').split()
+    return ' '.join(f'"{term}"*' for term in terms)
+
+class ContactListModel(QAbstractListModel):
+    """ Checkable contact list that reads from SQLite a page at a time.
+
+    Rows are only fetched as the view scrolls (canFetchMore/fetchMore), and
+    checked contacts are kept as a set of IDs, so neither opening the picker
+    nor reading the selection depends on the size of the address book.
+    """
+
+    def __init__(self, db_connection, page_size=200):
+        super().__init__()
+        self.db_connection = db_connection
+        self.page_size = page_size
+        self.checked_ids = set()
+        self.query = ''
+        self.rows = []
+        self.exhausted = False
+
+    def set_search(self, text):
+        """ Restart the list with only contacts whose name or phone matches `text` """
+        self.beginResetModel()
+        self.query = fts_query(text)
+        self.rows = []
+        self.exhausted = False
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self.exhausted:
+            return
+        last_id = self.rows[-1][0] if self.rows else 0
+        if self.query:
+            cursor = self.db_connection.execute("""
+                SELECT contacts.id, contacts.name, contacts.phone FROM contacts_fts
+                JOIN contacts ON contacts.id = contacts_fts.rowid
+                WHERE contacts_fts MATCH ? AND contacts_fts.rowid > ?
+                ORDER BY contacts_fts.rowid LIMIT ?
+            """, (self.query, last_id, self.page_size))
+        else:
+            cursor = self.db_connection.execute(
+                "SELECT id, name, phone FROM contacts WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, self.page_size)
+            )
+        page = cursor.fetchall()
+        if len(page) < self.page_size:
+            self.exhausted = True
+        if page:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(page) - 1)
+            self.rows.extend(page)
+            self.endInsertRows()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        contact_id, name, phone = self.rows[index.row()]
+        if role == Qt.DisplayRole:
+            return f"{name} ({phone})"
+        if role == Qt.CheckStateRole:
+            return Qt.Checked if contact_id in self.checked_ids else Qt.Unchecked
+        if role == Qt.UserRole:
+            return contact_id
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.CheckStateRole:
+            return False
+        contact_id = self.rows[index.row()][0]
+        if value == Qt.Checked:
+            self.checked_ids.add(contact_id)
+        else:
+            self.checked_ids.discard(contact_id)
+        self.dataChanged.emit(index, index, [Qt.CheckStateRole])
+        return True
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsUserCheckable
+
 class ContactSelectionWindow(QWidget):
     def __init__(self, db_connection):
         super().__init__()
@@ -22,8 +113,19 @@ class ContactSelectionWindow(QWidget):
         self.setWindowTitle('Select Contacts')
         self.layout = QVBoxLayout()
 
-        # List of contacts
-        self.contact_list = QListWidget()
+        # Search box, filtering as you type once typing pauses
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText('Search by name or phone')
+        self.search_timer = QTimer()
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(150)
+        self.search_timer.timeout.connect(self.apply_search)
+        self.search_edit.textChanged.connect(self.search_timer.start)
+        self.layout.addWidget(self.search_edit)
+
+        # List of contacts, loaded page by page as it scrolls
+        self.contact_list = QListView()
+        self.contact_list.setUniformItemSizes(True)
         self.populate_contacts()
         self.layout.addWidget(self.contact_list)
 
@@ -32,19 +134,25 @@ class ContactSelectionWindow(QWidget):
         self.create_group_button.clicked.connect(self.open_create_group_dialog)
         self.layout.addWidget(self.create_group_button)
 
+        # Button to create a group straight from a CSV of names and phone numbers
+        self.import_csv_button = QPushButton('Create Group from CSV')
+        self.import_csv_button.clicked.connect(self.create_group_from_csv)
+        self.layout.addWidget(self.import_csv_button)
+
         self.setLayout(self.layout)
         self.setGeometry(300, 300, 400, 300)
 
     def populate_contacts(self):
-        """ Populate contact list from the database """
-        cursor = self.db_connection.cursor()
-        cursor.execute("SELECT id, name, phone FROM contacts")
-        contacts = cursor.fetchall()
-        for contact in contacts:
-            item = QListWidgetItem(f"{contact[1]} ({contact[2]})")
-            item.setCheckState(Qt.Unchecked)
-            item.setData(Qt.UserRole, contact[0])  # Store contact ID in item
-            self.contact_list.addItem(item)
+        """ Attach the lazily loaded contact model to the list """
+        self.contact_model = ContactListModel(self.db_connection)
+        self.contact_list.setModel(self.contact_model)
+
+    def apply_search(self):
+        """ Filter the contact list through the full-text index """
+        try:
+            self.contact_model.set_search(self.search_edit.text())
+        except sqlite3.Error as e:
+            self.show_error_message(f"Search failed: {e}")
 
     def open_create_group_dialog(self):
         """ Open the dialog for creating a new group with selected contacts """
@@ -55,15 +163,28 @@ class ContactSelectionWindow(QWidget):
         dialog = CreateGroupDialog(self.db_connection, selected_contacts)
         dialog.exec_()
 
+    def create_group_from_csv(self):
+        """ Create a group from a CSV file with 'name' and 'phone' columns """
+        path, _ = QFileDialog.getOpenFileName(self, 'Select CSV File', '', 'CSV Files (*.csv)')
+        if not path:
+            return
+        group_name, ok = QInputDialog.getText(self, 'Create Group', 'Group Name:')
+        if not ok:
+            return
+        try:
+            groupmanager.create_group_from_csv(self.db_connection, group_name, path)
+        except (ValueError, OSError, sqlite3.Error) as e:
+            self.show_error_message(f"Failed to create group: {e}")
+            return
+        QMessageBox.information(self, 'Success', "Group created successfully!")
+
     def get_selected_contacts(self):
         """ Get the list of selected contacts' IDs """
-        selected_contacts = []
-        for index in range(self.contact_list.count()):
-            item = self.contact_list.item(index)
-            if item.checkState() == Qt.Checked:
-                contact_id = item.data(Qt.UserRole)
-                selected_contacts.append(contact_id)
-        return selected_contacts
+        return sorted(self.contact_model.checked_ids)
+
+    def refresh(self):
+        """ Re-run the current search so newly added contacts show up """
+        self.apply_search()
 
     def show_error_message(self, message):
         """ Show an error message dialog """
@@ -101,18 +222,12 @@ class CreateGroupDialog(QDialog):
             self.show_error_message("Group name cannot be empty.")
             return
 
-        # Insert group into the database
-        cursor = self.db_connection.cursor()
-        cursor.execute("INSERT INTO groups (name) VALUES (?)", (group_name,))
-        group_id = cursor.lastrowid
-
-        # Add selected contacts to the group
-        for contact_id in self.selected_contacts:
-            cursor.execute(
-                "INSERT INTO group_contacts (group_id, contact_id) VALUES (?, ?)",
-                (group_id, contact_id)
-            )
-        self.db_connection.commit()
+        # Insert the group and all its members in one transaction
+        try:
+            groupmanager.create_group(self.db_connection, group_name, self.selected_contacts)
+        except sqlite3.Error as e:
+            self.show_error_message(f"Database error: {e}")
+            return
 
         self.show_info_message("Group created successfully!")
         self.accept()
@@ -127,7 +242,7 @@ class CreateGroupDialog(QDialog):
 
 if __name__ == '__main__':
     # Establishing database connection (modify the path accordingly)
-    db_connection = sqlite3.connect(resource_path('contacts.db'))
+    db_connection = database.connect(resource_path('contacts.db'))
 
     app = QApplication(sys.argv)  # Make sure QApplication is defined
     window = ContactSelectionWindow(db_connection)
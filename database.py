@@ -0,0 +1,217 @@
+import sqlite3
+from contactsync import deduplicate
+
+DEFAULT_DB_PATH = 'contacts.db'
+
+# Schema migrations, applied in order and tracked with PRAGMA user_version.
+# A step is either an SQL script or a function taking the connection; its number
+# below is the user_version of a database that has run it.
+# Only ever append to this list: existing databases have already run the earlier steps.
+MIGRATIONS = [
+    # 1: tables originally created by qrcode.js
+    """
+    CREATE TABLE IF NOT EXISTS contacts (id INTEGER PRIMARY KEY, name TEXT, phone TEXT);
+    CREATE TABLE IF NOT EXISTS groups (id INTEGER PRIMARY KEY, name TEXT);
+    CREATE TABLE IF NOT EXISTS group_contacts (
+        group_id INTEGER, contact_id INTEGER,
+        FOREIGN KEY(group_id) REFERENCES groups(id), FOREIGN KEY(contact_id) REFERENCES contacts(id)
+    );
+    """,
+    # 2: durable send queue, one row per recipient
+    """
+    CREATE TABLE IF NOT EXISTS send_jobs (
+        id INTEGER PRIMARY KEY,
+        group_id INTEGER REFERENCES groups(id),
+        message TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE IF NOT EXISTS send_items (
+        id INTEGER PRIMARY KEY,
+        job_id INTEGER NOT NULL REFERENCES send_jobs(id),
+        contact_id INTEGER REFERENCES contacts(id),
+        phone TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT,
+        updated_at TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_send_items_job_status ON send_items (job_id, status, id);
+    CREATE INDEX IF NOT EXISTS idx_send_jobs_status ON send_jobs (status);
+    """,
+    # 3: merge duplicated contacts and memberships
+    deduplicate,
+    # 4: keep contacts and memberships unique
+    """
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_contacts_phone ON contacts (phone);
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_group_contacts_member ON group_contacts (group_id, contact_id);
+    CREATE INDEX IF NOT EXISTS idx_group_contacts_contact ON group_contacts (contact_id);
+    """,
+    # 5: full-text index on contact name and phone for the contact picker's search
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS contacts_fts USING fts5 (
+        name, phone, content='contacts', content_rowid='id'
+    );
+    INSERT INTO contacts_fts (contacts_fts) VALUES ('rebuild');
+    CREATE TRIGGER IF NOT EXISTS contacts_fts_insert AFTER INSERT ON contacts BEGIN
+        INSERT INTO contacts_fts (rowid, name, phone) VALUES (new.id, new.name, new.phone);
+    END;
+    CREATE TRIGGER IF NOT EXISTS contacts_fts_delete AFTER DELETE ON contacts BEGIN
+        INSERT INTO contacts_fts (contacts_fts, rowid, name, phone) VALUES ('delete', old.id, old.name, old.phone);
+    END;
+    CREATE TRIGGER IF NOT EXISTS contacts_fts_update AFTER UPDATE OF name, phone ON contacts BEGIN
+        INSERT INTO contacts_fts (contacts_fts, rowid, name, phone) VALUES ('delete', old.id, old.name, old.phone);
+        INSERT INTO contacts_fts (rowid, name, phone) VALUES (new.id, new.name, new.phone);
+    END;
+    """,
+    # 6: member count per group, refreshed by groupmanager so views never run COUNT(*)
+    """
+    ALTER TABLE groups ADD COLUMN member_count INTEGER NOT NULL DEFAULT 0;
+    UPDATE groups SET member_count = (SELECT COUNT(*) FROM group_contacts WHERE group_id = groups.id);
+    """,
+    # 7: custom per-contact fields for message templates, e.g. {company}
+    """
+    CREATE TABLE IF NOT EXISTS contact_fields (
+        contact_id INTEGER NOT NULL REFERENCES contacts(id),
+        key TEXT NOT NULL,
+        value TEXT,
+        PRIMARY KEY (contact_id, key)
+    ) WITHOUT ROWID;
+    """,
+    # 8: content-addressed attachments (see mediacache.py) and the attachment of each job
+    """
+    CREATE TABLE IF NOT EXISTS media_files (
+        sha256 TEXT PRIMARY KEY,
+        filename TEXT NOT NULL,
+        mimetype TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    ) WITHOUT ROWID;
+    ALTER TABLE send_jobs ADD COLUMN media_sha256 TEXT REFERENCES media_files(sha256);
+    """,
+    # 9: scheduled campaigns; times are Unix timestamps so the scheduler can compare them directly
+    """
+    ALTER TABLE send_jobs ADD COLUMN scheduled_at REAL;
+    ALTER TABLE send_jobs ADD COLUMN window_end REAL;
+    CREATE INDEX IF NOT EXISTS idx_send_jobs_due ON send_jobs (status, scheduled_at);
+    """,
+    # 10: delivery and read receipts (see receipts.py); campaign_stats holds running totals per job
+    """
+    ALTER TABLE send_items ADD COLUMN message_id TEXT;
+    ALTER TABLE send_items ADD COLUMN ack INTEGER NOT NULL DEFAULT 0;
+    CREATE INDEX IF NOT EXISTS idx_send_items_message ON send_items (message_id) WHERE message_id IS NOT NULL;
+    CREATE TABLE IF NOT EXISTS receipts (
+        id INTEGER PRIMARY KEY,
+        message_id TEXT NOT NULL,
+        ack INTEGER NOT NULL,
+        received_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS campaign_stats (
+        job_id INTEGER PRIMARY KEY REFERENCES send_jobs(id),
+        group_id INTEGER REFERENCES groups(id),
+        recipients INTEGER NOT NULL DEFAULT 0,
+        sent INTEGER NOT NULL DEFAULT 0,
+        failed INTEGER NOT NULL DEFAULT 0,
+        delivered INTEGER NOT NULL DEFAULT 0,
+        read INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_campaign_stats_group ON campaign_stats (group_id, job_id);
+    INSERT OR IGNORE INTO campaign_stats (job_id, group_id, recipients, sent, failed)
+    SELECT send_jobs.id, send_jobs.group_id, COUNT(send_items.id),
+           COALESCE(SUM(send_items.status = 'sent'), 0), COALESCE(SUM(send_items.status = 'failed'), 0)
+    FROM send_jobs LEFT JOIN send_items ON send_items.job_id = send_jobs.id
+    GROUP BY send_jobs.id;
+    """,
+    # 11: whether a number has a WhatsApp account, as last checked by validation.py
+    """
+    CREATE TABLE IF NOT EXISTS number_cache (
+        phone TEXT PRIMARY KEY,
+        registered INTEGER NOT NULL,
+        checked_at REAL NOT NULL
+    ) WITHOUT ROWID;
+    """,
+    # 12: numbers never to message (see suppression.py); group_id 0 means every group
+    """
+    CREATE TABLE IF NOT EXISTS suppressions (
+        phone TEXT NOT NULL,
+        group_id INTEGER NOT NULL DEFAULT 0,
+        kind TEXT NOT NULL,
+        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (phone, group_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_suppressions_group ON suppressions (group_id, phone);
+    """,
+    # 13: recipients whose send failed for good (see retry.py); earlier failures are of unknown kind
+    """
+    CREATE TABLE IF NOT EXISTS dead_letters (
+        item_id INTEGER PRIMARY KEY REFERENCES send_items(id),
+        job_id INTEGER NOT NULL REFERENCES send_jobs(id),
+        phone TEXT NOT NULL,
+        failure TEXT NOT NULL,
+        error TEXT,
+        attempts INTEGER NOT NULL DEFAULT 1,
+        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_dead_letters_job ON dead_letters (job_id, failure);
+    INSERT OR IGNORE INTO dead_letters (item_id, job_id, phone, failure, error, attempts)
+    SELECT id, job_id, phone, 'unknown', last_error, attempts FROM send_items WHERE status = 'failed';
+    """,
+    # 14: saved combinations of groups (see segments.py), and the groups of jobs sent to more than one
+    """
+    CREATE TABLE IF NOT EXISTS segments (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE,
+        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE IF NOT EXISTS segment_groups (
+        segment_id INTEGER NOT NULL REFERENCES segments(id),
+        group_id INTEGER NOT NULL REFERENCES groups(id),
+        PRIMARY KEY (segment_id, group_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_segment_groups_group ON segment_groups (group_id);
+    CREATE TABLE IF NOT EXISTS send_job_groups (
+        job_id INTEGER NOT NULL REFERENCES send_jobs(id),
+        group_id INTEGER NOT NULL REFERENCES groups(id),
+        PRIMARY KEY (job_id, group_id)
+    ) WITHOUT ROWID;
+    ALTER TABLE send_jobs ADD COLUMN segment_id INTEGER REFERENCES segments(id);
+    """,
+    # 15: the jobs sent to each group as part of a larger campaign, for the group view and stats
+    """
+    CREATE INDEX IF NOT EXISTS idx_send_job_groups_group ON send_job_groups (group_id, job_id);
+    """,
+]
+
+def connect(db_path=DEFAULT_DB_PATH, check_same_thread=True):
+    """ Open the contacts database in WAL mode and bring its schema up to date """
+    db_connection = sqlite3.connect(db_path, check_same_thread=check_same_thread)
+    # WAL lets the send thread write results while the UI keeps reading
+    db_connection.execute('PRAGMA journal_mode=WAL')
+    db_connection.execute('PRAGMA synchronous=NORMAL')
+    migrate(db_connection)
+    return db_connection
+
+def migrate(db_connection):
+    """ Apply any migrations the database has not seen yet """
+    version = db_connection.execute('PRAGMA user_version').fetchone()[0]
+    for number, step in enumerate(MIGRATIONS[version:], start=version + 1):
+        try:
+            if callable(step):
+                db_connection.execute('BEGIN')
+                step(db_connection)
+                db_connection.execute(f'PRAGMA user_version = {number}')
+                db_connection.commit()
+            else:
+                db_connection.executescript(f"BEGIN; {step}; PRAGMA user_version = {number}; COMMIT;")
+        except sqlite3.Error:
+            db_connection.rollback()
+            raise
+
+def database_path(db_connection):
+    """ Return the file path behind a connection, so worker threads can open their own """
+    for _, name, path in db_connection.execute('PRAGMA database_list'):
+        if name == 'main':
+            return path
+    return DEFAULT_DB_PATH
@@ -0,0 +1,251 @@
+import time
+import heapq
+import logging
+import itertools
+import threading
+from collections import deque
+from progress import is_sent, RETRIED
+from retry import RetryPolicy, classify, RATE_LIMITED
+
+# Defaults used by the send screen; WhatsApp starts throttling well above these
+DEFAULT_MAX_IN_FLIGHT = 4
+DEFAULT_PER_SECOND = 5
+DEFAULT_PER_MINUTE = 120
+
+class TokenBucket:
+    """ Classic token bucket: `rate` tokens per second, bursts of up to `capacity` """
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        """ Seconds until one token is available """
+        self.refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.tokens -= 1
+
+class RateLimiter:
+    """ Per-second and per-minute token buckets with adaptive backoff on throttling """
+
+    def __init__(self, per_second=DEFAULT_PER_SECOND, per_minute=DEFAULT_PER_MINUTE,
+                 initial_backoff=1.0, max_backoff=60.0, clock=time.monotonic, sleep=time.sleep):
+        self.clock = clock
+        self.sleep = sleep
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.backoff = 0.0
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+        now = clock()
+        self.buckets = []
+        if per_second:
+            self.buckets.append(TokenBucket(per_second, max(1, per_second), now))
+        if per_minute:
+            self.buckets.append(TokenBucket(per_minute / 60.0, max(1, per_minute), now))
+
+    def acquire(self):
+        """ Block until a send is allowed by every bucket and any backoff has expired """
+        while True:
+            with self.lock:
+                now = self.clock()
+                wait = max([self.paused_until - now] + [bucket.delay(now) for bucket in self.buckets])
+                if wait <= 0:
+                    for bucket in self.buckets:
+                        bucket.consume()
+                    return
+            self.sleep(wait)
+
+    def throttled(self):
+        """ Double the backoff (up to max_backoff) and pause all sends for that long """
+        with self.lock:
+            self.backoff = min(self.max_backoff, max(self.initial_backoff, self.backoff * 2))
+            self.paused_until = max(self.paused_until, self.clock() + self.backoff)
+            if self.backoff:
+                logging.warning(f'Transport throttled, backing off for {self.backoff:.1f}s')
+
+    def succeeded(self):
+        """ Relax the backoff again after a successful send """
+        with self.lock:
+            if self.backoff:
+                self.backoff = self.backoff / 2 if self.backoff / 2 >= self.initial_backoff else 0.0
+
+class Dispatcher:
+    """ Sends items through a transport with a bounded number of sends in flight.
+
+    `transport.send(to, message, media=None)` must return a Future resolved
+    with a 'sent' or 'failed' event (see senderclient.SenderClient). Items are
+    `(key, to, message)` tuples, optionally followed by a media descriptor
+    from mediacache. Failures are classified by retry.classify(): throttled
+    sends are queued again after the limiter has backed off, transient
+    failures are retried after the `retry_policy`'s backoff while other items
+    keep being sent, and permanent ones fail at once. An optional
+    metrics.Metrics receives per-stage timings and result counts.
+    """
+
+    def __init__(self, transport, max_in_flight=DEFAULT_MAX_IN_FLIGHT, limiter=None,
+                 per_second=DEFAULT_PER_SECOND, per_minute=DEFAULT_PER_MINUTE, max_throttle_retries=5,
+                 metrics=None, retry_policy=None):
+        self.transport = transport
+        self.metrics = metrics
+        self.max_in_flight = max(1, max_in_flight)
+        self.limiter = limiter or RateLimiter(per_second, per_minute)
+        self.max_throttle_retries = max_throttle_retries
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.condition = threading.Condition()
+        self.cancelled = False
+
+    def cancel(self):
+        """ Stop submitting new sends; sends already in flight still complete """
+        with self.condition:
+            self.cancelled = True
+            self.condition.notify_all()
+
+    def run(self, items, on_event=None):
+        """ Send every item and return counts of sent, failed and retried messages.
+
+        `on_event(key, event)` is called with a 'retried' event for every
+        attempt that is retried and once per item with its final 'sent' or
+        'failed' event, from whichever thread resolved the transport's Future.
+        Every final event carries the number of `attempts`; a 'failed' one
+        also carries its kind of `failure`.
+        """
+        items = iter(items)
+        retries = deque()  # Throttled items, sent as soon as the limiter allows
+        delayed = []  # Heap of (ready at, sequence, item, attempt, requeued) for transient failures
+        sequence = itertools.count()
+        stats = {'sent': 0, 'failed': 0, 'retried': 0}
+        state = {'in_flight': 0, 'exhausted': False}
+        metrics = self.metrics
+
+        def finish(item, attempt, event):
+            key = item[0]
+            sent = is_sent(event)
+            failure = None if sent else classify(event)
+            if metrics is not None:
+                record_metrics(event, failure)
+            if sent:
+                self.limiter.succeeded()
+            elif failure == RATE_LIMITED:
+                self.limiter.throttled()
+                if attempt < self.max_throttle_retries:
+                    retry(item, attempt, event)
+                    return
+            elif self.retry_policy.should_retry(failure, attempt):
+                retry(item, attempt, event, self.retry_policy.delay(attempt))
+                return
+            event = dict(event, attempts=attempt + 1)
+            if not sent:
+                event['failure'] = failure
+            with self.condition:
+                stats['sent' if sent else 'failed'] += 1
+                state['in_flight'] -= 1
+                self.condition.notify_all()
+            if metrics is not None:
+                metrics.count('messages', result='sent' if sent else 'failed')
+            if on_event is not None:
+                on_event(key, event)
+
+        def retry(item, attempt, event, delay=None):
+            with self.condition:
+                stats['retried'] += 1
+                if delay is None:
+                    retries.append((item, attempt + 1, time.perf_counter()))
+                else:
+                    heapq.heappush(delayed, (time.monotonic() + delay, next(sequence), item, attempt + 1,
+                                             time.perf_counter()))
+                state['in_flight'] -= 1
+                self.condition.notify_all()
+            if metrics is not None:
+                metrics.count('retries')
+            if on_event is not None:
+                retried = dict(event, event=RETRIED, attempt=attempt + 1)
+                if delay is not None:
+                    retried['delay'] = delay
+                on_event(item[0], retried)
+
+        def record_metrics(event, failure):
+            # Timings measured inside the sender service, split at the chat lookup
+            latency_ms, lookup_ms = event.get('latency_ms'), event.get('lookup_ms')
+            if lookup_ms is not None:
+                metrics.observe('chat_lookup', lookup_ms / 1000)
+            if latency_ms is not None:
+                metrics.observe('send_call', (latency_ms - (lookup_ms or 0)) / 1000)
+            if failure == RATE_LIMITED:
+                metrics.count('errors', kind='throttled')
+            elif failure is not None:
+                metrics.count('errors', kind=failure)
+
+        def done(item, attempt, future, submitted):
+            try:
+                event = future.result()
+            except Exception as e:
+                event = {'event': 'failed', 'to': item[1], 'error': str(e)}
+            if metrics is not None:
+                metrics.observe('round_trip', time.perf_counter() - submitted)
+            finish(item, attempt, event)
+
+        while True:
+            with self.condition:
+                while not self.cancelled:
+                    wait = None
+                    if state['in_flight'] < self.max_in_flight:
+                        if retries or not state['exhausted']:
+                            break
+                        if delayed:
+                            # Only backed-off retries are left; sleep until the first is due
+                            wait = delayed[0][0] - time.monotonic()
+                            if wait <= 0:
+                                break
+                        elif not state['in_flight']:
+                            break
+                    self.condition.wait(wait)
+                if self.cancelled:
+                    break
+                if retries:
+                    item, attempt, requeued = retries.popleft()
+                elif delayed and delayed[0][0] <= time.monotonic():
+                    _, _, item, attempt, requeued = heapq.heappop(delayed)
+                elif not state['exhausted']:
+                    item, attempt, requeued = next(items, None), 0, None
+                    if item is None:
+                        state['exhausted'] = True
+                        continue
+                else:
+                    break
+                if requeued is not None and metrics is not None:
+                    metrics.observe('retry_delay', time.perf_counter() - requeued)
+                state['in_flight'] += 1
+
+            waited = time.perf_counter()
+            self.limiter.acquire()
+            submitted = time.perf_counter()
+            if metrics is not None:
+                metrics.observe('rate_limit_wait', submitted - waited)
+            to, message = item[1], item[2]
+            media = item[3] if len(item) > 3 else None
+            try:
+                future = self.transport.send(to, message, media=media)
+            except Exception as e:
+                finish(item, attempt, {'event': 'failed', 'to': to, 'error': str(e)})
+                continue
+            future.add_done_callback(
+                lambda future, item=item, attempt=attempt, submitted=submitted: done(item, attempt, future, submitted)
+            )
+
+        # Wait for sends already in flight when cancelled; items waiting for a retry stay pending
+        with self.condition:
+            while state['in_flight']:
+                self.condition.wait()
+        return stats
@@ -0,0 +1,36 @@
+import os
+import sys
+import lazyload
+from PyQt5.QtCore import QUrl
+
+def resource_path(relative_path):
+    """ Get absolute path to resource, works for PyInstaller """
+    base_path = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_path, relative_path)
+
+class EditorViewPool:
+    """ Keeps CKEditor web views loaded in the background and hands them out for reuse.
+
+    Creating a QWebEngineView and loading the editor page is the slow part of
+    opening the composer, so prewarm() does it once after the main window is
+    shown and acquire() hands out the already loaded view.
+    """
+
+    def __init__(self, size=1):
+        self.size = size
+        self.idle = []
+
+    def _create_view(self):
+        QtWebEngineWidgets = lazyload.import_module('PyQt5.QtWebEngineWidgets')
+        view = QtWebEngineWidgets.QWebEngineView()
+        view.setUrl(QUrl.fromLocalFile(resource_path('static/ckeditor/index.html')))
+        return view
+
+    def prewarm(self):
+        """ Create and load views until the pool is full """
+        while len(self.idle) < self.size:
+            self.idle.append(self._create_view())
+
+    def acquire(self):
+        """ Return a loaded editor view, creating one if none is idle """
+        return self.idle.pop() if self.idle else self._create_view()
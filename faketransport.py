@@ -0,0 +1,70 @@
+import time
+import random
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class FakeTransport:
+    """ In-process stand-in for SenderClient, for tests and benchmarks.
+
+    Every send takes `latency` seconds on a worker thread and resolves to the
+    same 'sent'/'failed' events the real sender service writes. `throttle_rate`,
+    `failure_rate` and `permanent_rate` are the probabilities of a send being
+    rate limited, failing in a way worth retrying, or failing for good (see
+    retry.classify). `failures` injects errors for particular recipients: it
+    maps a chat ID to the errors of its next attempts, e.g.
+    {'254700000001@c.us': ['Error: timed out', 'Error: timed out']} fails two
+    attempts before the third is sent. Numbers in `unregistered` are reported
+    as not on WhatsApp by check_numbers().
+    """
+
+    def __init__(self, latency=0.0, throttle_rate=0.0, failure_rate=0.0, workers=64, seed=None, unregistered=(),
+                 permanent_rate=0.0, failures=None):
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.failure_rate = failure_rate
+        self.permanent_rate = permanent_rate
+        self.failures = {to: list(errors) for to, errors in (failures or {}).items()}
+        self.attempts = {}
+        self.random = random.Random(seed)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.unregistered = set(unregistered)
+        self.checked = 0
+        self.sent = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def send(self, to, message, media=None):
+        return self.executor.submit(self._deliver, next(self._ids), to, message, media)
+
+    def check_numbers(self, phones):
+        phones = list(phones)
+        self.checked += len(phones)
+        return self.executor.submit(lambda: {phone: phone not in self.unregistered for phone in phones})
+
+    def _deliver(self, request_id, to, message, media=None):
+        if self.latency:
+            time.sleep(self.latency)
+        latency_ms = self.latency * 1000
+        with self._lock:
+            roll = self.random.random()
+            self.attempts[to] = self.attempts.get(to, 0) + 1
+            injected = self.failures.get(to)
+            error = injected.pop(0) if injected else None
+        if error is not None:
+            return {'event': 'failed', 'id': request_id, 'to': to, 'latency_ms': latency_ms, 'error': error}
+        if roll < self.throttle_rate:
+            return {'event': 'failed', 'id': request_id, 'to': to, 'latency_ms': latency_ms, 'throttled': True,
+                    'error': 'Error: rate limit exceeded'}
+        if roll < self.throttle_rate + self.failure_rate:
+            return {'event': 'failed', 'id': request_id, 'to': to, 'latency_ms': latency_ms,
+                    'error': 'Error: send failed'}
+        if roll < self.throttle_rate + self.failure_rate + self.permanent_rate:
+            return {'event': 'failed', 'id': request_id, 'to': to, 'latency_ms': latency_ms,
+                    'error': 'Error: wid error: invalid wid'}
+        with self._lock:
+            self.sent.append((to, message) if media is None else (to, message, media['sha256']))
+        return {'event': 'sent', 'id': request_id, 'to': to, 'latency_ms': latency_ms}
+
+    def close(self):
+        self.executor.shutdown(wait=True)
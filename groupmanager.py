@@ -0,0 +1,197 @@
+from contactsync import normalize_phone, read_csv, DEFAULT_COUNTRY_CODE, UNKNOWN
+
+# SQL compound operators for combining the members of several groups
+SET_OPERATIONS = {
+    'union': 'UNION',
+    'intersection': 'INTERSECT',
+    'difference': 'EXCEPT',
+}
+
+def _insert_group(db_connection, name):
+    name = (name or '').strip()
+    if not name:
+        raise ValueError("Group name cannot be empty.")
+    return db_connection.execute("INSERT INTO groups (name) VALUES (?)", (name,)).lastrowid
+
+def _refresh_member_count(db_connection, group_id):
+    # Counted over the (group_id, contact_id) index once per bulk change, instead of a trigger per row
+    db_connection.execute("""
+        UPDATE groups SET member_count = (SELECT COUNT(*) FROM group_contacts WHERE group_id = ?) WHERE id = ?
+    """, (group_id, group_id))
+
+def _load_phone_batch(db_connection, contacts, default_country_code):
+    """ Fill a temp table with normalized (phone, name) rows and upsert them as contacts """
+    db_connection.execute("CREATE TEMP TABLE IF NOT EXISTS phone_batch (phone TEXT PRIMARY KEY, name TEXT)")
+    db_connection.execute("DELETE FROM phone_batch")
+    rows = ((normalize_phone(phone, default_country_code), (name or '').strip() or UNKNOWN)
+            for name, phone in contacts)
+    db_connection.executemany(
+        "INSERT OR IGNORE INTO phone_batch (phone, name) VALUES (?, ?)",
+        (row for row in rows if row[0] is not None)
+    )
+    # 'WHERE true' keeps SQLite from reading ON CONFLICT as part of the SELECT
+    db_connection.execute("""
+        INSERT INTO contacts (name, phone) SELECT name, phone FROM phone_batch WHERE true
+        ON CONFLICT (phone) DO UPDATE SET name = excluded.name
+        WHERE excluded.name != 'Unknown' AND excluded.name IS NOT contacts.name
+    """)
+
+def _add_phone_batch(db_connection, group_id):
+    return db_connection.execute("""
+        INSERT OR IGNORE INTO group_contacts (group_id, contact_id)
+        SELECT ?, contacts.id FROM phone_batch JOIN contacts ON contacts.phone = phone_batch.phone
+    """, (group_id,)).rowcount
+
+def create_group(db_connection, name, contact_ids=()):
+    """ Create a group with the given contact IDs as members and return its ID """
+    with db_connection:
+        group_id = _insert_group(db_connection, name)
+        db_connection.executemany(
+            "INSERT OR IGNORE INTO group_contacts (group_id, contact_id) VALUES (?, ?)",
+            ((group_id, contact_id) for contact_id in contact_ids)
+        )
+        _refresh_member_count(db_connection, group_id)
+    return group_id
+
+def delete_group(db_connection, group_id):
+    with db_connection:
+        db_connection.execute("DELETE FROM group_contacts WHERE group_id = ?", (group_id,))
+        db_connection.execute("DELETE FROM segment_groups WHERE group_id = ?", (group_id,))
+        db_connection.execute("DELETE FROM groups WHERE id = ?", (group_id,))
+
+def add_members(db_connection, group_id, contact_ids):
+    """ Add contacts to a group, ignoring ones already in it; returns how many were added """
+    with db_connection:
+        before = db_connection.total_changes
+        db_connection.executemany(
+            "INSERT OR IGNORE INTO group_contacts (group_id, contact_id) VALUES (?, ?)",
+            ((group_id, contact_id) for contact_id in contact_ids)
+        )
+        added = db_connection.total_changes - before
+        _refresh_member_count(db_connection, group_id)
+    return added
+
+def remove_members(db_connection, group_id, contact_ids):
+    """ Remove contacts from a group; returns how many were removed """
+    with db_connection:
+        before = db_connection.total_changes
+        db_connection.executemany(
+            "DELETE FROM group_contacts WHERE group_id = ? AND contact_id = ?",
+            ((group_id, contact_id) for contact_id in contact_ids)
+        )
+        removed = db_connection.total_changes - before
+        _refresh_member_count(db_connection, group_id)
+    return removed
+
+def add_phones(db_connection, group_id, phones, default_country_code=DEFAULT_COUNTRY_CODE):
+    """ Add phone numbers to a group, creating contacts for numbers not seen before """
+    with db_connection:
+        _load_phone_batch(db_connection, ((None, phone) for phone in phones), default_country_code)
+        added = _add_phone_batch(db_connection, group_id)
+        _refresh_member_count(db_connection, group_id)
+    return added
+
+def remove_phones(db_connection, group_id, phones, default_country_code=DEFAULT_COUNTRY_CODE):
+    """ Remove phone numbers from a group; returns how many members were removed """
+    with db_connection:
+        _load_phone_batch(db_connection, ((None, phone) for phone in phones), default_country_code)
+        removed = db_connection.execute("""
+            DELETE FROM group_contacts WHERE group_id = ? AND contact_id IN (
+                SELECT contacts.id FROM phone_batch JOIN contacts ON contacts.phone = phone_batch.phone
+            )
+        """, (group_id,)).rowcount
+        _refresh_member_count(db_connection, group_id)
+    return removed
+
+def iter_group_phones(db_connection, group_id, chunk_size=1000):
+    """ Yield the phone numbers of a group's members, reading one chunk at a time.
+
+    Pages by contact ID over the unique (group_id, contact_id) index, so no
+    cursor stays open between chunks and memory does not grow with the group.
+    """
+    last_contact_id = 0
+    while True:
+        rows = db_connection.execute("""
+            SELECT group_contacts.contact_id, contacts.phone FROM group_contacts
+            JOIN contacts ON contacts.id = group_contacts.contact_id
+            WHERE group_contacts.group_id = ? AND group_contacts.contact_id > ? AND contacts.phone IS NOT NULL
+            ORDER BY group_contacts.contact_id LIMIT ?
+        """, (group_id, last_contact_id, chunk_size)).fetchall()
+        if not rows:
+            return
+        for _, phone in rows:
+            yield phone
+        last_contact_id = rows[-1][0]
+
+def create_group_from_phones(db_connection, name, phones, default_country_code=DEFAULT_COUNTRY_CODE):
+    """ Create a group from a list of phone numbers and return its ID """
+    return create_group_from_contacts(db_connection, name, ((None, phone) for phone in phones),
+                                      default_country_code)
+
+def create_group_from_contacts(db_connection, name, contacts, default_country_code=DEFAULT_COUNTRY_CODE):
+    """ Create a group from (name, phone) pairs, adding unknown numbers as contacts """
+    with db_connection:
+        group_id = _insert_group(db_connection, name)
+        _load_phone_batch(db_connection, contacts, default_country_code)
+        _add_phone_batch(db_connection, group_id)
+        _refresh_member_count(db_connection, group_id)
+    return group_id
+
+def create_group_from_csv(db_connection, name, path, default_country_code=DEFAULT_COUNTRY_CODE):
+    """ Create a group from a CSV file with 'name' and 'phone' columns """
+    return create_group_from_contacts(db_connection, name, read_csv(path), default_country_code)
+
+def create_group_from_filter(db_connection, name, name_prefix=None, country_code=None):
+    """ Create a group from every contact whose name and/or phone start with the given prefixes """
+    conditions = ["phone IS NOT NULL"]
+    params = []
+    if name_prefix:
+        conditions.append("name LIKE ? ESCAPE '\\'")
+        escaped = name_prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        params.append(f"{escaped}%")
+    if country_code:
+        # A range on phone uses the unique index, unlike LIKE
+        country_code = country_code.lstrip('+')
+        conditions.append("phone >= ? AND phone < ?")
+        params.extend([country_code, country_code + ':'])  # ':' sorts right after '9'
+    with db_connection:
+        group_id = _insert_group(db_connection, name)
+        db_connection.execute(f"""
+            INSERT OR IGNORE INTO group_contacts (group_id, contact_id)
+            SELECT ?, id FROM contacts WHERE {' AND '.join(conditions)}
+        """, [group_id] + params)
+        _refresh_member_count(db_connection, group_id)
+    return group_id
+
+def set_operation_query(operation, group_ids):
+    """ Return (sql, params) selecting the contact IDs that result from combining `group_ids`.
+
+    'difference' keeps members of the first group that are in none of the others.
+    """
+    if operation not in SET_OPERATIONS:
+        raise ValueError(f"Unknown set operation: {operation}")
+    if not group_ids:
+        raise ValueError("At least one group is required.")
+    select = "SELECT contact_id FROM group_contacts WHERE group_id = ?"
+    if operation == 'difference' and len(group_ids) > 1:
+        placeholders = ', '.join('?' * (len(group_ids) - 1))
+        sql = f"{select} EXCEPT SELECT contact_id FROM group_contacts WHERE group_id IN ({placeholders})"
+    else:
+        sql = f" {SET_OPERATIONS[operation]} ".join([select] * len(group_ids))
+    return sql, list(group_ids)
+
+def create_group_from_set_operation(db_connection, name, operation, group_ids):
+    """ Create a group from the union, intersection or difference of existing groups, all in SQL """
+    sql, params = set_operation_query(operation, group_ids)
+    with db_connection:
+        group_id = _insert_group(db_connection, name)
+        db_connection.execute(
+            f"INSERT OR IGNORE INTO group_contacts (group_id, contact_id) SELECT ?, contact_id FROM ({sql})",
+            [group_id] + params
+        )
+        _refresh_member_count(db_connection, group_id)
+    return group_id
+
+def count_set_operation(db_connection, operation, group_ids):
+    sql, params = set_operation_query(operation, group_ids)
+    return db_connection.execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0]
@@ -1,7 +1,10 @@
 import sys
 import sqlite3
-from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QTreeWidget, QTreeWidgetItem)
-from PyQt5.QtCore import Qt
+import database
+from receipts import format_stats, stats_from_row
+from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QTreeView, QMessageBox)
+from PyQt5.QtCore import (Qt, QAbstractItemModel, QModelIndex, QObject, QThread, QMetaObject,
+                          pyqtSignal, pyqtSlot)
 import os
 
 def resource_path(relative_path):
@@ -9,6 +12,205 @@ def resource_path(relative_path):
     base_path = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
     return os.path.join(base_path, relative_path)
 
+class GroupQueryWorker(QObject):
+    """ Runs group queries on its own thread with its own SQLite connection """
+    groups_loaded = pyqtSignal(object)
+    members_loaded = pyqtSignal(int, object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, db_path):
+        super().__init__()
+        self.db_path = db_path
+        self.db_connection = None
+
+    def connection(self):
+        if self.db_connection is None:
+            self.db_connection = database.connect(self.db_path)
+        return self.db_connection
+
+    @pyqtSlot(int, int)
+    def load_groups(self, last_id, limit):
+        try:
+            # The latest campaign's totals are a lookup on each (group_id, job_id) index per group:
+            # campaign_stats for single-group jobs, send_job_groups for larger campaigns
+            rows = self.connection().execute("""
+                SELECT g.id, g.name, g.member_count, s.recipients, s.sent, s.failed, s.delivered, s.read
+                FROM groups g
+                LEFT JOIN campaign_stats s ON s.job_id = MAX(
+                    COALESCE((SELECT MAX(job_id) FROM campaign_stats WHERE group_id = g.id), 0),
+                    COALESCE((SELECT MAX(job_id) FROM send_job_groups WHERE group_id = g.id), 0)
+                )
+                WHERE g.id > ? ORDER BY g.id LIMIT ?
+            """, (last_id, limit)).fetchall()
+        except sqlite3.Error as e:
+            self.failed.emit(f"Database error: {e}")
+            rows = []
+        self.groups_loaded.emit(rows)
+
+    @pyqtSlot(int, int, int)
+    def load_members(self, group_id, last_contact_id, limit):
+        try:
+            # Pages over the unique (group_id, contact_id) index
+            rows = self.connection().execute("""
+                SELECT c.id, c.name, c.phone
+                FROM group_contacts gc
+                JOIN contacts c ON c.id = gc.contact_id
+                WHERE gc.group_id = ? AND gc.contact_id > ?
+                ORDER BY gc.contact_id LIMIT ?
+            """, (group_id, last_contact_id, limit)).fetchall()
+        except sqlite3.Error as e:
+            self.failed.emit(f"Database error: {e}")
+            rows = []
+        self.members_loaded.emit(group_id, rows)
+
+    @pyqtSlot()
+    def close(self):
+        if self.db_connection is not None:
+            self.db_connection.close()
+            self.db_connection = None
+
+class GroupNode:
+    def __init__(self, group_id, name, member_count, last_campaign=''):
+        self.group_id = group_id
+        self.name = name
+        self.member_count = member_count
+        self.last_campaign = last_campaign
+        self.members = []
+        self.loading = False
+
+class GroupTreeModel(QAbstractItemModel):
+    """ Two-level tree of groups and their members, loaded page by page off the GUI thread.
+
+    Member counts come from groups.member_count, so a group's expander and
+    count show without touching its members; members are only queried when
+    the group is expanded and scrolled. The last campaign column reads the
+    precomputed totals in campaign_stats of the latest job sent to the group,
+    on its own or in a campaign to several groups (send_job_groups).
+    """
+    request_groups = pyqtSignal(int, int)
+    request_members = pyqtSignal(int, int, int)
+
+    def __init__(self, db_path, page_size=200):
+        super().__init__()
+        self.page_size = page_size
+        self.groups = []
+        self.rows_by_group = {}
+        self.groups_exhausted = False
+        self.groups_loading = False
+
+        self.thread = QThread()
+        self.worker = GroupQueryWorker(db_path)
+        self.worker.moveToThread(self.thread)
+        self.request_groups.connect(self.worker.load_groups)
+        self.request_members.connect(self.worker.load_members)
+        self.worker.groups_loaded.connect(self.on_groups_loaded)
+        self.worker.members_loaded.connect(self.on_members_loaded)
+        self.thread.start()
+
+    def shutdown(self):
+        """ Stop the worker thread; call before the model is destroyed """
+        if self.thread.isRunning():
+            # The connection belongs to the worker thread, so close it there
+            QMetaObject.invokeMethod(self.worker, 'close', Qt.BlockingQueuedConnection)
+            self.thread.quit()
+            self.thread.wait()
+
+    # A member's internalId is its group's row + 1; groups use 0
+    def index(self, row, column, parent=QModelIndex()):
+        if not self.hasIndex(row, column, parent):
+            return QModelIndex()
+        if not parent.isValid():
+            return self.createIndex(row, column, 0)
+        return self.createIndex(row, column, parent.row() + 1)
+
+    def parent(self, index):
+        if not index.isValid() or index.internalId() == 0:
+            return QModelIndex()
+        return self.createIndex(index.internalId() - 1, 0, 0)
+
+    def rowCount(self, parent=QModelIndex()):
+        if not parent.isValid():
+            return len(self.groups)
+        if parent.internalId() == 0 and parent.column() == 0:
+            return len(self.groups[parent.row()].members)
+        return 0
+
+    def columnCount(self, parent=QModelIndex()):
+        return 3
+
+    def hasChildren(self, parent=QModelIndex()):
+        if not parent.isValid():
+            return bool(self.groups) or not self.groups_exhausted
+        if parent.internalId() == 0 and parent.column() == 0:
+            return self.groups[parent.row()].member_count > 0
+        return False
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return ['Group Name', 'Members', 'Last Campaign'][section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        if index.internalId() == 0:
+            group = self.groups[index.row()]
+            return (group.name, group.member_count, group.last_campaign)[index.column()]
+        _, name, phone = self.groups[index.internalId() - 1].members[index.row()]
+        return (name, phone, None)[index.column()]
+
+    def canFetchMore(self, parent=QModelIndex()):
+        if not parent.isValid():
+            return not self.groups_exhausted and not self.groups_loading
+        if parent.internalId() == 0:
+            group = self.groups[parent.row()]
+            return not group.loading and len(group.members) < group.member_count
+        return False
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        if not parent.isValid():
+            self.groups_loading = True
+            last_id = self.groups[-1].group_id if self.groups else 0
+            self.request_groups.emit(last_id, self.page_size)
+        else:
+            group = self.groups[parent.row()]
+            group.loading = True
+            last_contact_id = group.members[-1][0] if group.members else 0
+            self.request_members.emit(group.group_id, last_contact_id, self.page_size)
+
+    def on_groups_loaded(self, rows):
+        self.groups_loading = False
+        if len(rows) < self.page_size:
+            self.groups_exhausted = True
+        if not rows:
+            return
+        first = len(self.groups)
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        for offset, (group_id, name, member_count, *stats) in enumerate(rows):
+            last_campaign = format_stats(stats_from_row(stats)) if stats[0] is not None else ''
+            self.groups.append(GroupNode(group_id, name, member_count, last_campaign))
+            self.rows_by_group[group_id] = first + offset
+        self.endInsertRows()
+
+    def on_members_loaded(self, group_id, rows):
+        row = self.rows_by_group.get(group_id)
+        if row is None:
+            return
+        group = self.groups[row]
+        group.loading = False
+        if len(rows) < self.page_size:
+            # Fewer rows than the cached count means members were removed meanwhile
+            group.member_count = len(group.members) + len(rows)
+            count_index = self.index(row, 1)
+            self.dataChanged.emit(count_index, count_index)
+        if rows:
+            parent = self.index(row, 0)
+            self.beginInsertRows(parent, len(group.members), len(group.members) + len(rows) - 1)
+            group.members.extend(rows)
+            self.endInsertRows()
+
 class GroupViewWindow(QWidget):
     def __init__(self, db_connection):
         super().__init__()
@@ -19,10 +221,9 @@ class GroupViewWindow(QWidget):
         self.setWindowTitle('View Groups')
         self.layout = QVBoxLayout()
 
-        # Tree view for groups
-        self.group_tree = QTreeWidget()
-        self.group_tree.setHeaderLabels(['Group Name'])
-        self.group_tree.itemClicked.connect(self.on_item_clicked)
+        # Tree view for groups, with members loaded as groups are expanded
+        self.group_tree = QTreeView()
+        self.group_tree.setUniformRowHeights(True)
         self.layout.addWidget(self.group_tree)
 
         # Load groups from the database
@@ -32,36 +233,23 @@ class GroupViewWindow(QWidget):
         self.setGeometry(300, 300, 400, 300)
 
     def load_groups(self):
-        """Load group names from the database into the tree view."""
-        cursor = self.db_connection.cursor()
-        cursor.execute("SELECT id, name FROM groups")
-        groups = cursor.fetchall()
-        for group_id, group_name in groups:
-            group_item = QTreeWidgetItem([group_name])
-            group_item.setData(0, Qt.UserRole, group_id)  # Store the group ID in the item
-            group_item.setChildIndicatorPolicy(QTreeWidgetItem.ShowIndicator)  # Indicate that this item has children
-            self.group_tree.addTopLevelItem(group_item)
-
-    def on_item_clicked(self, item, column):
-        """Load contacts when a group item is clicked."""
-        if item.childCount() == 0:  # Only load if not already loaded
-            group_id = item.data(0, Qt.UserRole)
-            self.load_contacts(item, group_id)
-
-    def load_contacts(self, group_item, group_id):
-        """Load contacts associated with a group and display them under the group item."""
-        cursor = self.db_connection.cursor()
-        cursor.execute("""
-            SELECT c.name
-            FROM contacts c
-            JOIN group_contacts gc ON c.id = gc.contact_id
-            WHERE gc.group_id = ?
-        """, (group_id,))
-        contacts = cursor.fetchall()
-        for contact_name, in contacts:
-            contact_item = QTreeWidgetItem([contact_name])
-            group_item.addChild(contact_item)
-        group_item.setExpanded(True)  # Automatically expand the item to show contacts
+        """Attach the group model; it queries the database on a worker thread."""
+        self.group_model = GroupTreeModel(database.database_path(self.db_connection))
+        self.group_model.worker.failed.connect(self.show_error_message)
+        self.group_tree.setModel(self.group_model)
+        self.group_model.fetchMore()
+
+    def refresh(self):
+        """ Reload the tree with a fresh model """
+        self.group_model.shutdown()
+        self.load_groups()
+
+    def show_error_message(self, message):
+        QMessageBox.critical(self, 'Error', message)
+
+    def closeEvent(self, event):
+        self.group_model.shutdown()
+        super().closeEvent(event)
 
 
 class MainWindow(QMainWindow):
@@ -70,7 +258,7 @@ class MainWindow(QMainWindow):
 
         # Use resource_path to locate the SQLite database
         db_path = resource_path('contacts.db')
-        self.db_connection = sqlite3.connect(db_path)  # Ensure db_path is used here
+        self.db_connection = database.connect(db_path)  # Ensure db_path is used here
 
         self.initUI()
 
@@ -81,6 +269,10 @@ class MainWindow(QMainWindow):
         self.central_widget = GroupViewWindow(self.db_connection)
         self.setCentralWidget(self.central_widget)
 
+    def closeEvent(self, event):
+        self.central_widget.group_model.shutdown()
+        super().closeEvent(event)
+
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
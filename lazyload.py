@@ -0,0 +1,106 @@
+import os
+import re
+import sys
+import time
+import types
+import logging
+import importlib
+import subprocess
+
+# Set to log how long every lazy import takes, including in the PyInstaller build
+PROFILE_ENV = 'WHATSAPPBULK_PROFILE_IMPORTS'
+
+# Seconds spent importing each module through this loader, in load order
+import_times = {}
+
+# Lines written by `python -X importtime`: "import time: self [us] | cumulative | imported package"
+_IMPORTTIME_LINE = re.compile(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)')
+
+def import_module(name):
+    """ Import a module, recording how long it took the first time """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    elapsed = import_times[name] = time.perf_counter() - start
+    if os.environ.get(PROFILE_ENV):
+        logging.info(f"Imported {name} in {elapsed * 1000:.1f} ms")
+    return module
+
+def load(target):
+    """ Return the object named by 'module:attribute', importing its module on first use """
+    module_name, _, attribute = target.partition(':')
+    module = import_module(module_name)
+    return getattr(module, attribute) if attribute else module
+
+class LazyModule(types.ModuleType):
+    """ Stand-in for a module that is only imported when one of its attributes is used """
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        if self._module is None:
+            self.__dict__['_module'] = import_module(self.__name__)
+        return self._module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __dir__(self):
+        return dir(self._load())
+
+def lazy_import(name):
+    """ Return the module if it is already loaded, otherwise a LazyModule for it """
+    return sys.modules.get(name) or LazyModule(name)
+
+def allow_lazy_webengine():
+    """ Let QtWebEngineWidgets be imported after the QApplication exists; call before creating it """
+    from PyQt5.QtCore import QCoreApplication, Qt
+    QCoreApplication.setAttribute(Qt.AA_ShareOpenGLContexts)
+
+def profile_imports(module_names, executable=None):
+    """ Import each module in a fresh interpreter with -X importtime.
+
+    Returns {module: (total_us, [(cumulative_us, self_us, imported_module), ...])}
+    with the dependencies sorted by cumulative cost, or None for modules
+    that failed to import.
+    """
+    executable = executable or sys.executable
+
+    def run(code):
+        completed = subprocess.run(
+            [executable, '-X', 'importtime', '-c', code],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        if completed.returncode != 0:
+            return None
+        matches = (_IMPORTTIME_LINE.match(line) for line in completed.stderr.splitlines())
+        return [(int(cumulative_us), int(self_us), imported)
+                for self_us, cumulative_us, imported in (match.groups() for match in matches if match)]
+
+    # Modules the interpreter imports at start-up are not part of any module's cost
+    startup = {imported for _, _, imported in run('pass') or []}
+    results = {}
+    for name in module_names:
+        entries = run(f'import {name}')
+        if entries is None:
+            results[name] = None
+            continue
+        entries = [entry for entry in entries if entry[2] not in startup]
+        total = next((cumulative for cumulative, _, imported in entries if imported == name), 0)
+        results[name] = (total, sorted(entries, reverse=True))
+    return results
+
+def print_import_profile(module_names, top=15, out=sys.stdout):
+    """ Print the slowest imports behind each module, for main.py --profile-imports """
+    for name, result in profile_imports(module_names).items():
+        if result is None:
+            print(f"{name}: failed to import", file=out)
+            continue
+        total, entries = result
+        print(f"{name}: {total / 1000:.1f} ms", file=out)
+        for cumulative, self_us, imported in entries[:top]:
+            print(f"    {cumulative / 1000:9.1f} ms  (self {self_us / 1000:7.1f} ms)  {imported}", file=out)
@@ -2,11 +2,14 @@ import os
 import sys
 import subprocess
 
-# Import Python files
-import qr
-import mainwindow
-import creategroups
-import groupsview
+# Screens are imported on first use so start-up only pays for what it shows
+import lazyload
+
+qr = lazyload.lazy_import('qr')
+
+# Modules reported by --profile-imports
+PROFILED_MODULES = ['main', 'qr', 'mainwindow', 'creategroups', 'groupsview', 'sendmessage']
+
 # Function to find the correct path for bundled resources
 def resource_path(relative_path):
     """ Get the absolute path to bundled files. Handles both development and PyInstaller modes. """
@@ -25,7 +28,18 @@ def run_js(file_name):
         print(f"Error executing {file_name}: {e}")
 
 if __name__ == "__main__":
+    if '--profile-imports' in sys.argv:
+        sys.argv.remove('--profile-imports')
+        if getattr(sys, 'frozen', False):
+            # A bundled build cannot re-run itself with -X importtime; log each lazy import instead
+            import logging
+            logging.basicConfig(level=logging.INFO)
+            os.environ[lazyload.PROFILE_ENV] = '1'
+        else:
+            lazyload.print_import_profile(PROFILED_MODULES)
+            sys.exit(0)
+
     # Start the QR module (qr.py)
     print("Starting QR module...")
-    qr.main()  # Assuming qr.py has a main() function  
+    qr.main()  # Assuming qr.py has a main() function
     print("Application finished.")
@@ -1,70 +1,151 @@
 import sys
 import os
-import json
-import subprocess
 import logging
 import asyncio
 from asyncqt import QEventLoop
 from PyQt5.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QLabel, QWidget, QStackedWidget, QHBoxLayout, QFrame, QPushButton
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QFont
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtGui import QFont, QPixmap
+from senderclient import SenderServiceError
+from senderpool import get_sender_transport
+import lazyload
+import database
+from editorpool import EditorViewPool
+from session import SessionService
+import metrics
+from scheduler import Scheduler
 
 def resource_path(relative_path):
     """ Get absolute path to resource, works for PyInstaller """
     base_path = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
     return os.path.join(base_path, relative_path)
 
-# Function to run JavaScript files using Node.js asynchronously
-def run_js_async(file_name):
-    js_path = resource_path(file_name)   # Locate JS file in the bundle
-    try:
-        # Run the JS file in a separate subprocess asynchronously
-        subprocess.Popen(["node", js_path])
-    except Exception as e:
-        print(f"Error executing {file_name}: {e}")
-
-# Function to run qr.py when client is not logged in
-def run_qr_py():
-    try:
-        subprocess.run([sys.executable, resource_path("qr.py")])
-    except Exception as e:
-        logging.error(f"Failed to run qr.py: {e}")
+# Sidebar pages, imported and built the first time they are shown
+PAGES = {
+    'create_group': 'creategroups:ContactSelectionWindow',
+    'send_message': 'sendmessage:SendMessageWindow',
+    'view_groups': 'groupsview:GroupViewWindow',
+}
+
+# Longest single wait of the schedule timer, so clock changes and sleep/resume are noticed
+MAX_SCHEDULE_WAIT_S = 300
+# How long to wait before retrying when a due campaign finds another one still sending
+BUSY_RETRY_S = 30
 
 class MainApp(QMainWindow):
     def __init__(self):
         super().__init__()
         self.setWindowTitle('MyApp')
         self.setGeometry(100, 100, 800, 600)
+        self.db_connection = None
+        self.pages = {}
+        self.editor_pool = EditorViewPool()
+        self.main_content_shown = False
+        self.scheduler = None
+        self.sender_start_pending = False  # Waiting for the login script to release the session
+
+        # Login state, QR code and connection health arrive as signals, never by polling
+        self.session = SessionService(parent=self)
+        self.session.changed.connect(self.show_session_status)
+        self.session.login_changed.connect(self.on_login_changed)
+        self.session.qr_changed.connect(self.update_qr_code)
+        self.show_session_status(self.session.state)
 
-        # Check if the client is logged in
-        if not self.check_client_status():
+        if not self.session.state.logged_in:
             self.show_qr_code_scanner()  # Show QR code scanner if not logged in
         else:
             self.show_main_content()  # Show main content if already logged in
 
-    def check_client_status(self):
-        status_file = 'client_status.json'
-        if not os.path.exists(status_file):
-            logging.info('Status file does not exist. Client not logged in.')
-            return False
-
-        try:
-            with open(status_file, 'r') as file:
-                status = json.load(file)
-                logged_in = status.get('loggedIn', False)
-                logging.info(f'Client status checked: loggedIn={logged_in}')
-                return logged_in
-        except Exception as e:
-            logging.error(f'Error reading status file: {e}')
-            return False
-
     def show_qr_code_scanner(self):
         logging.info('Client not logged in. Launching QR code scanner...')
-        run_qr_py()  # Call the external qr.py script
+        page = QWidget()
+        layout = QVBoxLayout(page)
+        layout.setAlignment(Qt.AlignCenter)
+        layout.addWidget(QLabel('Scan this code with WhatsApp on your phone to log in.'))
+        self.qr_label = QLabel('Waiting for QR code...')
+        self.qr_label.setAlignment(Qt.AlignCenter)
+        layout.addWidget(self.qr_label)
+        self.setCentralWidget(page)
+        if self.session.state.waiting_for_scan:
+            self.update_qr_code(self.session.state)
+        self.session.start_login()  # Runs in the background; the window stays responsive
+
+    def update_qr_code(self, state):
+        if self.main_content_shown:
+            return
+        pixmap = QPixmap(state.qr_image) if state.qr_image else QPixmap()
+        if pixmap.isNull():
+            self.qr_label.setText('QR code received, waiting for the image...')
+        else:
+            self.qr_label.setPixmap(pixmap)
+
+    def on_login_changed(self, logged_in):
+        if logged_in and not self.main_content_shown:
+            self.show_main_content()
+
+    def show_session_status(self, state):
+        message = f'WhatsApp: {state.state}'
+        if state.last_error and not state.connected:
+            message += f' ({state.last_error})'
+        self.statusBar().showMessage(message)
 
     def show_main_content(self):
         logging.info('Displaying main content.')
+        self.main_content_shown = True
         self.init_main_layout()
+        self.start_sender_service()
+        # Load the composer's editor once the window has painted, so opening it is instant
+        QTimer.singleShot(0, self.editor_pool.prewarm)
+        self.init_scheduler()
+
+    def init_scheduler(self):
+        """ Pick up campaigns scheduled in earlier sessions and wake up when the next one is due """
+        self.scheduler = Scheduler(self.get_db_connection())
+        self.schedule_timer = QTimer(self)
+        self.schedule_timer.setSingleShot(True)
+        self.schedule_timer.timeout.connect(self.run_due_campaigns)
+        self.arm_schedule_timer()
+
+    def arm_schedule_timer(self, delay=None):
+        if delay is None:
+            delay = self.scheduler.seconds_until_due()
+        if delay is None:
+            self.schedule_timer.stop()
+            return
+        self.schedule_timer.start(int(min(delay, MAX_SCHEDULE_WAIT_S) * 1000))
+
+    def on_campaign_scheduled(self, job_id):
+        self.scheduler.load()
+        self.arm_schedule_timer()
+
+    def run_due_campaigns(self):
+        """ Start the next due campaign on the Send Message page, one campaign at a time """
+        page = self.get_page('send_message')
+        if page.is_sending():
+            self.arm_schedule_timer(min(BUSY_RETRY_S, self.scheduler.seconds_until_due() or BUSY_RETRY_S))
+            return
+        for job_id in self.scheduler.pop_due(limit=1):
+            logging.info(f'Starting scheduled campaign {job_id}.')
+            self.start_sender_service()
+            page.start_campaign(job_id)
+        self.arm_schedule_timer()
+
+    def start_sender_service(self):
+        """ Start the sender service once so the WhatsApp session is warm before the first send """
+        if self.session.login_running():
+            # The login script still holds the WhatsApp session; start once it has released it
+            if not self.sender_start_pending:
+                self.sender_start_pending = True
+                self.session.login_process.finished.connect(self.on_login_process_finished)
+            return
+        try:
+            get_sender_transport()
+        except (SenderServiceError, ValueError) as e:
+            logging.error(f'Failed to start sender service: {e}')
+
+    def on_login_process_finished(self, *_):
+        self.sender_start_pending = False
+        self.start_sender_service()
 
     def init_main_layout(self):
         logging.info('Initializing main layout...')
@@ -111,30 +192,74 @@ class MainApp(QMainWindow):
         button.clicked.connect(function)
         self.sidebar.addWidget(button)
 
+    def get_db_connection(self):
+        if self.db_connection is None:
+            self.db_connection = database.connect(resource_path('contacts.db'))
+        return self.db_connection
+
+    def get_page(self, name):
+        """ Return a page, creating it on first use without switching to it """
+        page = self.pages.get(name)
+        if page is None:
+            page_class = lazyload.load(PAGES[name])
+            if name == 'send_message':
+                page = page_class(self.get_db_connection(), web_view=self.editor_pool.acquire(), embedded=True)
+                page.campaign_scheduled.connect(self.on_campaign_scheduled)
+            else:
+                page = page_class(self.get_db_connection())
+            page.setWindowFlags(Qt.Widget)  # Dialogs would otherwise open as separate windows
+            self.content.addWidget(page)
+            self.pages[name] = page
+        return page
+
+    def show_page(self, name):
+        """ Switch the content area to a page, creating it on first use """
+        if name in self.pages:
+            # Pick up groups created on other pages since it was last shown
+            self.pages[name].refresh()
+        page = self.get_page(name)
+        self.content.setCurrentWidget(page)
+        return page
+
     def show_create_group(self):
         logging.info('Displaying Create Group page.')
-        # Example: run the associated JavaScript file when needed
-        run_js_async('create_group.js')
+        self.show_page('create_group')
 
     def show_send_message(self):
         logging.info('Displaying Send Message page.')
-        # Example: run the associated JavaScript file when needed
-        run_js_async('sendmessage.js')
+        # Sends go through the long-lived sender service instead of a new process
+        self.start_sender_service()
+        self.show_page('send_message')
 
     def show_view_groups(self):
         logging.info('Displaying View Groups page.')
-        # Example: run the associated JavaScript file when needed
-        run_js_async('view_groups.js')
+        self.show_page('view_groups')
+
+    def closeEvent(self, event):
+        view_groups = self.pages.get('view_groups')
+        if view_groups is not None:
+            view_groups.group_model.shutdown()
+        send_message = self.pages.get('send_message')
+        if send_message is not None:
+            send_message.shutdown()
+        if self.db_connection is not None:
+            self.db_connection.close()
+        self.session.stop_login()
+        super().closeEvent(event)
 
 
 if __name__ == '__main__':
-    # Create the PyQt5 application
+    # Create the PyQt5 application; the editor's web engine is loaded later, on first use
+    lazyload.allow_lazy_webengine()
     app = QApplication(sys.argv)
 
     # Create an asyncio event loop for the PyQt app
     loop = QEventLoop(app)
     asyncio.set_event_loop(loop)
 
+    # Serve send-path metrics to Prometheus when WHATSAPPBULK_METRICS_PORT is set
+    metrics.serve_prometheus()
+
     # Create and show the main window
     main_app = MainApp()
     main_app.show()
@@ -0,0 +1,76 @@
+import os
+import mmap
+import shutil
+import hashlib
+import mimetypes
+import database
+
+# WhatsApp rejects documents larger than this
+MAX_MEDIA_SIZE = 100 * 1024 * 1024
+
+def hash_file(path):
+    """ Return the SHA-256 hex digest of a file, hashing a memory map instead of reading it into memory """
+    with open(path, 'rb') as media_file:
+        if os.fstat(media_file.fileno()).st_size == 0:
+            return hashlib.sha256().hexdigest()  # Empty files cannot be mapped
+        with mmap.mmap(media_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return hashlib.sha256(mapped).hexdigest()
+
+class MediaCache:
+    """ Content-addressed store for message attachments, keyed by SHA-256.
+
+    Each distinct file is copied once into cache_dir (by default a 'media'
+    folder next to the database) and described by a row in media_files; jobs
+    refer to it by hash, so attaching the same file to many campaigns stores
+    and prepares it only once.
+    """
+
+    def __init__(self, db_connection, cache_dir=None):
+        self.db_connection = db_connection
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.dirname(database.database_path(db_connection)), 'media')
+        self.cache_dir = cache_dir
+
+    def cached_path(self, sha256):
+        return os.path.join(self.cache_dir, sha256[:2], sha256)
+
+    def add(self, path):
+        """ Store a file in the cache if it is not there yet and return its SHA-256 """
+        size = os.path.getsize(path)
+        if size > MAX_MEDIA_SIZE:
+            raise ValueError(f"Attachment is larger than {MAX_MEDIA_SIZE // (1024 * 1024)} MB.")
+        sha256 = hash_file(path)
+        cached_path = self.cached_path(sha256)
+        if not os.path.exists(cached_path):
+            os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+            # Copy under a temporary name so a crash never leaves a truncated file behind the hash
+            partial_path = f"{cached_path}.part"
+            shutil.copyfile(path, partial_path)
+            os.replace(partial_path, cached_path)
+
+        filename = os.path.basename(path)
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        with self.db_connection:
+            self.db_connection.execute("""
+                INSERT INTO media_files (sha256, filename, mimetype, size) VALUES (?, ?, ?, ?)
+                ON CONFLICT (sha256) DO NOTHING
+            """, (sha256, filename, mimetype, size))
+        return sha256
+
+    def descriptor(self, sha256):
+        """ Return the media payload sent with every message of a campaign, or None if unknown.
+
+        The sender service loads and encodes the file the first time it sees
+        the hash and reuses the prepared media for every later recipient.
+        """
+        row = self.db_connection.execute(
+            "SELECT filename, mimetype, size FROM media_files WHERE sha256 = ?", (sha256,)
+        ).fetchone()
+        if row is None:
+            return None
+        filename, mimetype, size = row
+        path = self.cached_path(sha256)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Attachment {filename} is missing from the media cache")
+        return {'sha256': sha256, 'path': os.path.abspath(path), 'mimetype': mimetype,
+                'filename': filename, 'size': size}
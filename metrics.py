@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+
+PREFIX = 'whatsappbulk'
+# Set to a port number to serve the Prometheus text format on http://127.0.0.1:<port>/metrics
+PORT_ENV = 'WHATSAPPBULK_METRICS_PORT'
+PROMETHEUS_FILE = os.path.join('logs', 'metrics.prom')
+REPORT_DIR = 'reports'
+
+# Histogram bucket upper bounds in seconds, from sub-millisecond DB work to minute-long session starts
+BUCKETS = (0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5,
+           1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+class Histogram:
+    """ Fixed-bucket latency histogram; observe() is a bisect and an increment """
+
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # The last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.count += other.count
+        self.sum += other.sum
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, fraction):
+        """ Estimate a percentile by interpolating inside the bucket that holds it """
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.bounds[index - 1] if index else 0.0
+                upper = self.bounds[index] if index < len(self.bounds) else self.max
+                value = lower + (upper - lower) * (rank - seen) / count
+                # The true value is never outside what was observed
+                return min(max(value, self.min), self.max)
+            seen += count
+        return self.max
+
+    def summary(self):
+        """ Count and latency figures in milliseconds, for reports """
+        def ms(value):
+            return None if value is None else round(value * 1000, 3)
+        return {
+            'count': self.count,
+            'mean_ms': ms(self.sum / self.count) if self.count else None,
+            'min_ms': ms(self.min),
+            'p50_ms': ms(self.percentile(0.50)),
+            'p95_ms': ms(self.percentile(0.95)),
+            'p99_ms': ms(self.percentile(0.99)),
+            'max_ms': ms(self.max),
+        }
+
+class Metrics:
+    """ Per-stage latency histograms and labelled counters for the send path.
+
+    One instance is kept per campaign for its JSON report and merged into
+    the process-wide `registry` afterwards, which is what Prometheus sees.
+    All methods are thread-safe.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.started = time.time()
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def count(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def counter(self, name, **labels):
+        return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def finish(self):
+        self.finished = time.time()
+
+    def merge(self, other):
+        with self._lock, other._lock:
+            for stage, histogram in other.histograms.items():
+                self.histograms.setdefault(stage, Histogram()).merge(histogram)
+            for key, value in other.counters.items():
+                self.counters[key] = self.counters.get(key, 0) + value
+
+    def report(self, **extra):
+        """ Return a JSON-serialisable summary: throughput, counters and p50/p95/p99 per stage """
+        with self._lock:
+            elapsed = (self.finished or time.time()) - self.started
+            sent = sum(value for (name, labels), value in self.counters.items()
+                       if name == 'messages' and dict(labels).get('result') == 'sent')
+            report = dict(extra)
+            report.update({
+                'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+                'elapsed_s': round(elapsed, 3),
+                'throughput_per_s': round(sent / elapsed, 3) if elapsed > 0 else None,
+                'counters': [dict(labels, name=name, value=value)
+                             for (name, labels), value in sorted(self.counters.items())],
+                'stages': {stage: histogram.summary() for stage, histogram in sorted(self.histograms.items())},
+            })
+            return report
+
+    def write_report(self, path, **extra):
+        _write_atomically(path, json.dumps(self.report(**extra), indent=2))
+
+    def prometheus_text(self):
+        """ Render everything in the Prometheus text exposition format """
+        name = f'{PREFIX}_stage_latency_seconds'
+        lines = [f'# HELP {name} Latency of each send-path stage.', f'# TYPE {name} histogram']
+        with self._lock:
+            for stage, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(list(histogram.bounds) + ['+Inf'], histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+            seen = set()
+            for (counter, labels), value in sorted(self.counters.items()):
+                metric = f'{PREFIX}_{counter}_total'
+                if metric not in seen:
+                    seen.add(metric)
+                    lines.append(f'# TYPE {metric} counter')
+                label_text = ','.join(f'{key}="{_escape(label)}"' for key, label in labels)
+                lines.append(f'{metric}{{{label_text}}} {value}' if label_text else f'{metric} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path=PROMETHEUS_FILE):
+        """ Write the text format for node_exporter's textfile collector """
+        _write_atomically(path, self.prometheus_text())
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _write_atomically(path, text):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        file.write(text)
+    os.replace(temp_path, path)
+
+def report_path(job_id):
+    return os.path.join(REPORT_DIR, f'campaign_{job_id}.json')
+
+# Totals for the whole process, exported to Prometheus
+registry = Metrics()
+
+def save_campaign(campaign_metrics, job_id, **extra):
+    """ Write a finished campaign's JSON report and add its figures to the Prometheus totals """
+    campaign_metrics.finish()
+    try:
+        campaign_metrics.write_report(report_path(job_id), job_id=job_id, **extra)
+        registry.merge(campaign_metrics)
+        registry.write_prometheus()
+    except OSError as e:
+        logging.warning(f"Could not write campaign metrics: {e}")
+
+def serve_prometheus(port=None):
+    """ Serve the registry on localhost if a port is given or set in WHATSAPPBULK_METRICS_PORT """
+    port = port or os.environ.get(PORT_ENV)
+    if not port:
+        return None
+    # Imported here: http.server is slow to import and only needed when exporting
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip('/') not in ('', '/metrics'):
+                self.send_error(404)
+                return
+            body = registry.prometheus_text().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.debug(f'Metrics request: {format % args}')
+
+    server = ThreadingHTTPServer(('127.0.0.1', int(port)), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info(f'Serving metrics on http://127.0.0.1:{port}/metrics')
+    return server
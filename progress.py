@@ -0,0 +1,107 @@
+import json
+import time
+import logging
+import threading
+
+# Events written by the sender service, one JSON object per line
+SENT = 'sent'
+FAILED = 'failed'
+RETRIED = 'retried'
+
+def parse_event(line):
+    """ Parse one line of the event stream, returning None for blank or non-JSON lines """
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        event = json.loads(line)
+    except ValueError:
+        logging.debug(f"Ignoring non-event line: {line}")
+        return None
+    return event if isinstance(event, dict) else None
+
+def read_events(stream):
+    """ Yield events from a text stream as lines arrive """
+    for line in stream:
+        event = parse_event(line)
+        if event is not None:
+            yield event
+
+def is_sent(event):
+    return event.get('event') == SENT
+
+class ProgressAggregator:
+    """ Folds sent/failed/retried events into counters for the UI.
+
+    feed() is cheap and thread-safe; snapshot() returns the current totals
+    plus the failures seen since the previous snapshot, so the UI only ever
+    appends new rows to its failure table.
+    """
+
+    def __init__(self, total=0, done=0):
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.already_done = done
+        self.latency_total = 0.0
+        self.latency_count = 0
+        self._new_failures = []
+        self._lock = threading.Lock()
+
+    def feed(self, event):
+        kind = event.get('event')
+        with self._lock:
+            if kind == SENT:
+                self.sent += 1
+            elif kind == FAILED:
+                self.failed += 1
+                self._new_failures.append((event.get('to', ''), event.get('error', '')))
+            elif kind == RETRIED:
+                self.retried += 1
+                return
+            else:
+                return
+            latency = event.get('latency_ms')
+            if latency is not None:
+                self.latency_total += latency
+                self.latency_count += 1
+
+    def snapshot(self):
+        with self._lock:
+            failures, self._new_failures = self._new_failures, []
+            done = self.already_done + self.sent + self.failed
+            return {
+                'total': self.total,
+                'done': done,
+                'sent': self.sent,
+                'failed': self.failed,
+                'retried': self.retried,
+                'percent': done * 100 // self.total if self.total else 100,
+                'avg_latency_ms': self.latency_total / self.latency_count if self.latency_count else 0.0,
+                'new_failures': failures,
+            }
+
+class ThrottledReporter:
+    """ Calls `report(snapshot)` at most once every `interval` seconds while events are fed """
+
+    def __init__(self, aggregator, report, interval=0.25, clock=time.monotonic):
+        self.aggregator = aggregator
+        self.report = report
+        self.interval = interval
+        self.clock = clock
+        self._last_report = 0.0
+        self._lock = threading.Lock()
+
+    def feed(self, event):
+        self.aggregator.feed(event)
+        now = self.clock()
+        with self._lock:
+            if now - self._last_report < self.interval:
+                return
+            self._last_report = now
+        self.report(self.aggregator.snapshot())
+
+    def flush(self):
+        """ Report whatever has not been reported yet, e.g. when the send ends """
+        self.report(self.aggregator.snapshot())
@@ -4,6 +4,7 @@ const fs = require('fs');
 const sqlite3 = require('sqlite3').verbose(); // Import sqlite3 for database operations
 const puppeteer = require('puppeteer'); // Import puppeteer for Chromium management
 const path = require('path');
+const { sessionId, updateSessionState } = require('./sessionstate');
 
 // Define the directory and filename for the log file
 const logDir = 'logs';
@@ -37,6 +38,8 @@ console.error = (...args) => {
     process.stderr.write(`${message}\n`);
 };
 
+const qrImageFile = sessionId ? `qrcode_${sessionId}.png` : 'qrcode.png';
+
 // Initialize the database
 const db = new sqlite3.Database('contacts.db'); // database name
 
@@ -56,36 +59,51 @@ function initializeDatabase() {
     db.run('CREATE TABLE IF NOT EXISTS group_contacts (group_id INTEGER, contact_id INTEGER, FOREIGN KEY(group_id) REFERENCES groups(id), FOREIGN KEY(contact_id) REFERENCES contacts(id))');
 }
 
-// Function to save contacts to the database
+// Normalize a WhatsApp number to digits only, or null if there is none
+function normalizePhone(number) {
+    const digits = String(number || '').replace(/\D/g, '');
+    return digits.length >= 8 && digits.length <= 15 ? digits : null;
+}
+
+// Function to save contacts to the database in a single transaction.
+// Contacts already stored under the same phone are updated instead of duplicated,
+// which works with or without the unique index added by the Python migrations.
+// Resolves once the transaction has been committed.
 async function saveContactsToDatabase(client) {
     const contacts = await client.getContacts();
-    for (let contact of contacts) {
-        if (contact.name || contact.number) {
-            db.run(`INSERT INTO contacts (name, phone) VALUES (?, ?)`, [contact.name || "Unknown", contact.number || "Unknown"]);
+    return new Promise((resolve) => db.serialize(() => {
+        db.run('BEGIN');
+        const update = db.prepare(`UPDATE contacts SET name = ? WHERE phone = ? AND name IS NOT ? AND ? != 'Unknown'`);
+        const insert = db.prepare(`INSERT INTO contacts (name, phone) SELECT ?, ? WHERE NOT EXISTS (SELECT 1 FROM contacts WHERE phone = ?)`);
+        for (let contact of contacts) {
+            const phone = normalizePhone(contact.number);
+            if (!phone) continue;
+            const name = contact.name || 'Unknown';
+            update.run([name, phone, name, name]);
+            insert.run([name, phone, phone]);
         }
-    }
-    console.log('Contacts have been saved to the database.');
-}
-
-// Function to update the status in client.json
-function updateClientStatus(status) {
-    try {
-        const clientData = JSON.parse(fs.readFileSync('client.json', 'utf-8')); // Read the client.json file
-        clientData.loggedIn = status; // Update the loggedIn field
-        fs.writeFileSync('client.json', JSON.stringify(clientData, null, 2)); // Write back the updated JSON
-        console.log(`Updated client.json: loggedIn is now ${status}`);
-    } catch (err) {
-        console.error('Error updating client_status.json', err);
-    }
+        update.finalize();
+        insert.finalize();
+        db.run('COMMIT', (err) => {
+            if (err) {
+                console.error('Failed to save contacts to the database', err);
+            } else {
+                console.log('Contacts have been saved to the database.');
+            }
+            resolve();
+        });
+    }));
 }
 
 // Initialize the client and database
 (async () => {
     try {
+        updateSessionState({ state: 'starting', connected: false, qr: null, qrImage: null, lastError: null });
         const chromiumPath = await ensureChromium(); // Ensure Chromium is available
 
+        // `node qrcode.js --session <id>` logs in an additional sending account
         const client = new Client({
-            authStrategy: new LocalAuth(),
+            authStrategy: new LocalAuth(sessionId ? { clientId: sessionId } : {}),
             puppeteer: {
                 executablePath: chromiumPath, // Use the retrieved Chromium path
             }
@@ -94,33 +112,47 @@ function updateClientStatus(status) {
         // Ensure database tables are set up before client is ready
         initializeDatabase();
 
+        client.on('authenticated', () => {
+            updateSessionState({ state: 'authenticated', qr: null, qrImage: null, lastError: null });
+        });
+
+        client.on('auth_failure', (message) => {
+            updateSessionState({ state: 'auth_failure', loggedIn: false, connected: false, lastError: String(message) });
+        });
+
         client.on('ready', async () => {
             console.log('Client is ready!');
-            
-            // Update client.json status to true
-            updateClientStatus(true);
-            
+            updateSessionState({ state: 'syncing', connected: true });
+
             // Save contacts to the database once the client is ready
             await saveContactsToDatabase(client);
+
+            // Release the session so the sender service can open it, then report the login
+            await client.destroy();
+            updateSessionState({ state: 'authenticated', loggedIn: true, connected: false });
+            process.exit(0);
         });
 
         client.on('qr', async qr => {
             try {
                 // Generate the QR code and save it as an image
-                await QRCode.toFile('qrcode.png', qr, {
+                await QRCode.toFile(qrImageFile, qr, {
                     color: {
                         dark: '#000000',  // Dark color of the QR code
                         light: '#FFFFFF'  // Light color of the QR code background
                     }
                 });
-                console.log('QR code saved as qrcode.png');
+                console.log(`QR code saved as ${qrImageFile}`);
+                updateSessionState({ state: 'qr', loggedIn: false, qr, qrImage: path.resolve(qrImageFile) });
             } catch (err) {
                 console.error('Failed to generate QR code', err);
+                updateSessionState({ state: 'qr', loggedIn: false, qr, qrImage: null, lastError: String(err) });
             }
         });
 
         client.initialize();
     } catch (err) {
         console.error('Error during initialization', err);
+        updateSessionState({ state: 'error', connected: false, lastError: String(err) });
     }
 })();
@@ -0,0 +1,211 @@
+import time
+import atexit
+import logging
+import threading
+import database
+
+# Acknowledgement levels reported by WhatsApp for a sent message
+ACK_ERROR = -1
+ACK_PENDING = 0
+ACK_SERVER = 1
+ACK_DEVICE = 2  # Delivered to the recipient's phone
+ACK_READ = 3
+ACK_PLAYED = 4  # Voice and video messages
+
+# A receipt can arrive before SendQueue has flushed its message ID; keep retrying it this long
+RESOLVE_TIMEOUT = 60.0
+
+class ReceiptStore:
+    """ Append-only receipt log with running delivery and read totals per campaign.
+
+    Receipts reported with record() may come from any thread; flush() writes
+    them in one transaction on the thread that owns the connection. Every
+    receipt is appended to the receipts table, which has no secondary
+    indexes so inserts stay cheap. Each flush also raises send_items.ack to
+    the highest level seen and adds the newly delivered and newly read
+    messages to campaign_stats, so rates are read from one row per campaign
+    and never counted from the receipts.
+    """
+
+    def __init__(self, db_connection, batch_size=500, flush_interval=1.0, clock=time.time):
+        self.db_connection = db_connection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.clock = clock
+        self._receipts = []
+        self._unresolved = {}  # message_id -> (ack, first seen), for receipts of unflushed sends
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def record(self, message_id, ack):
+        """ Buffer one receipt; safe to call from any thread """
+        if message_id is None or ack is None:
+            return
+        with self._lock:
+            self._receipts.append((message_id, int(ack), self.clock()))
+
+    def flush_if_due(self):
+        """ Flush when the buffer is full or flush_interval has passed """
+        if len(self._receipts) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """ Append buffered receipts to the log and apply them to the campaign totals """
+        with self._lock:
+            receipts, self._receipts = self._receipts, []
+        self._last_flush = time.monotonic()
+        if not receipts and not self._unresolved:
+            return
+        now = self.clock()
+        with self.db_connection:
+            self.db_connection.executemany(
+                "INSERT INTO receipts (message_id, ack, received_at) VALUES (?, ?, ?)", receipts
+            )
+            self.db_connection.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS ack_batch (message_id TEXT PRIMARY KEY, ack INTEGER, seen REAL)"
+            )
+            self.db_connection.execute("DELETE FROM ack_batch")
+            # Only the highest level per message matters: "read" implies "delivered"
+            self.db_connection.executemany("""
+                INSERT INTO ack_batch (message_id, ack, seen) VALUES (?, ?, ?)
+                ON CONFLICT (message_id) DO UPDATE SET ack = max(ack, excluded.ack), seen = min(seen, excluded.seen)
+            """, [(message_id, ack, seen) for message_id, (ack, seen) in self._unresolved.items()] + receipts)
+
+            # Count messages crossing each level before send_items.ack moves past it
+            increments = self.db_connection.execute(f"""
+                SELECT send_items.job_id,
+                       SUM(ack_batch.ack >= {ACK_DEVICE} AND send_items.ack < {ACK_DEVICE}),
+                       SUM(ack_batch.ack >= {ACK_READ} AND send_items.ack < {ACK_READ})
+                FROM ack_batch JOIN send_items ON send_items.message_id = ack_batch.message_id
+                WHERE ack_batch.ack > send_items.ack
+                GROUP BY send_items.job_id
+            """).fetchall()
+            self.db_connection.executemany("""
+                UPDATE campaign_stats
+                SET delivered = delivered + ?, read = read + ?, updated_at = CURRENT_TIMESTAMP
+                WHERE job_id = ?
+            """, [(delivered, read, job_id) for job_id, delivered, read in increments])
+            self.db_connection.execute("""
+                UPDATE send_items
+                SET ack = (SELECT ack FROM ack_batch WHERE ack_batch.message_id = send_items.message_id)
+                WHERE message_id IN (SELECT message_id FROM ack_batch)
+                  AND ack < (SELECT ack FROM ack_batch WHERE ack_batch.message_id = send_items.message_id)
+            """)
+
+            unresolved = self.db_connection.execute("""
+                SELECT message_id, ack, seen FROM ack_batch
+                WHERE NOT EXISTS (SELECT 1 FROM send_items WHERE send_items.message_id = ack_batch.message_id)
+            """).fetchall()
+        self._unresolved = {message_id: (ack, seen) for message_id, ack, seen in unresolved
+                            if now - seen < RESOLVE_TIMEOUT}
+        if len(unresolved) > len(self._unresolved):
+            logging.debug(f'Dropped {len(unresolved) - len(self._unresolved)} receipts for unknown messages')
+
+STATS_COLUMNS = ('recipients', 'sent', 'failed', 'delivered', 'read')
+
+def stats_from_row(values, **extra):
+    """ Build a stats dict from values in STATS_COLUMNS order, adding delivery and read rates """
+    stats = dict(extra, **dict(zip(STATS_COLUMNS, values)))
+    sent = stats['sent']
+    stats['delivery_rate'] = stats['delivered'] / sent if sent else None
+    stats['read_rate'] = stats['read'] / sent if sent else None
+    return stats
+
+# The jobs sent to a group (bound twice): single-group jobs keep it in campaign_stats, larger
+# campaigns in send_job_groups (see sendqueue.py)
+GROUP_JOBS = """
+    SELECT job_id FROM campaign_stats WHERE group_id = ?
+    UNION SELECT job_id FROM send_job_groups WHERE group_id = ?
+"""
+# The group's latest job, or 0 if it has none, from the end of each (group_id, job_id) index
+LATEST_GROUP_JOB = """
+    MAX(COALESCE((SELECT MAX(job_id) FROM campaign_stats WHERE group_id = ?), 0),
+        COALESCE((SELECT MAX(job_id) FROM send_job_groups WHERE group_id = ?), 0))
+"""
+
+def campaign_stats(db_connection, job_id):
+    """ Return a job's totals and its delivery and read rates, or None if it has none """
+    row = db_connection.execute(
+        "SELECT group_id, updated_at, recipients, sent, failed, delivered, read "
+        "FROM campaign_stats WHERE job_id = ?", (job_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    return stats_from_row(row[2:], job_id=job_id, group_id=row[0], updated_at=row[1])
+
+def group_stats(db_connection, group_id):
+    """ Return the totals and rates over every campaign sent to a group.
+
+    A campaign sent to several groups counts in full for each of them.
+    """
+    row = db_connection.execute(f"""
+        SELECT COUNT(*), COALESCE(SUM(recipients), 0), COALESCE(SUM(sent), 0), COALESCE(SUM(failed), 0),
+               COALESCE(SUM(delivered), 0), COALESCE(SUM(read), 0)
+        FROM campaign_stats WHERE job_id IN ({GROUP_JOBS})
+    """, (group_id, group_id)).fetchone()
+    return stats_from_row(row[1:], group_id=group_id, campaigns=row[0])
+
+def latest_campaign_stats(db_connection, group_id):
+    """ Return the stats of the group's most recent campaign, or None """
+    row = db_connection.execute(f"SELECT {LATEST_GROUP_JOB}", (group_id, group_id)).fetchone()
+    return campaign_stats(db_connection, row[0]) if row[0] else None
+
+def format_stats(stats):
+    """ Short summary for tables, e.g. '98% delivered, 61% read of 1200' """
+    if not stats or not stats['sent']:
+        return '' if not stats else f"0 of {stats['recipients']} sent"
+    return (f"{stats['delivery_rate']:.0%} delivered, {stats['read_rate']:.0%} read "
+            f"of {stats['sent']}")
+
+class ReceiptWriter:
+    """ Writes receipts from the sender service on a thread with its own connection.
+
+    Receipts keep arriving long after a campaign has finished, so the writer
+    lives as long as the app rather than as long as a send.
+    """
+
+    def __init__(self, db_path, flush_interval=1.0):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.store = None
+        self.stopped = threading.Event()
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        self.ready.wait()
+
+    def record(self, message_id, ack):
+        if self.store is not None:
+            self.store.record(message_id, ack)
+
+    def _run(self):
+        db_connection = database.connect(self.db_path)
+        try:
+            self.store = ReceiptStore(db_connection, flush_interval=self.flush_interval)
+            self.ready.set()
+            while not self.stopped.wait(self.flush_interval):
+                self._flush()
+            self._flush()
+        finally:
+            self.ready.set()
+            db_connection.close()
+
+    def _flush(self):
+        try:
+            self.store.flush()
+        except Exception as e:
+            logging.error(f'Failed to write receipts: {e}')
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+_writers = {}
+
+def get_receipt_writer(db_path):
+    """ Return the shared receipt writer for a database, starting it on first use """
+    writer = _writers.get(db_path)
+    if writer is None:
+        writer = _writers[db_path] = ReceiptWriter(db_path)
+        atexit.register(writer.stop)
+    return writer
@@ -0,0 +1,112 @@
+import random
+from sendqueue import SendQueue, PENDING, FAILED
+
+# Kinds of failure, from a failed send's event
+TRANSIENT = 'transient'  # Timeouts, disconnects and anything unrecognised: worth another try
+RATE_LIMITED = 'rate_limited'  # Retried after the dispatcher's rate limiter has backed off
+PERMANENT = 'permanent'  # Another try would fail the same way
+
+# Error text from WhatsApp Web and the sender service that no retry can fix
+PERMANENT_ERRORS = (
+    'invalid wid',  # Malformed number, from getChatById
+    'not registered',
+    'not on whatsapp',
+    'no lid for user',
+    'blocked',
+    'no such file',  # Attachment missing from the media cache
+    'file too large',
+    'unsupported media',
+)
+
+def is_throttled(event):
+    """ Return True if the transport reported that it is being rate limited """
+    if event.get('throttled'):
+        return True
+    error = str(event.get('error', '')).lower()
+    return ('rate' in error and 'limit' in error) or '429' in error or 'too many' in error
+
+def classify(event):
+    """ Return the kind of failure of a 'failed' event: TRANSIENT, RATE_LIMITED or PERMANENT """
+    if is_throttled(event):
+        return RATE_LIMITED
+    if event.get('skipped'):
+        return PERMANENT
+    error = str(event.get('error', '')).lower()
+    if any(pattern in error for pattern in PERMANENT_ERRORS):
+        return PERMANENT
+    return TRANSIENT
+
+class RetryPolicy:
+    """ Exponential backoff with full jitter for transient failures.
+
+    Retry n (from 0) waits a random time between 0 and
+    min(max_delay, base_delay * 2**n), so recipients that failed together,
+    e.g. during a disconnect, do not all come back at the same moment.
+    """
+
+    def __init__(self, max_retries=3, base_delay=2.0, max_delay=120.0, random=random.random):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.random = random
+
+    def should_retry(self, kind, attempt):
+        """ `attempt` counts the attempts already made, from 0 for the first """
+        return kind == TRANSIENT and attempt < self.max_retries
+
+    def delay(self, attempt):
+        return self.random() * min(self.max_delay, self.base_delay * 2 ** attempt)
+
+class DeadLetters:
+    """ Recipients whose send failed for good, kept in the dead_letters table.
+
+    SendQueue.flush() adds a row for every failed item, with the kind of
+    failure and the number of attempts; requeue() puts a job's failed
+    recipients back in its queue, so sending the job again retries only them.
+    """
+
+    def __init__(self, db_connection):
+        self.db_connection = db_connection
+
+    def counts(self, job_id):
+        """ Return the number of dead letters of each kind for a job """
+        cursor = self.db_connection.execute(
+            "SELECT failure, COUNT(*) FROM dead_letters WHERE job_id = ? GROUP BY failure", (job_id,)
+        )
+        return dict(cursor.fetchall())
+
+    def entries(self, job_id):
+        """ Yield (item_id, phone, failure, error, attempts, created_at) rows of a job """
+        yield from self.db_connection.execute("""
+            SELECT item_id, phone, failure, error, attempts, created_at FROM dead_letters
+            WHERE job_id = ? ORDER BY item_id
+        """, (job_id,))
+
+    def latest_job(self):
+        """ Return the ID of the most recent job with dead letters, or None """
+        return self.db_connection.execute("SELECT MAX(job_id) FROM dead_letters").fetchone()[0]
+
+    def requeue(self, job_id, failures=None):
+        """ Make a job's dead-lettered recipients pending again; returns how many were requeued.
+
+        Only the kinds in `failures` are requeued if it is given. The job is
+        marked pending so it can be sent, or resumed, like any other.
+        """
+        condition = "job_id = ?"
+        params = [job_id]
+        if failures:
+            condition += f" AND failure IN ({', '.join('?' * len(failures))})"
+            params.extend(failures)
+        with self.db_connection:
+            requeued = self.db_connection.execute(f"""
+                UPDATE send_items SET status = ?, last_error = NULL, updated_at = CURRENT_TIMESTAMP
+                WHERE id IN (SELECT item_id FROM dead_letters WHERE {condition}) AND status = ?
+            """, [PENDING, *params, FAILED]).rowcount
+            self.db_connection.execute(f"DELETE FROM dead_letters WHERE {condition}", params)
+            if requeued:
+                self.db_connection.execute(
+                    "UPDATE send_jobs SET status = 'pending', updated_at = CURRENT_TIMESTAMP WHERE id = ?", (job_id,)
+                )
+        if requeued:
+            SendQueue(self.db_connection).update_stats(job_id)
+        return requeued
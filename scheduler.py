@@ -0,0 +1,117 @@
+import time
+import heapq
+import logging
+from dispatch import RateLimiter, DEFAULT_PER_SECOND, DEFAULT_PER_MINUTE
+
+# Job statuses owned by the scheduler; a due job becomes 'pending' and then runs like any other
+SCHEDULED = 'scheduled'
+CANCELLED = 'cancelled'
+
+def window_limiter(job, pending, clock=time.time, sleep=time.sleep):
+    """ Return a RateLimiter that spreads `pending` sends evenly over what is left of the job's window.
+
+    Returns None for jobs without a window. The rate is worked out from the
+    remaining items and time, so a campaign resumed after a restart still
+    finishes at the end of its window. The normal limits still apply.
+    """
+    window_end = job.get('window_end')
+    if not window_end or not pending:
+        return None
+    remaining = window_end - clock()
+    if remaining <= 0:
+        logging.warning(f"Delivery window of job {job['id']} has passed; sending the rest at the normal rate")
+        return None
+    # Below one send per second the bucket holds a single token, so sends are evenly spaced
+    return RateLimiter(min(pending / remaining, DEFAULT_PER_SECOND), DEFAULT_PER_MINUTE, clock=clock, sleep=sleep)
+
+class Scheduler:
+    """ Starts queued campaigns at their scheduled time.
+
+    Due times live in send_jobs.scheduled_at, indexed on (status,
+    scheduled_at), so schedules survive restarts; a heap of (due, job_id)
+    loaded from that index answers "what runs next" without a query. Pass a
+    fake `clock` and `sleep` to drive it in tests without real waiting.
+    """
+
+    def __init__(self, db_connection, clock=time.time, sleep=time.sleep):
+        self.db_connection = db_connection
+        self.clock = clock
+        self.sleep = sleep
+        self.heap = []
+        self.load()
+
+    def load(self):
+        """ Rebuild the heap from the database, e.g. after a restart """
+        cursor = self.db_connection.execute(
+            "SELECT scheduled_at, id FROM send_jobs WHERE status = ? ORDER BY scheduled_at, id", (SCHEDULED,)
+        )
+        self.heap = [tuple(row) for row in cursor]  # Already sorted, so already a heap
+
+    def schedule(self, job_id, start_at, window_end=None):
+        """ Run a queued job at `start_at`, optionally spread evenly until `window_end` (Unix times) """
+        if window_end is not None and window_end <= start_at:
+            raise ValueError("The delivery window must end after it starts.")
+        with self.db_connection:
+            updated = self.db_connection.execute("""
+                UPDATE send_jobs SET status = ?, scheduled_at = ?, window_end = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status IN ('pending', ?)
+            """, (SCHEDULED, start_at, window_end, job_id, SCHEDULED)).rowcount
+        if not updated:
+            raise ValueError(f"Job {job_id} cannot be scheduled.")
+        heapq.heappush(self.heap, (start_at, job_id))
+
+    def cancel(self, job_id):
+        """ Cancel a scheduled job; returns False if it was not waiting to run """
+        with self.db_connection:
+            cancelled = self.db_connection.execute(
+                "UPDATE send_jobs SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ? AND status = ?",
+                (CANCELLED, job_id, SCHEDULED)
+            ).rowcount
+        # The heap entry goes stale and is dropped when it reaches the top
+        return bool(cancelled)
+
+    def _is_current(self, due, job_id):
+        row = self.db_connection.execute(
+            "SELECT 1 FROM send_jobs WHERE id = ? AND status = ? AND scheduled_at = ?", (job_id, SCHEDULED, due)
+        ).fetchone()
+        return row is not None
+
+    def next_due(self):
+        """ Return the time the next job is due, or None if nothing is scheduled """
+        while self.heap:
+            due, job_id = self.heap[0]
+            if self._is_current(due, job_id):
+                return due
+            heapq.heappop(self.heap)  # Cancelled or rescheduled since it was pushed
+        return None
+
+    def seconds_until_due(self):
+        due = self.next_due()
+        return None if due is None else max(0.0, due - self.clock())
+
+    def pop_due(self, limit=None):
+        """ Return IDs of jobs that are due, oldest first, and mark them pending so they run once """
+        job_ids = []
+        now = self.clock()
+        while limit is None or len(job_ids) < limit:
+            due = self.next_due()
+            if due is None or due > now:
+                break
+            _, job_id = heapq.heappop(self.heap)
+            with self.db_connection:
+                self.db_connection.execute(
+                    "UPDATE send_jobs SET status = 'pending', updated_at = CURRENT_TIMESTAMP WHERE id = ?", (job_id,)
+                )
+            job_ids.append(job_id)
+        return job_ids
+
+    def run_until_idle(self, run_job):
+        """ Call `run_job(job_id)` for every scheduled job as it falls due, sleeping in between """
+        while True:
+            delay = self.seconds_until_due()
+            if delay is None:
+                return
+            if delay > 0:
+                self.sleep(delay)
+            for job_id in self.pop_due():
+                run_job(job_id)
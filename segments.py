@@ -0,0 +1,160 @@
+import threading
+from collections import OrderedDict
+
+# Cached recipient counts kept by RecipientCounter
+COUNT_CACHE_SIZE = 64
+
+def recipients_query(db_connection, group_ids):
+    """ Return (sql, params) selecting the distinct contact IDs of the members of `group_ids`.
+
+    The groups are combined with UNION over the (group_id, contact_id) index,
+    so a contact in several groups is selected once. Groups with per-group
+    exclusions (see suppression.py) get a branch of their own that leaves the
+    excluded members out; a contact excluded from one group is still reached
+    through the others. The rest share a single branch.
+    """
+    group_ids = list(dict.fromkeys(group_ids))
+    if not group_ids:
+        raise ValueError("At least one group is required.")
+    marks = ', '.join('?' * len(group_ids))
+    excluding = {row[0] for row in db_connection.execute(
+        f"SELECT DISTINCT group_id FROM suppressions WHERE group_id IN ({marks})", group_ids
+    )}
+    branches, params = [], []
+    plain = [group_id for group_id in group_ids if group_id not in excluding]
+    if plain:
+        branches.append(f"SELECT contact_id FROM group_contacts WHERE group_id IN ({', '.join('?' * len(plain))})")
+        params.extend(plain)
+    for group_id in group_ids:
+        if group_id in excluding:
+            branches.append("""
+                SELECT group_contacts.contact_id FROM group_contacts
+                JOIN contacts ON contacts.id = group_contacts.contact_id
+                WHERE group_contacts.group_id = ? AND NOT EXISTS (
+                    SELECT 1 FROM suppressions WHERE suppressions.phone = contacts.phone AND suppressions.group_id = ?
+                )
+            """)
+            params.extend([group_id, group_id])
+    return ' UNION '.join(branches), params
+
+def recipients_condition(db_connection, group_ids):
+    """ Return (sql, params) for a WHERE condition on `contacts` matching the campaign's recipients.
+
+    Recipients are the members of `group_ids` that have a phone number and
+    are not on the global suppression list.
+    """
+    sql, params = recipients_query(db_connection, group_ids)
+    return f"""
+        contacts.id IN ({sql}) AND contacts.phone IS NOT NULL
+        AND NOT EXISTS (SELECT 1 FROM suppressions
+                        WHERE suppressions.phone = contacts.phone AND suppressions.group_id = 0)
+    """, params
+
+def count_recipients(db_connection, group_ids):
+    """ Return how many messages a campaign to `group_ids` would send """
+    condition, params = recipients_condition(db_connection, group_ids)
+    return db_connection.execute(f"SELECT COUNT(*) FROM contacts WHERE {condition}", params).fetchone()[0]
+
+def has_recipients(db_connection, group_ids):
+    """ Return True if a campaign to `group_ids` would send at least one message """
+    condition, params = recipients_condition(db_connection, group_ids)
+    return db_connection.execute(f"SELECT EXISTS (SELECT 1 FROM contacts WHERE {condition})", params).fetchone()[0] == 1
+
+def member_total(db_connection, group_ids):
+    """ Return the groups' summed member counts: an instant upper bound on count_recipients() """
+    group_ids = list(dict.fromkeys(group_ids))
+    if not group_ids:
+        return 0
+    return db_connection.execute(
+        f"SELECT COALESCE(SUM(member_count), 0) FROM groups WHERE id IN ({', '.join('?' * len(group_ids))})",
+        group_ids
+    ).fetchone()[0]
+
+class RecipientCounter:
+    """ count_recipients() with a cache, for previews that recount on every change of selection.
+
+    A cached count is reused while the groups' member counts and the number
+    of suppressions that apply to them are unchanged, which two index
+    lookups confirm; anything else is counted again.
+    """
+
+    def __init__(self, db_connection, cache_size=COUNT_CACHE_SIZE):
+        self.db_connection = db_connection
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # frozenset of group IDs -> (fingerprint, count)
+        self._lock = threading.Lock()
+
+    def _fingerprint(self, group_ids):
+        marks = ', '.join('?' * len(group_ids))
+        members = self.db_connection.execute(
+            f"SELECT id, member_count FROM groups WHERE id IN ({marks}) ORDER BY id", group_ids
+        ).fetchall()
+        suppressions = self.db_connection.execute(
+            f"SELECT COUNT(*) FROM suppressions WHERE group_id IN (0, {marks})", group_ids
+        ).fetchone()[0]
+        return tuple(members), suppressions
+
+    def cached(self, group_ids):
+        """ Return the cached count if it is still current, else None """
+        key = frozenset(group_ids)
+        with self._lock:
+            entry = self._cache.get(key)
+        if entry is None or entry[0] != self._fingerprint(sorted(key)):
+            return None
+        with self._lock:
+            self._cache.move_to_end(key)
+        return entry[1]
+
+    def count(self, group_ids):
+        key = frozenset(group_ids)
+        if not key:
+            return 0
+        count = self.cached(key)
+        if count is None:
+            fingerprint = self._fingerprint(sorted(key))
+            count = count_recipients(self.db_connection, sorted(key))
+            with self._lock:
+                self._cache[key] = (fingerprint, count)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return count
+
+def create_segment(db_connection, name, group_ids):
+    """ Save a named combination of groups and return its ID """
+    name = (name or '').strip()
+    if not name:
+        raise ValueError("Segment name cannot be empty.")
+    group_ids = list(dict.fromkeys(group_ids))
+    if not group_ids:
+        raise ValueError("A segment needs at least one group.")
+    if db_connection.execute("SELECT 1 FROM segments WHERE name = ?", (name,)).fetchone():
+        raise ValueError(f"A segment named {name!r} already exists.")
+    with db_connection:
+        segment_id = db_connection.execute("INSERT INTO segments (name) VALUES (?)", (name,)).lastrowid
+        db_connection.executemany(
+            "INSERT INTO segment_groups (segment_id, group_id) VALUES (?, ?)",
+            ((segment_id, group_id) for group_id in group_ids)
+        )
+    return segment_id
+
+def delete_segment(db_connection, segment_id):
+    with db_connection:
+        db_connection.execute("DELETE FROM segment_groups WHERE segment_id = ?", (segment_id,))
+        db_connection.execute("DELETE FROM segments WHERE id = ?", (segment_id,))
+
+def segment_groups(db_connection, segment_id):
+    """ Return the IDs of a segment's groups, or raise ValueError if there is no such segment """
+    if db_connection.execute("SELECT 1 FROM segments WHERE id = ?", (segment_id,)).fetchone() is None:
+        raise ValueError(f"No segment with ID {segment_id}")
+    cursor = db_connection.execute(
+        "SELECT group_id FROM segment_groups WHERE segment_id = ? ORDER BY group_id", (segment_id,)
+    )
+    return [row[0] for row in cursor]
+
+def list_segments(db_connection):
+    """ Return (segment_id, name, group_ids) for every saved segment, by name """
+    segments = db_connection.execute("SELECT id, name FROM segments ORDER BY name").fetchall()
+    groups = {}
+    for segment_id, group_id in db_connection.execute("SELECT segment_id, group_id FROM segment_groups"):
+        groups.setdefault(segment_id, []).append(group_id)
+    return [(segment_id, name, sorted(groups.get(segment_id, []))) for segment_id, name in segments]
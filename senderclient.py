@@ -0,0 +1,206 @@
+import os
+import sys
+import json
+import atexit
+import logging
+import platform
+import itertools
+import threading
+import subprocess
+from concurrent.futures import Future
+from progress import read_events
+
+def resource_path(relative_path):
+    """ Get absolute path to resource, works for PyInstaller """
+    base_path = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_path, relative_path)
+
+def get_executable_name():
+    """ Return the name of the packaged sender service based on the operating system """
+    os_name = platform.system().lower()
+    if os_name == 'linux':
+        return 'senderservice-linux'
+    elif os_name == 'windows':
+        return 'senderservice-win.exe'
+    elif os_name == 'darwin':
+        return 'senderservice-macos'
+    else:
+        raise RuntimeError(f"Unsupported OS: {os_name}")
+
+def get_service_command(fake=False, session=None):
+    """ Return the command that starts the sender service, preferring the packaged executable.
+
+    `session` selects an additional WhatsApp account by its LocalAuth client ID.
+    """
+    executable_path = resource_path(get_executable_name())
+    if os.path.exists(executable_path):
+        command = [executable_path]
+    else:
+        command = ['node', resource_path('senderservice.js')]
+    if session:
+        command.extend(['--session', session])
+    if fake:
+        command.append('--fake')
+    return command
+
+class SenderServiceError(Exception):
+    """ Raised when the sender service cannot be reached or stops unexpectedly """
+
+class SenderClient:
+    """ Client for the long-lived sender service (senderservice.js).
+
+    The service is started once and kept warm, so the WhatsApp session is only
+    restored on the first send. Requests go to the service's stdin as JSON
+    lines and it answers with a newline-delimited JSON event stream on stdout;
+    each send returns a Future resolved with its 'sent' or 'failed' event.
+    """
+
+    def __init__(self, command=None, fake=False, session=None):
+        self.command = command or get_service_command(fake=fake, session=session)
+        self.process = None
+        self.ready = threading.Event()
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._reader = None
+        self._receipt_listeners = []
+
+    def start(self):
+        """ Start the service if it is not already running """
+        with self._lock:
+            if self.is_running():
+                return
+            logging.info(f"Starting sender service: {' '.join(self.command)}")
+            self.ready.clear()
+            try:
+                self.process = subprocess.Popen(
+                    self.command,
+                    stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                    text=True, encoding='utf-8', bufsize=1
+                )
+            except OSError as e:
+                raise SenderServiceError(f"Failed to start sender service: {e}")
+            self._reader = threading.Thread(target=self._read_loop, args=(self.process,), daemon=True)
+            self._reader.start()
+
+    def is_running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def wait_ready(self, timeout=None):
+        """ Block until the WhatsApp client behind the service is ready """
+        self.start()
+        return self.ready.wait(timeout)
+
+    def send(self, to, message, media=None):
+        """ Submit a single message and return a Future for its result event.
+
+        `media` is a descriptor from MediaCache.descriptor(); the service
+        prepares each distinct file once and sends `message` as its caption.
+        """
+        self.start()
+        request_id = next(self._ids)
+        future = Future()
+        with self._lock:
+            self._pending[request_id] = future
+        request = {'type': 'send', 'id': request_id, 'to': to, 'message': message}
+        if media is not None:
+            request['media'] = media
+        try:
+            self._write(request)
+        except SenderServiceError as e:
+            with self._lock:
+                self._pending.pop(request_id, None)
+            future.set_exception(e)
+        return future
+
+    def check_numbers(self, phones):
+        """ Ask which phone numbers (E.164 digits) have a WhatsApp account.
+
+        Returns a Future resolved with a dict of phone -> bool; numbers the
+        service could not look up are missing from it.
+        """
+        self.start()
+        request_id = next(self._ids)
+        future = Future()
+        with self._lock:
+            self._pending[request_id] = future
+        try:
+            self._write({'type': 'check', 'id': request_id, 'numbers': list(phones)})
+        except SenderServiceError as e:
+            with self._lock:
+                self._pending.pop(request_id, None)
+            future.set_exception(e)
+        return future
+
+    def add_receipt_listener(self, listener):
+        """ Call `listener(message_id, ack)` for every delivery or read receipt, on the reader thread """
+        if listener not in self._receipt_listeners:
+            self._receipt_listeners.append(listener)
+
+    def stop(self, timeout=5):
+        """ Ask the service to shut down and wait for it to exit """
+        process = self.process
+        if process is None or process.poll() is not None:
+            return
+        try:
+            self._write({'type': 'shutdown'})
+            process.stdin.close()
+            process.wait(timeout)
+        except (SenderServiceError, OSError, subprocess.TimeoutExpired):
+            process.kill()
+            process.wait()
+
+    def _write(self, payload):
+        process = self.process
+        if process is None or process.poll() is not None:
+            raise SenderServiceError("Sender service is not running")
+        try:
+            with self._lock:
+                process.stdin.write(json.dumps(payload) + '\n')
+                process.stdin.flush()
+        except (OSError, ValueError) as e:
+            raise SenderServiceError(f"Failed to write to sender service: {e}")
+
+    def _read_loop(self, process):
+        for event in read_events(process.stdout):
+            self._handle_event(event)
+
+        # The service exited: fail everything still waiting for a result
+        return_code = process.wait()
+        self.ready.clear()
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(SenderServiceError(f"Sender service exited with return code {return_code}"))
+
+    def _handle_event(self, event):
+        kind = event.get('event')
+        if kind == 'ready':
+            logging.info('Sender service is ready.')
+            self.ready.set()
+        elif kind in ('sent', 'failed'):
+            with self._lock:
+                future = self._pending.pop(event.get('id'), None)
+            if future is not None:
+                future.set_result(event)
+        elif kind == 'checked':
+            with self._lock:
+                future = self._pending.pop(event.get('id'), None)
+            if future is not None:
+                future.set_result(event.get('results') or {})
+        elif kind == 'message_ack':
+            for listener in self._receipt_listeners:
+                listener(event.get('message_id'), event.get('ack'))
+        elif kind in ('error', 'fatal', 'disconnected'):
+            logging.error(f"Sender service {kind}: {event.get('error') or event.get('reason')}")
+
+_client = None
+
+def get_sender_client():
+    """ Return the shared sender client, starting the service on first use """
+    global _client
+    if _client is None:
+        _client = SenderClient()
+        atexit.register(_client.stop)
+    _client.start()
+    return _client
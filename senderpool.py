@@ -0,0 +1,326 @@
+import os
+import re
+import json
+import time
+import bisect
+import atexit
+import hashlib
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+from dispatch import Dispatcher, RateLimiter, DEFAULT_MAX_IN_FLIGHT, DEFAULT_PER_SECOND, DEFAULT_PER_MINUTE
+from retry import is_throttled
+from progress import is_sent
+from senderclient import SenderClient, SenderServiceError, get_sender_client
+
+# Lists the sending accounts, e.g. ["default", "sales2"]; without it the single default session is used
+SESSIONS_FILE = 'sender_sessions.json'
+# The session LocalAuth created before multi-account support, kept under .wwebjs_auth/session
+DEFAULT_SESSION = 'default'
+_SESSION_ID = re.compile(r'^[A-Za-z0-9_-]+$')
+
+class HashRing:
+    """ Consistent hash ring: a key keeps its node unless that node is skipped.
+
+    Each node is placed at `replicas` points so keys spread evenly; skipping
+    an unavailable node moves only its keys, onto the next nodes clockwise.
+    """
+
+    def __init__(self, nodes, replicas=100):
+        self.points = sorted(
+            (self._hash(f"{node}#{replica}"), node) for node in nodes for replica in range(replicas)
+        )
+        self.hashes = [point for point, _ in self.points]
+        self.nodes = list(dict.fromkeys(nodes))
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+    def node_for(self, key, skip=lambda node: False):
+        """ Return the first node clockwise from `key` that is not skipped, or None """
+        if not self.points:
+            return None
+        start = bisect.bisect(self.hashes, self._hash(key))
+        seen = set()
+        for offset in range(len(self.points)):
+            _, node = self.points[(start + offset) % len(self.points)]
+            if node in seen:
+                continue
+            if not skip(node):
+                return node
+            seen.add(node)
+            if len(seen) == len(self.nodes):
+                break
+        return None
+
+class _Request:
+    def __init__(self, to, message, media):
+        self.to = to
+        self.message = message
+        self.media = media
+        self.future = Future()
+        self.excluded = set()  # Sessions that already failed this request
+        self.trial = False  # Sent to an unhealthy session to see whether it recovered
+
+class PoolSession:
+    """ One WhatsApp account: its client, its own rate limits and its health """
+
+    def __init__(self, session_id, client, limiter, max_in_flight):
+        self.session_id = session_id
+        self.client = client
+        self.limiter = limiter
+        self.queue = deque()
+        self.slots = threading.Semaphore(max_in_flight)
+        self.healthy = True
+        self.retry_at = 0.0
+        self.consecutive_failures = 0
+        self.sent = 0
+        self.failed = 0
+        self.last_error = None
+        self.thread = None
+
+    def health(self):
+        return {
+            'session': self.session_id,
+            'healthy': self.healthy,
+            'queued': len(self.queue),
+            'sent': self.sent,
+            'failed': self.failed,
+            'consecutive_failures': self.consecutive_failures,
+            'last_error': self.last_error,
+        }
+
+class SenderPool:
+    """ Sends through several WhatsApp accounts, each a sender service of its own.
+
+    Recipients are sharded by consistent hashing on their chat ID, so a
+    contact is always messaged from the same account. Every session paces
+    itself with its own RateLimiter. A session whose service dies, or that
+    fails `failure_threshold` sends in a row, is taken out of the ring for
+    `retry_after` seconds; its queued sends move to the next sessions on the
+    ring and a send it lost is retried there. Implements the transport
+    interface used by Dispatcher.
+    """
+
+    def __init__(self, session_ids, client_factory=None, per_second=DEFAULT_PER_SECOND,
+                 per_minute=DEFAULT_PER_MINUTE, max_in_flight=DEFAULT_MAX_IN_FLIGHT, failure_threshold=5,
+                 retry_after=300.0, clock=time.monotonic):
+        session_ids = list(dict.fromkeys(session_ids))
+        if not session_ids:
+            raise ValueError("At least one sender session is required.")
+        client_factory = client_factory or (
+            lambda session_id: SenderClient(session=None if session_id == DEFAULT_SESSION else session_id)
+        )
+        self.failure_threshold = failure_threshold
+        self.retry_after = retry_after
+        self.clock = clock
+        self.ring = HashRing(session_ids)
+        self.sessions = {
+            session_id: PoolSession(session_id, client_factory(session_id),
+                                    RateLimiter(per_second, per_minute), max_in_flight)
+            for session_id in session_ids
+        }
+        self.max_in_flight = max_in_flight * len(session_ids)
+        self.condition = threading.Condition()
+        self.closed = False
+        for session in self.sessions.values():
+            session.thread = threading.Thread(target=self._run_session, args=(session,), daemon=True)
+            session.thread.start()
+
+    def create_dispatcher(self, limiter=None, metrics=None, retry_policy=None):
+        """ Return a Dispatcher that keeps every session busy and leaves pacing to the sessions """
+        # Without buckets or backoff the shared limiter only applies campaign pacing, if any
+        return Dispatcher(self, max_in_flight=self.max_in_flight,
+                          limiter=limiter or RateLimiter(0, 0, initial_backoff=0.0, max_backoff=0.0),
+                          metrics=metrics, retry_policy=retry_policy)
+
+    def start(self):
+        """ Start every session's service; a session that cannot start is left out of the ring """
+        for session in self.sessions.values():
+            start = getattr(session.client, 'start', None)
+            if start is None:
+                continue
+            try:
+                start()
+            except SenderServiceError as e:
+                with self.condition:
+                    session.last_error = str(e)
+                    self._mark_unhealthy(session, e)
+
+    def wait_ready(self, timeout=None):
+        """ Wait until every session's service is ready; returns False if any is not """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        ready = True
+        for session in self.sessions.values():
+            if not session.healthy:
+                continue
+            wait_ready = getattr(session.client, 'wait_ready', None)
+            if wait_ready is not None:
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                ready = wait_ready(remaining) and ready
+        return ready
+
+    def check_numbers(self, phones):
+        """ Look numbers up through one healthy session; registration does not depend on the sender """
+        phones = list(phones)
+        with self.condition:
+            session_id = None if self.closed or not phones else self.session_for(phones[0])
+        if session_id is None:
+            future = Future()
+            future.set_result({})
+            return future
+        return self.sessions[session_id].client.check_numbers(phones)
+
+    def add_receipt_listener(self, listener):
+        for session in self.sessions.values():
+            add_receipt_listener = getattr(session.client, 'add_receipt_listener', None)
+            if add_receipt_listener is not None:
+                add_receipt_listener(listener)
+
+    def send(self, to, message, media=None):
+        request = _Request(to, message, media)
+        self._route(request)
+        return request.future
+
+    def health(self):
+        with self.condition:
+            return [session.health() for session in self.sessions.values()]
+
+    def session_for(self, to, excluded=()):
+        """ Return the ID of the session that sends to `to` right now """
+        now = self.clock()
+
+        def skip(session_id):
+            session = self.sessions[session_id]
+            return session_id in excluded or (not session.healthy and now < session.retry_at)
+        return self.ring.node_for(to, skip)
+
+    def _route(self, request):
+        with self.condition:
+            session_id = None if self.closed else self.session_for(request.to, request.excluded)
+            if session_id is not None:
+                self.sessions[session_id].queue.append(request)
+                self.condition.notify_all()
+                return
+        error = 'Sender pool is closed' if self.closed else 'No healthy sender session'
+        request.future.set_result({'event': 'failed', 'to': request.to, 'error': error})
+
+    def _run_session(self, session):
+        while True:
+            with self.condition:
+                while not self.closed and not session.queue:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                request = session.queue.popleft()
+                request.trial = not session.healthy
+            session.slots.acquire()
+            session.limiter.acquire()
+            try:
+                future = session.client.send(request.to, request.message, media=request.media)
+            except Exception as e:
+                self._session_lost(session, request, e)
+                continue
+            future.add_done_callback(lambda future, request=request: self._on_result(session, request, future))
+
+    def _on_result(self, session, request, future):
+        try:
+            event = future.result()
+        except Exception as e:
+            self._session_lost(session, request, e)
+            return
+        session.slots.release()
+        event = dict(event, session=session.session_id)
+        with self.condition:
+            if is_sent(event):
+                session.sent += 1
+                session.consecutive_failures = 0
+                if not session.healthy and request.trial:
+                    logging.info(f'Sender session {session.session_id} recovered.')
+                    session.healthy = True
+            elif not is_throttled(event):
+                session.failed += 1
+                session.consecutive_failures += 1
+                session.last_error = event.get('error')
+                if session.consecutive_failures >= self.failure_threshold and session.healthy:
+                    self._mark_unhealthy(session, event.get('error'))
+                elif request.trial:
+                    session.retry_at = self.clock() + self.retry_after
+        if is_sent(event):
+            session.limiter.succeeded()
+        elif is_throttled(event):
+            session.limiter.throttled()
+        request.future.set_result(event)
+
+    def _session_lost(self, session, request, error):
+        """ The session's service failed the request itself: try the request on another session """
+        if not isinstance(error, SenderServiceError):
+            logging.error(f'Unexpected error from sender session {session.session_id}: {error}')
+        session.slots.release()
+        with self.condition:
+            session.last_error = str(error)
+            if session.healthy:
+                self._mark_unhealthy(session, error)
+            elif request.trial:
+                session.retry_at = self.clock() + self.retry_after
+        request.excluded.add(session.session_id)
+        self._route(request)
+
+    def _mark_unhealthy(self, session, error):
+        """ Take a session out of the ring and move its queue to the others; call with the lock held """
+        logging.warning(f'Sender session {session.session_id} is unhealthy ({error}); rebalancing its queue.')
+        session.healthy = False
+        session.retry_at = self.clock() + self.retry_after
+        moved, session.queue = session.queue, deque()
+        for request in moved:
+            request.excluded.add(session.session_id)
+            session_id = self.session_for(request.to, request.excluded)
+            if session_id is None:
+                request.future.set_result({'event': 'failed', 'to': request.to, 'error': 'No healthy sender session'})
+            else:
+                self.sessions[session_id].queue.append(request)
+        self.condition.notify_all()
+
+    def close(self):
+        """ Stop the session threads and every session's client """
+        with self.condition:
+            self.closed = True
+            pending = [request for session in self.sessions.values() for request in session.queue]
+            for session in self.sessions.values():
+                session.queue.clear()
+            self.condition.notify_all()
+        for request in pending:
+            request.future.set_result({'event': 'failed', 'to': request.to, 'error': 'Sender pool is closed'})
+        for session in self.sessions.values():
+            stop = getattr(session.client, 'stop', None) or getattr(session.client, 'close', None)
+            if stop is not None:
+                stop()
+
+def load_session_ids(path=SESSIONS_FILE):
+    """ Return the configured session IDs, or None when only the default session is used """
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as file:
+        session_ids = json.load(file)
+    if not isinstance(session_ids, list) or not all(isinstance(value, str) and _SESSION_ID.match(value)
+                                                    for value in session_ids):
+        raise ValueError(f"{path} must be a JSON list of session IDs (letters, digits, '-' and '_').")
+    return session_ids if len(session_ids) > 1 else None
+
+_pool = None
+
+def get_sender_transport():
+    """ Return the shared sender pool when several sessions are configured, else the single sender client """
+    global _pool
+    session_ids = load_session_ids()
+    if session_ids is None:
+        return get_sender_client()
+    if _pool is None or set(_pool.sessions) != set(session_ids):
+        if _pool is not None:
+            _pool.close()
+        _pool = SenderPool(session_ids)
+        atexit.register(_pool.close)
+    _pool.start()
+    return _pool
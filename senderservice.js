@@ -0,0 +1,316 @@
+const fs = require('fs');
+const path = require('path');
+const readline = require('readline');
+const EventEmitter = require('events');
+const { sessionId, updateSessionState } = require('./sessionstate');
+
+// Path for the log file
+const logDir = 'logs';
+const logFilePath = path.join(logDir, 'messages.log');
+
+// Ensure the log directory exists
+if (!fs.existsSync(logDir)) {
+    fs.mkdirSync(logDir);
+}
+
+// Utility function to log messages
+function logMessage(message) {
+    const timestamp = new Date().toISOString();
+    fs.appendFile(logFilePath, `${timestamp} - ${message}\n`, (err) => {
+        if (err) process.stderr.write(`Failed to write log: ${err}\n`);
+    });
+}
+
+// stdout carries the protocol, so anything else printed by the libraries goes to stderr
+console.log = (...args) => process.stderr.write(`${args.join(' ')}\n`);
+console.info = console.log;
+
+// Write one event as a single JSON line (newline-delimited JSON)
+function emit(payload) {
+    process.stdout.write(`${JSON.stringify(payload)}\n`);
+}
+
+// WhatsApp Web reports rate limiting through error text only
+function isThrottleError(error) {
+    const text = String(error).toLowerCase();
+    return text.includes('429') || text.includes('rate-overlimit') || text.includes('too many');
+}
+
+// Acknowledgement levels reported by whatsapp-web.js (ACK_SERVER is 1, ACK_PLAYED 4)
+const ACK_DEVICE = 2;
+const ACK_READ = 3;
+
+// The fake client treats numbers in this unassigned country code as not on WhatsApp
+const FAKE_UNREGISTERED_PREFIX = '999';
+
+// In-process stand-in for the whatsapp-web.js client, selected with --fake
+class FakeClient extends EventEmitter {
+    constructor() {
+        super();
+        this.sent = 0;
+    }
+
+    async initialize() {
+        setImmediate(() => this.emit('ready'));
+    }
+
+    async getChatById(chatId) {
+        if (!chatId.endsWith('@c.us')) {
+            throw new Error(`Invalid chat id ${chatId}`);
+        }
+        return {
+            id: { _serialized: chatId },
+            sendMessage: async () => {
+                this.sent += 1;
+                const message = { id: { _serialized: `fake_${this.sent}_${chatId}` }, fromMe: true };
+                // Pretend the recipient's phone gets the message and then reads it
+                setTimeout(() => this.emit('message_ack', message, ACK_DEVICE), 5);
+                setTimeout(() => this.emit('message_ack', message, ACK_READ), 10);
+                return message;
+            }
+        };
+    }
+
+    async isRegisteredUser(chatId) {
+        return !chatId.startsWith(FAKE_UNREGISTERED_PREFIX);
+    }
+
+    async destroy() {}
+}
+
+// Stand-in for whatsapp-web.js's MessageMedia when running with the fake client
+class FakeMessageMedia {
+    constructor(mimetype, data, filename) {
+        this.mimetype = mimetype;
+        this.data = data;
+        this.filename = filename;
+    }
+}
+
+function useFakeClient() {
+    return process.argv.includes('--fake') || process.env.SENDER_FAKE === '1';
+}
+
+// Record login and connection health for the desktop app; the fake client has no real session
+function reportSession(changes) {
+    if (!useFakeClient()) {
+        updateSessionState(changes);
+    }
+}
+
+// Create the WhatsApp client, reusing the LocalAuth session under .wwebjs_auth (one per --session)
+function createClient() {
+    if (useFakeClient()) {
+        logMessage('Using fake WhatsApp client.');
+        return new FakeClient();
+    }
+
+    const { Client, LocalAuth } = require('whatsapp-web.js');
+    const puppeteer = require('puppeteer');
+    return new Client({
+        authStrategy: new LocalAuth(sessionId ? { clientId: sessionId } : {}),
+        puppeteer: {
+            executablePath: puppeteer.executablePath(), // Use Puppeteer's Chromium
+        }
+    });
+}
+
+// Prepared attachments keyed by SHA-256, so a file is read and base64-encoded
+// once per campaign rather than once per recipient
+const MEDIA_CACHE_SIZE = 8;
+const mediaCache = new Map();
+
+function loadMedia(media) {
+    let prepared = mediaCache.get(media.sha256);
+    if (prepared) {
+        // Refresh its position so the least recently used entry is evicted first
+        mediaCache.delete(media.sha256);
+    } else {
+        // Cache the promise so concurrent sends of a new file share one read
+        prepared = fs.promises.readFile(media.path).then((data) => {
+            const MessageMedia = useFakeClient() ? FakeMessageMedia : require('whatsapp-web.js').MessageMedia;
+            return new MessageMedia(media.mimetype, data.toString('base64'), media.filename);
+        });
+        prepared.catch(() => mediaCache.delete(media.sha256));
+    }
+    mediaCache.set(media.sha256, prepared);
+    if (mediaCache.size > MEDIA_CACHE_SIZE) {
+        mediaCache.delete(mediaCache.keys().next().value);
+    }
+    return prepared;
+}
+
+(async () => {
+    const client = createClient();
+    const waiting = []; // Requests received before the client became ready
+    let ready = false;
+    let shuttingDown = false;
+
+    async function sendMessage(request) {
+        const started = Date.now();
+        let lookupMs = null;
+        try {
+            const chat = await client.getChatById(request.to);
+            lookupMs = Date.now() - started;
+            let sent;
+            if (request.media) {
+                const media = await loadMedia(request.media);
+                sent = await chat.sendMessage(media, { caption: request.message || undefined });
+            } else {
+                sent = await chat.sendMessage(request.message);
+            }
+            logMessage(`Message sent to ${request.to}`);
+            emit({
+                event: 'sent',
+                id: request.id,
+                to: request.to,
+                // Delivery and read receipts refer to the message by this ID
+                message_id: sent && sent.id ? sent.id._serialized : null,
+                latency_ms: Date.now() - started,
+                lookup_ms: lookupMs
+            });
+        } catch (error) {
+            const errorMessage = `Error sending message to ${request.to}: ${error}`;
+            logMessage(errorMessage);
+            emit({
+                event: 'failed',
+                id: request.id,
+                to: request.to,
+                latency_ms: Date.now() - started,
+                lookup_ms: lookupMs,
+                throttled: isThrottleError(error),
+                error: String(error)
+            });
+        }
+    }
+
+    // Report which numbers have a WhatsApp account. Lookups run a few at a time;
+    // a number whose lookup fails is left out of the results rather than guessed.
+    const CHECK_CONCURRENCY = 8;
+
+    async function checkNumbers(request) {
+        const numbers = request.numbers || [];
+        const results = {};
+        let next = 0;
+        async function worker() {
+            while (next < numbers.length) {
+                const number = numbers[next++];
+                try {
+                    results[number] = await client.isRegisteredUser(`${number}@c.us`);
+                } catch (error) {
+                    logMessage(`Error checking ${number}: ${error}`);
+                }
+            }
+        }
+        const started = Date.now();
+        await Promise.all(Array.from({ length: Math.min(CHECK_CONCURRENCY, numbers.length) }, worker));
+        emit({ event: 'checked', id: request.id, results, latency_ms: Date.now() - started });
+    }
+
+    async function shutdown() {
+        if (shuttingDown) return;
+        shuttingDown = true;
+        logMessage('Shutting down sender service.');
+        try {
+            await client.destroy();
+        } catch (error) {
+            logMessage(`Error destroying client: ${error}`);
+        }
+        reportSession({ state: 'stopped', connected: false });
+        process.exit(0);
+    }
+
+    function handleRequest(request) {
+        switch (request.type) {
+            case 'send':
+                if (!ready) {
+                    waiting.push(request);
+                } else {
+                    sendMessage(request);
+                }
+                break;
+            case 'check':
+                if (!ready) {
+                    waiting.push(request);
+                } else {
+                    checkNumbers(request);
+                }
+                break;
+            case 'ping':
+                emit({ event: 'pong', id: request.id, ready });
+                break;
+            case 'shutdown':
+                shutdown();
+                break;
+            default:
+                emit({ event: 'error', id: request.id, error: `Unknown request type: ${request.type}` });
+        }
+    }
+
+    client.on('qr', (qr) => {
+        // The stored session is gone; the app shows this code until it is scanned
+        reportSession({ state: 'qr', loggedIn: false, connected: false, qr, qrImage: null });
+    });
+
+    client.on('authenticated', () => {
+        reportSession({ state: 'authenticated', qr: null, qrImage: null, lastError: null });
+    });
+
+    client.on('auth_failure', (message) => {
+        reportSession({ state: 'auth_failure', loggedIn: false, connected: false, lastError: String(message) });
+    });
+
+    client.on('ready', () => {
+        ready = true;
+        reportSession({ state: 'ready', loggedIn: true, connected: true, qr: null, qrImage: null, lastError: null });
+        logMessage('Client is ready!');
+        emit({ event: 'ready' });
+        while (waiting.length > 0) {
+            const request = waiting.shift();
+            if (request.type === 'check') {
+                checkNumbers(request);
+            } else {
+                sendMessage(request);
+            }
+        }
+    });
+
+    client.on('message_ack', (message, ack) => {
+        if (message.fromMe) {
+            emit({ event: 'message_ack', message_id: message.id._serialized, ack });
+        }
+    });
+
+    client.on('disconnected', (reason) => {
+        logMessage(`Client disconnected: ${reason}`);
+        const changes = { state: 'disconnected', connected: false, lastError: String(reason) };
+        if (reason === 'LOGOUT') {
+            changes.loggedIn = false;
+        }
+        reportSession(changes);
+        emit({ event: 'disconnected', reason: String(reason) });
+    });
+
+    // One JSON request per line on stdin
+    const input = readline.createInterface({ input: process.stdin });
+    input.on('line', (line) => {
+        if (!line.trim()) return;
+        try {
+            handleRequest(JSON.parse(line));
+        } catch (error) {
+            emit({ event: 'error', error: `Invalid request: ${error}` });
+        }
+    });
+    // The Python side closing the pipe means it has gone away
+    input.on('close', shutdown);
+
+    try {
+        await client.initialize();
+    } catch (err) {
+        const errorMessage = `Error during initialization: ${err}`;
+        logMessage(errorMessage);
+        reportSession({ state: 'error', connected: false, lastError: errorMessage });
+        emit({ event: 'fatal', error: errorMessage });
+        process.exit(1);
+    }
+})();
@@ -2,10 +2,10 @@ const fs = require('fs');
 const path = require('path');
 const { Client, LocalAuth } = require('whatsapp-web.js');
 const puppeteer = require('puppeteer'); // Full Puppeteer package
+const { updateSessionState } = require('./sessionstate');
 
-// Path for the log file and client status file
+// Path for the log file
 const logFilePath = 'logs/messages.log';
-const statusFilePath = 'client_status.json';
 
 // Utility function to log messages
 function logMessage(message) {
@@ -15,15 +15,6 @@ function logMessage(message) {
     });
 }
 
-// Utility function to create client status file if it does not exist
-function ensureStatusFile() {
-    if (!fs.existsSync(statusFilePath)) {
-        const initialStatus = { status: 'initialized', lastUpdated: new Date().toISOString() };
-        fs.writeFileSync(statusFilePath, JSON.stringify(initialStatus, null, 2), 'utf8');
-        logMessage('Created client_status.json file.');
-    }
-}
-
 async function getChromiumPath() {
     // Check if Chrome or Chromium is already installed
     const chromiumPath = puppeteer.executablePath();
@@ -38,8 +29,6 @@ async function ensureChromium() {
 
 (async () => {
     try {
-        ensureStatusFile(); // Ensure status file is created
-
         const chromiumPath = await ensureChromium();
 
         const client = new Client({
@@ -51,7 +40,7 @@ async function ensureChromium() {
 
         client.on('ready', () => {
             logMessage('Client is ready!');
-            updateStatusFile('Client is ready');
+            updateSessionState({ state: 'ready', loggedIn: true, connected: true, lastError: null });
             processMessages();
         });
 
@@ -108,15 +97,6 @@ async function ensureChromium() {
             });
         }
 
-        function updateStatusFile(status) {
-            const statusData = {
-                status: status,
-                lastUpdated: new Date().toISOString()
-            };
-            fs.writeFileSync(statusFilePath, JSON.stringify(statusData, null, 2), 'utf8');
-            logMessage(`Updated client_status.json: ${status}`);
-        }
-
         client.initialize();
     } catch (err) {
         const errorMessage = `Error during initialization: ${err}`;
@@ -1,44 +1,82 @@
 import os
 import sys
 import sqlite3
-import json
+import logging
 import traceback
-import bs4
-from PyQt5.QtWidgets import (QApplication, QDialog, QVBoxLayout, QPushButton, QComboBox, QLabel, QProgressBar, QMessageBox)
-from PyQt5.QtWebEngineWidgets import QWebEngineView
-from PyQt5.QtCore import QUrl, QThread, pyqtSignal, QTimer
-import subprocess
-import platform
+from PyQt5.QtWidgets import (QApplication, QDialog, QVBoxLayout, QPushButton, QComboBox, QLabel, QProgressBar, QMessageBox,
+                             QTableWidget, QTableWidgetItem, QHeaderView, QHBoxLayout, QFileDialog,
+                             QCheckBox, QDateTimeEdit, QListWidget, QListWidgetItem, QInputDialog)
+from PyQt5.QtCore import Qt, QUrl, QObject, QThread, QMetaObject, QDateTime, pyqtSignal, pyqtSlot
+from sendqueue import SendQueue
+from campaign import run_campaign, start_transport
+from progress import ProgressAggregator, ThrottledReporter
+from whatsappmarkup import html_to_whatsapp
+from mediacache import MediaCache
+import metrics
+from scheduler import Scheduler
+from retry import DeadLetters
+import segments
+import database
+import lazyload
+
+# Chromium is only loaded once a composer is opened
+QtWebEngineWidgets = lazyload.lazy_import('PyQt5.QtWebEngineWidgets')
 
 def resource_path(relative_path):
     """ Get absolute path to resource, works for PyInstaller """
     base_path = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
     return os.path.join(base_path, relative_path)
 
-def get_executable_name():
-    """ Return the name of the executable based on the operating system """
-    os_name = platform.system().lower()
-    if os_name == 'linux':
-        return 'sendmessage-linux'
-    elif os_name == 'windows':
-        return 'sendmessage-win.exe'
-    elif os_name == 'darwin':
-        return 'sendmessage-macos'
-    else:
-        raise RuntimeError(f"Unsupported OS: {os_name}")
+class RecipientCountWorker(QObject):
+    """ Counts a selection's deduplicated recipients on its own thread with its own SQLite connection """
+    counted = pyqtSignal(object, int)
+
+    def __init__(self, db_path):
+        super().__init__()
+        self.db_path = db_path
+        self.counter = None
+        self.latest = None  # Set by the window; requests for older selections are skipped
+
+    @pyqtSlot(object)
+    def count(self, group_ids):
+        if group_ids != self.latest:
+            return
+        try:
+            if self.counter is None:
+                self.counter = segments.RecipientCounter(database.connect(self.db_path))
+            self.counted.emit(group_ids, self.counter.count(group_ids))
+        except sqlite3.Error as e:
+            logging.error(f'Failed to count recipients: {e}')
+
+    @pyqtSlot()
+    def close(self):
+        if self.counter is not None:
+            self.counter.db_connection.close()
+            self.counter = None
 
 class SendMessageWindow(QDialog):
-    def __init__(self, db_connection):
+    campaign_scheduled = pyqtSignal(int)  # Job ID, so the main window can arm its timer
+    request_count = pyqtSignal(object)  # Group IDs for the recipient count worker
+
+    def __init__(self, db_connection, web_view=None, embedded=False):
+        """ `web_view` is an editor view that is already loaded, e.g. from EditorViewPool.
+
+        An embedded window is a page of the main window: it stays open and
+        is reset after a campaign instead of closing.
+        """
         super().__init__()
         self.db_connection = db_connection
+        self.web_view = web_view
+        self.embedded = embedded
+        self.send_queue = SendQueue(db_connection)
+        self.dead_letters = DeadLetters(db_connection)
+        self.attachment_path = None
+        self.segment = None  # (segment_id, group IDs) of the saved segment last chosen
+        self.recipient_count = None  # (group IDs, count) from the last finished count
+        self.start_recipient_counter()
         self.initUI()
-        
-        # Set up a timer to periodically check for new log messages
-        self.log_file_path = 'messages.log'
-        self.log_check_timer = QTimer()
-        self.log_check_timer.timeout.connect(self.read_log_file)
-        self.log_check_timer.start(1000)  # Check every 1000 ms (1 second)
-        self.last_log_position = 0  # To keep track of where we are in the log file
+        self.update_resume_button()
+        self.update_retry_button()
 
     def initUI(self):
         self.setWindowTitle('Send Message')
@@ -46,27 +84,94 @@ class SendMessageWindow(QDialog):
 
         layout = QVBoxLayout()
 
-        # Group selection dropdown
-        self.group_dropdown = QComboBox()
+        # Groups to send to; a contact in several of them gets the message once
+        layout.addWidget(QLabel("Select Groups:"))
+        self.group_list = QListWidget()
+        self.group_list.setMaximumHeight(150)
+        self.group_list.itemChanged.connect(self.update_recipient_preview)
+        layout.addWidget(self.group_list)
+
+        # Saved segments: named combinations of groups
+        segment_layout = QHBoxLayout()
+        self.segment_dropdown = QComboBox()
+        self.segment_dropdown.activated.connect(self.choose_segment)
+        segment_layout.addWidget(self.segment_dropdown, 1)
+        save_segment_button = QPushButton('Save as Segment')
+        save_segment_button.clicked.connect(self.save_segment)
+        segment_layout.addWidget(save_segment_button)
+        delete_segment_button = QPushButton('Delete Segment')
+        delete_segment_button.clicked.connect(self.delete_segment)
+        segment_layout.addWidget(delete_segment_button)
+        layout.addLayout(segment_layout)
+        self.recipient_label = QLabel("No groups selected")
+        layout.addWidget(self.recipient_label)
         self.populate_groups()
-        layout.addWidget(QLabel("Select Group:"))
-        layout.addWidget(self.group_dropdown)
+        self.populate_segments()
 
-        # CKEditor text editor
-        self.web_view = QWebEngineView()
-        self.load_ckeditor_editor()
+        # CKEditor text editor, reusing a pre-loaded view when one was given
+        if self.web_view is None:
+            self.web_view = QtWebEngineWidgets.QWebEngineView()
+            self.load_ckeditor_editor()
         layout.addWidget(self.web_view)
+        layout.addWidget(QLabel("Personalize with {name}, {phone} or custom fields such as {company}; "
+                                "{name|friend} falls back to 'friend'."))
+
+        # Optional attachment; the message text becomes its caption
+        attachment_layout = QHBoxLayout()
+        attach_button = QPushButton('Attach File')
+        attach_button.clicked.connect(self.choose_attachment)
+        attachment_layout.addWidget(attach_button)
+        self.attachment_label = QLabel('No attachment')
+        attachment_layout.addWidget(self.attachment_label, 1)
+        self.remove_attachment_button = QPushButton('Remove')
+        self.remove_attachment_button.clicked.connect(self.remove_attachment)
+        self.remove_attachment_button.setVisible(False)
+        attachment_layout.addWidget(self.remove_attachment_button)
+        layout.addLayout(attachment_layout)
+
+        # Optional start time and delivery window, e.g. spread 10k messages between 08:00 and 10:00
+        schedule_layout = QHBoxLayout()
+        self.schedule_checkbox = QCheckBox('Send at')
+        schedule_layout.addWidget(self.schedule_checkbox)
+        self.start_time_edit = QDateTimeEdit(QDateTime.currentDateTime().addSecs(3600))
+        self.start_time_edit.setCalendarPopup(True)
+        schedule_layout.addWidget(self.start_time_edit)
+        self.window_checkbox = QCheckBox('spread until')
+        schedule_layout.addWidget(self.window_checkbox)
+        self.window_end_edit = QDateTimeEdit(QDateTime.currentDateTime().addSecs(3 * 3600))
+        self.window_end_edit.setCalendarPopup(True)
+        schedule_layout.addWidget(self.window_end_edit)
+        layout.addLayout(schedule_layout)
 
         # Send button
         send_button = QPushButton('Send Message')
         send_button.clicked.connect(self.send_message)
         layout.addWidget(send_button)
 
+        # Resume button, shown when an earlier campaign was interrupted
+        self.resume_button = QPushButton('Resume Interrupted Campaign')
+        self.resume_button.clicked.connect(self.resume_campaign)
+        layout.addWidget(self.resume_button)
+
+        # Retry button, shown when the last campaign with failures left recipients in the dead letters
+        self.retry_button = QPushButton()
+        self.retry_button.clicked.connect(self.retry_failed)
+        layout.addWidget(self.retry_button)
+
         # Progress bar
         self.progress_bar = QProgressBar()
         self.progress_bar.setValue(0)
         layout.addWidget(self.progress_bar)
 
+        # Running totals and failed recipients, updated from the sender's event stream
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
+        self.failure_table = QTableWidget(0, 2)
+        self.failure_table.setHorizontalHeaderLabels(['Recipient', 'Error'])
+        self.failure_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        self.failure_table.setVisible(False)
+        layout.addWidget(self.failure_table)
+
         self.setLayout(layout)
 
     def load_ckeditor_editor(self):
@@ -75,73 +180,304 @@ class SendMessageWindow(QDialog):
         html_file_path = os.path.join(base_dir, 'static/ckeditor/index.html')
         self.web_view.setUrl(QUrl.fromLocalFile(html_file_path))
 
-    def populate_groups(self):
+    def populate_groups(self, checked=()):
+        self.group_list.blockSignals(True)
         try:
-            cursor = self.db_connection.cursor()
-            cursor.execute("SELECT id, name FROM groups")
-            groups = cursor.fetchall()
-            for group in groups:
-                self.group_dropdown.addItem(group[1], group[0])
+            self.group_list.clear()
+            cursor = self.db_connection.execute("SELECT id, name, member_count FROM groups ORDER BY name")
+            for group_id, name, member_count in cursor:
+                item = QListWidgetItem(f"{name} ({member_count})")
+                item.setData(Qt.UserRole, group_id)
+                item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+                item.setCheckState(Qt.Checked if group_id in checked else Qt.Unchecked)
+                self.group_list.addItem(item)
         except sqlite3.Error as e:
             self.show_error_message(f"Database error: {e}")
+        finally:
+            self.group_list.blockSignals(False)
+        self.update_recipient_preview()
 
-    def get_contacts_for_group(self, group_id):
+    def populate_segments(self):
+        self.segment_dropdown.clear()
+        self.segment_dropdown.addItem('Saved segments', None)
         try:
-            cursor = self.db_connection.cursor()
-            cursor.execute("""
-                SELECT contacts.phone FROM contacts
-                INNER JOIN group_contacts ON contacts.id = group_contacts.contact_id
-                WHERE group_contacts.group_id = ?
-            """, (group_id,))
-            contacts = [row[0] for row in cursor.fetchall()]
-            return contacts
+            for segment_id, name, group_ids in segments.list_segments(self.db_connection):
+                self.segment_dropdown.addItem(f"{name} ({len(group_ids)} groups)", segment_id)
         except sqlite3.Error as e:
             self.show_error_message(f"Database error: {e}")
-            return []
 
-    def send_message(self):
-        group_id = self.group_dropdown.currentData()
-        contacts = self.get_contacts_for_group(group_id)
+    def refresh(self):
+        """ Reload the groups and segments, keeping the current selection """
+        self.populate_groups(set(self.selected_group_ids()))
+        self.populate_segments()
+        self.update_resume_button()
+        self.update_retry_button()
+
+    def selected_group_ids(self):
+        return [self.group_list.item(row).data(Qt.UserRole) for row in range(self.group_list.count())
+                if self.group_list.item(row).checkState() == Qt.Checked]
+
+    def choose_segment(self, index):
+        """ Check exactly the groups of the chosen segment """
+        segment_id = self.segment_dropdown.itemData(index)
+        if segment_id is None:
+            return
+        try:
+            group_ids = segments.segment_groups(self.db_connection, segment_id)
+        except (ValueError, sqlite3.Error) as e:
+            self.show_error_message(str(e))
+            return
+        self.segment = (segment_id, frozenset(group_ids))
+        self.populate_groups(set(group_ids))
+
+    def save_segment(self):
+        group_ids = self.selected_group_ids()
+        if not group_ids:
+            self.show_error_message("Select the groups to save as a segment first.")
+            return
+        name, ok = QInputDialog.getText(self, 'Save as Segment', 'Segment name:')
+        if not ok:
+            return
+        try:
+            segment_id = segments.create_segment(self.db_connection, name, group_ids)
+        except (ValueError, sqlite3.Error) as e:
+            self.show_error_message(str(e))
+            return
+        self.segment = (segment_id, frozenset(group_ids))
+        self.populate_segments()
+        self.segment_dropdown.setCurrentIndex(self.segment_dropdown.findData(segment_id))
 
-        if not contacts:
-            self.show_error_message("No contacts found for the selected group.")
+    def delete_segment(self):
+        segment_id = self.segment_dropdown.currentData()
+        if segment_id is None:
+            return
+        try:
+            segments.delete_segment(self.db_connection, segment_id)
+        except sqlite3.Error as e:
+            self.show_error_message(f"Database error: {e}")
+            return
+        self.segment = None
+        self.populate_segments()
+
+    def start_recipient_counter(self):
+        """ Count recipients on a worker thread, since a union of large groups takes a moment """
+        self.count_thread = QThread()
+        self.count_worker = RecipientCountWorker(database.database_path(self.db_connection))
+        self.count_worker.moveToThread(self.count_thread)
+        self.request_count.connect(self.count_worker.count)
+        self.count_worker.counted.connect(self.on_recipients_counted)
+        self.count_thread.start()
+
+    def shutdown(self):
+        """ Stop the recipient count worker; call before the window is destroyed """
+        if self.count_thread.isRunning():
+            # The connection belongs to the worker thread, so close it there
+            QMetaObject.invokeMethod(self.count_worker, 'close', Qt.BlockingQueuedConnection)
+            self.count_thread.quit()
+            self.count_thread.wait()
+
+    def closeEvent(self, event):
+        if not self.embedded:
+            self.shutdown()
+        super().closeEvent(event)
+
+    def update_recipient_preview(self):
+        """ Show the groups' summed size at once, then the deduplicated count when the worker has it """
+        group_ids = frozenset(self.selected_group_ids())
+        if not group_ids:
+            self.recipient_label.setText("No groups selected")
+            return
+        if self.recipient_count and self.recipient_count[0] == group_ids:
+            self.show_recipient_count(self.recipient_count[1])
+        else:
+            try:
+                total = segments.member_total(self.db_connection, group_ids)
+            except sqlite3.Error:
+                total = 0
+            self.recipient_label.setText(f"Up to {total:,} recipients (counting...)")
+        self.count_worker.latest = group_ids
+        self.request_count.emit(group_ids)
+
+    def on_recipients_counted(self, group_ids, count):
+        self.recipient_count = (group_ids, count)
+        if group_ids == frozenset(self.selected_group_ids()):
+            self.show_recipient_count(count)
+
+    def show_recipient_count(self, count):
+        groups = len(self.selected_group_ids())
+        across = f" across {groups} groups, each contact once" if groups > 1 else ""
+        self.recipient_label.setText(f"{count:,} recipients{across}")
+
+    def choose_attachment(self):
+        path, _ = QFileDialog.getOpenFileName(
+            self, 'Attach File', '', 'Images and documents (*.jpg *.jpeg *.png *.gif *.mp4 *.pdf *.doc *.docx '
+                                     '*.xls *.xlsx *.ppt *.pptx *.txt *.csv *.zip);;All files (*)'
+        )
+        if path:
+            self.attachment_path = path
+            self.attachment_label.setText(os.path.basename(path))
+            self.remove_attachment_button.setVisible(True)
+
+    def remove_attachment(self):
+        self.attachment_path = None
+        self.attachment_label.setText('No attachment')
+        self.remove_attachment_button.setVisible(False)
+
+    def send_message(self):
+        group_ids = frozenset(self.selected_group_ids())
+        if not group_ids:
+            self.show_error_message("Select at least one group.")
+            return
+        if self.recipient_count and self.recipient_count[0] == group_ids:
+            has_contacts = self.recipient_count[1] > 0
+        else:
+            try:
+                has_contacts = segments.has_recipients(self.db_connection, group_ids)
+            except sqlite3.Error as e:
+                self.show_error_message(f"Database error: {e}")
+                return
+
+        if not has_contacts:
+            self.show_error_message("No contacts found for the selected groups.")
             return
 
         # Get CKEditor content through JavaScript call
         self.web_view.page().runJavaScript("getCKEditorContent();", self.process_message)
 
     def process_message(self, content):
-        message = bs4.BeautifulSoup(content, 'html.parser').get_text().strip()
+        message = html_to_whatsapp(content)
 
-        if not message:
+        if not message and not self.attachment_path:
             self.show_error_message("Message content is empty.")
             return
 
-        contacts = self.get_contacts_for_group(self.group_dropdown.currentData())
-        contacts = [f"{contact}@c.us" if not contact.endswith('@c.us') else contact for contact in contacts]
+        # Queue one row per recipient so an interrupted send can be resumed
+        campaign_metrics = metrics.Metrics()
+        try:
+            with campaign_metrics.timer('queue_job'):
+                media_sha256 = None
+                if self.attachment_path:
+                    # Hashed and stored once; every recipient's send refers to the same cached file
+                    media_sha256 = MediaCache(self.db_connection).add(self.attachment_path)
+                group_ids = self.selected_group_ids()
+                # Recorded with the job when the groups are still exactly the chosen segment's
+                segment_id = self.segment[0] if self.segment and self.segment[1] == frozenset(group_ids) else None
+                job_id = self.send_queue.create_job(group_ids, message, media_sha256, segment_id)
+        except sqlite3.Error as e:
+            self.show_error_message(f"Database error: {e}")
+            return
+        except (OSError, ValueError) as e:
+            self.show_error_message(f"Could not attach file: {e}")
+            return
 
-        data = {'contacts': contacts, 'message': message}
+        if self.schedule_checkbox.isChecked() or self.window_checkbox.isChecked():
+            self.schedule_campaign(job_id)
+        else:
+            self.start_campaign(job_id, campaign_metrics)
 
-        # Write data to JSON file
-        json_file_path = 'message_data.json'
+    def schedule_campaign(self, job_id):
+        """ Leave a queued job for the scheduler: at the chosen time and/or spread over a window """
+        start_at = self.start_time_edit.dateTime().toSecsSinceEpoch() if self.schedule_checkbox.isChecked() \
+            else QDateTime.currentSecsSinceEpoch()
+        window_end = self.window_end_edit.dateTime().toSecsSinceEpoch() if self.window_checkbox.isChecked() else None
         try:
-            with open(json_file_path, 'w') as json_file:
-                json.dump(data, json_file)
-        except IOError as e:
-            self.show_error_message(f"Error writing to JSON file: {e}")
+            Scheduler(self.db_connection).schedule(job_id, start_at, window_end)
+        except (ValueError, sqlite3.Error) as e:
+            self.send_queue.set_job_status(job_id, 'cancelled')
+            self.show_error_message(f"Could not schedule the campaign: {e}")
             return
+        self.campaign_scheduled.emit(job_id)
+        when = QDateTime.fromSecsSinceEpoch(int(start_at)).toString('yyyy-MM-dd HH:mm')
+        self.show_info_message(f"Campaign scheduled for {when}.")
+        if self.embedded:
+            self.reset_composer()
+
+    def is_sending(self):
+        thread = getattr(self, 'message_sender_thread', None)
+        return thread is not None and thread.isRunning()
 
-        # Start the executable script
-        self.message_sender_thread = MessageSenderThread(json_file_path)
-        self.message_sender_thread.progress.connect(self.progress_bar.setValue)
+    def update_resume_button(self):
+        try:
+            self.unfinished_jobs = self.send_queue.unfinished_jobs()
+        except sqlite3.Error as e:
+            self.show_error_message(f"Database error: {e}")
+            self.unfinished_jobs = []
+        self.resume_button.setVisible(bool(self.unfinished_jobs))
+
+    def update_retry_button(self):
+        try:
+            self.retry_job_id = self.dead_letters.latest_job()
+            failed = sum(self.dead_letters.counts(self.retry_job_id).values()) if self.retry_job_id else 0
+        except sqlite3.Error as e:
+            self.show_error_message(f"Database error: {e}")
+            self.retry_job_id, failed = None, 0
+        self.retry_button.setText(f"Retry {failed} Failed Recipients")
+        self.retry_button.setVisible(bool(failed))
+
+    def retry_failed(self):
+        """ Send the last campaign again to its failed recipients only """
+        if self.retry_job_id is None or self.is_sending():
+            return
+        try:
+            requeued = self.dead_letters.requeue(self.retry_job_id)
+        except sqlite3.Error as e:
+            self.show_error_message(f"Database error: {e}")
+            return
+        if requeued:
+            self.failure_table.setRowCount(0)
+            self.failure_table.setVisible(False)
+            self.start_campaign(self.retry_job_id)
+        else:
+            self.update_retry_button()
+
+    def resume_campaign(self):
+        """ Continue the oldest interrupted campaign from where it stopped """
+        if self.unfinished_jobs:
+            self.start_campaign(self.unfinished_jobs[0])
+
+    def start_campaign(self, job_id, campaign_metrics=None):
+        self.resume_button.setVisible(False)
+        self.retry_button.setVisible(False)
+        self.message_sender_thread = MessageSenderThread(database.database_path(self.db_connection), job_id,
+                                                         campaign_metrics)
+        self.message_sender_thread.progress.connect(self.update_progress)
         self.message_sender_thread.completed.connect(self.on_send_complete)
         self.message_sender_thread.error.connect(self.show_error_message)  # Connect the error signal
+        self.message_sender_thread.finished.connect(self.update_resume_button)
+        self.message_sender_thread.finished.connect(self.update_retry_button)
         self.message_sender_thread.start()
 
+    def update_progress(self, snapshot):
+        """ Apply one aggregated progress update from the sender thread """
+        self.progress_bar.setValue(snapshot['percent'])
+        self.status_label.setText(
+            f"Sent {snapshot['sent']}, failed {snapshot['failed']}, retried {snapshot['retried']} "
+            f"({snapshot['done']} of {snapshot['total']}, avg {snapshot['avg_latency_ms']:.0f} ms)"
+        )
+        if snapshot['new_failures']:
+            self.failure_table.setVisible(True)
+            for recipient, error in snapshot['new_failures']:
+                row = self.failure_table.rowCount()
+                self.failure_table.insertRow(row)
+                self.failure_table.setItem(row, 0, QTableWidgetItem(recipient))
+                self.failure_table.setItem(row, 1, QTableWidgetItem(error))
+
     def on_send_complete(self):
         self.progress_bar.setValue(100)
         self.show_info_message("Messages sent successfully!")
-        self.close()
+        if self.embedded:
+            self.reset_composer()
+        else:
+            self.close()
+
+    def reset_composer(self):
+        """ Clear the editor and attachment so the page is ready for the next campaign """
+        self.web_view.page().runJavaScript("clearCKEditorContent();")
+        self.remove_attachment()
+        self.progress_bar.setValue(0)
+        self.status_label.clear()
+        self.failure_table.setRowCount(0)
+        self.failure_table.setVisible(False)
 
     def show_error_message(self, message):
         QMessageBox.critical(self, 'Error', message)
@@ -149,73 +485,56 @@ class SendMessageWindow(QDialog):
     def show_info_message(self, message):
         QMessageBox.information(self, 'Info', message)
 
-    def read_log_file(self):
-        """ Read from the log file and handle new messages """
-        if not os.path.exists(self.log_file_path):
-            return
-
-        try:
-            with open(self.log_file_path, 'r') as log_file:
-                log_file.seek(self.last_log_position)
-                new_logs = log_file.read()
-                self.last_log_position = log_file.tell()  # Update position
-
-                if new_logs:
-                    self.process_log_messages(new_logs)
-        except Exception as e:
-            self.show_error_message(f"Error reading log file: {e}")
-
-    def process_log_messages(self, logs):
-        """ Process the new logs from the log file """
-        for line in logs.splitlines():
-            if 'Error' in line:
-                self.show_error_message(f"Log Error: {line}")
-            elif 'Info' in line:
-                self.show_info_message(f"Log Info: {line}")
-
 class MessageSenderThread(QThread):
-    progress = pyqtSignal(int)
+    progress = pyqtSignal(dict)  # Aggregated snapshot, at most a few per second
     completed = pyqtSignal()
     error = pyqtSignal(str)  # New signal for error reporting
 
-    def __init__(self, json_file_path):
+    def __init__(self, db_path, job_id, campaign_metrics=None):
         super().__init__()
-        self.json_file_path = json_file_path
+        self.db_path = db_path
+        self.job_id = job_id
+        self.metrics = campaign_metrics or metrics.Metrics()
 
     def run(self):
+        db_connection = None
         try:
-            # Determine the executable based on the OS
-            executable_name = get_executable_name()
-            executable_path = resource_path(executable_name)  # Adjust path to the executable
-            process = subprocess.Popen(
-                [executable_path, self.json_file_path],
-                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
-            )
-
-            while True:
-                output = process.stdout.readline()
-                if output == '' and process.poll() is not None:
-                    break
-                if output and 'Progress:' in output:
-                    progress = int(output.split(':')[1].strip())
-                    self.progress.emit(progress)
-
-            return_code = process.wait()
-            if return_code == 0:
+            # SQLite connections belong to one thread, so the sender opens its own
+            db_connection = database.connect(self.db_path)
+            counts = SendQueue(db_connection).counts(self.job_id)
+            total = sum(counts.values())
+            aggregator = ProgressAggregator(total, done=total - counts.get('pending', 0))
+            self.reporter = ThrottledReporter(aggregator, self.progress.emit)
+
+            transport = start_transport(self.db_path, metrics=self.metrics)
+            stats = run_campaign(db_connection, self.job_id, transport, on_event=self.on_event,
+                                 metrics=self.metrics)
+            self.reporter.flush()
+            metrics.save_campaign(self.metrics, self.job_id, recipients=total, **stats)
+
+            if stats['failed'] == 0:
                 self.completed.emit()
             else:
-                self.error.emit(f"Failed with return code {return_code}")
+                self.error.emit(f"Failed to send {stats['failed']} of {total} messages")
 
         except Exception as e:
             self.error.emit(f"Error in thread: {e}")
+        finally:
+            if db_connection:
+                db_connection.close()
+
+    def on_event(self, item_id, event):
+        """ Called by the dispatcher for every sent, failed and retried event """
+        self.reporter.feed(event)
 
 if __name__ == "__main__":
     # Setup DB connection
     db_connection = None
     try:
         db_path = "contacts.db"  
-        db_connection = sqlite3.connect(db_path)
+        db_connection = database.connect(db_path)
 
+        lazyload.allow_lazy_webengine()
         app = QApplication(sys.argv)
         window = SendMessageWindow(db_connection)
         window.show()
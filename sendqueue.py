@@ -0,0 +1,186 @@
+import time
+import threading
+from segments import recipients_condition
+
+# Item statuses; anything but 'pending' is finished and never read again on resume
+PENDING = 'pending'
+SENT = 'sent'
+FAILED = 'failed'
+SKIPPED = 'skipped'  # Dropped before sending, e.g. by validation.py
+
+class SendQueue:
+    """ Durable per-recipient send queue stored in the send_jobs/send_items tables.
+
+    Results reported with record() may come from any thread; they are buffered
+    and written in batches by flush(), which must run on the thread that owns
+    the connection.
+    """
+
+    def __init__(self, db_connection, batch_size=500, flush_interval=1.0):
+        self.db_connection = db_connection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._results = []
+        self._dead_letters = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def create_job(self, group_id, message, media_sha256=None, segment_id=None):
+        """ Queue a message, optionally with a cached attachment, for every member of a group.
+
+        `group_id` may also be a list of group IDs, e.g. a saved segment's
+        (pass its `segment_id` too): a contact in several of them is queued
+        once. Returns the job ID. `media_sha256` is a hash returned by
+        MediaCache.add().
+        """
+        group_ids = [group_id] if isinstance(group_id, int) else list(dict.fromkeys(group_id))
+        # A single group is kept on the job; the groups of a larger campaign go in send_job_groups
+        job_group_id = group_ids[0] if len(group_ids) == 1 else None
+        # Copy the recipients in SQL, without reading them into Python; suppressed numbers
+        # (see suppression.py) are left out with a primary-key lookup each
+        condition, params = recipients_condition(self.db_connection, group_ids)
+        with self.db_connection:
+            cursor = self.db_connection.execute(
+                "INSERT INTO send_jobs (group_id, message, media_sha256, segment_id) VALUES (?, ?, ?, ?)",
+                (job_group_id, message, media_sha256, segment_id)
+            )
+            job_id = cursor.lastrowid
+            if job_group_id is None:
+                self.db_connection.executemany(
+                    "INSERT INTO send_job_groups (job_id, group_id) VALUES (?, ?)",
+                    ((job_id, group_id) for group_id in group_ids)
+                )
+            self.db_connection.execute(
+                f"INSERT INTO send_items (job_id, contact_id, phone) "
+                f"SELECT ?, id, phone FROM contacts WHERE {condition}",
+                [job_id] + params
+            )
+            self.db_connection.execute("""
+                INSERT INTO campaign_stats (job_id, group_id, recipients)
+                SELECT ?, ?, COUNT(*) FROM send_items WHERE job_id = ?
+            """, (job_id, job_group_id, job_id))
+        return job_id
+
+    def job(self, job_id):
+        """ Return a job as a dict, or None if it does not exist """
+        row = self.db_connection.execute(
+            "SELECT id, group_id, message, status, created_at, media_sha256, scheduled_at, window_end "
+            "FROM send_jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('id', 'group_id', 'message', 'status', 'created_at', 'media_sha256', 'scheduled_at',
+                         'window_end'), row))
+
+    def job_groups(self, job_id):
+        """ Return the IDs of the groups a job was queued for, one or several """
+        cursor = self.db_connection.execute(
+            "SELECT group_id FROM send_job_groups WHERE job_id = ? ORDER BY group_id", (job_id,)
+        )
+        group_ids = [row[0] for row in cursor]
+        if not group_ids:
+            row = self.db_connection.execute("SELECT group_id FROM send_jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is not None and row[0] is not None:
+                group_ids = [row[0]]
+        return group_ids
+
+    def unfinished_jobs(self):
+        """ Return IDs of jobs that were queued or interrupted before they completed, oldest first """
+        cursor = self.db_connection.execute(
+            "SELECT id FROM send_jobs WHERE status IN ('pending', 'running') ORDER BY id"
+        )
+        return [row[0] for row in cursor]
+
+    def counts(self, job_id):
+        """ Return the number of items in each status for a job """
+        cursor = self.db_connection.execute(
+            "SELECT status, COUNT(*) FROM send_items WHERE job_id = ? GROUP BY status", (job_id,)
+        )
+        return dict(cursor.fetchall())
+
+    def is_pending(self, item_id):
+        """ Return True if an item is still to be sent, e.g. not suppressed since it was read """
+        row = self.db_connection.execute("SELECT status FROM send_items WHERE id = ?", (item_id,)).fetchone()
+        return row is not None and row[0] == PENDING
+
+    def pending_items(self, job_id, chunk_size=500):
+        """ Yield (item_id, phone, contact_id) for unfinished items, a chunk at a time.
+
+        Pages by item ID over the (job_id, status, id) index, so finished rows
+        are never read again when a job is resumed.
+        """
+        last_id = 0
+        while True:
+            rows = self.db_connection.execute("""
+                SELECT id, phone, contact_id FROM send_items
+                WHERE job_id = ? AND status = ? AND id > ?
+                ORDER BY id LIMIT ?
+            """, (job_id, PENDING, last_id, chunk_size)).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last_id = rows[-1][0]
+
+    def record(self, item_id, ok, error=None, message_id=None, failure=None, attempts=1):
+        """ Buffer the final result of sending one item; safe to call from any thread.
+
+        `message_id` is WhatsApp's ID for a sent message, which its delivery
+        and read receipts refer to. A failed item is also added to the dead
+        letters (see retry.py) with its kind of `failure` and the number of
+        `attempts` it took.
+        """
+        with self._lock:
+            self._results.append((SENT if ok else FAILED, error, message_id, attempts, item_id))
+            if not ok:
+                self._dead_letters.append((failure or 'unknown', item_id))
+
+    def skip(self, item_id, reason):
+        """ Buffer an item that will not be sent, e.g. because its number is suppressed """
+        with self._lock:
+            self._results.append((SKIPPED, reason, None, 0, item_id))
+
+    def flush_if_due(self):
+        """ Flush when the buffer is full or flush_interval has passed; returns True if it flushed """
+        if len(self._results) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+            return True
+        return False
+
+    def flush(self):
+        """ Write buffered results in a single transaction.
+
+        Only pending items are updated, so a result never overwrites an item
+        skipped in the meantime, e.g. by SuppressionList.add().
+        """
+        with self._lock:
+            results, self._results = self._results, []
+            dead_letters, self._dead_letters = self._dead_letters, []
+        self._last_flush = time.monotonic()
+        if not results:
+            return
+        with self.db_connection:
+            self.db_connection.executemany("""
+                UPDATE send_items
+                SET status = ?, last_error = ?, message_id = ?, attempts = attempts + ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status = 'pending'
+            """, results)
+            self.db_connection.executemany("""
+                INSERT INTO dead_letters (item_id, job_id, phone, failure, error, attempts)
+                SELECT id, job_id, phone, ?, last_error, attempts FROM send_items WHERE id = ? AND status = 'failed'
+                ON CONFLICT (item_id) DO UPDATE SET failure = excluded.failure, error = excluded.error,
+                    attempts = excluded.attempts, created_at = CURRENT_TIMESTAMP
+            """, dead_letters)
+
+    def update_stats(self, job_id):
+        """ Bring the job's sent and failed totals in campaign_stats up to date """
+        counts = self.counts(job_id)  # Counted over the (job_id, status, id) index
+        with self.db_connection:
+            self.db_connection.execute("""
+                UPDATE campaign_stats SET sent = ?, failed = ?, updated_at = CURRENT_TIMESTAMP WHERE job_id = ?
+            """, (counts.get(SENT, 0), counts.get(FAILED, 0), job_id))
+
+    def set_job_status(self, job_id, status):
+        with self.db_connection:
+            self.db_connection.execute(
+                "UPDATE send_jobs SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?", (status, job_id)
+            )
@@ -0,0 +1,139 @@
+import os
+import sys
+import json
+import logging
+from dataclasses import dataclass
+from typing import Optional
+from PyQt5.QtCore import QObject, QFileSystemWatcher, QProcess, QTimer, pyqtSignal
+
+# Written by sessionstate.js on behalf of qrcode.js, status.js and the sender service
+SESSION_STATE_FILE = 'session_state.json'
+# Written by older builds; only its loggedIn flag is understood
+LEGACY_STATUS_FILE = 'client_status.json'
+
+def resource_path(relative_path):
+    """ Get absolute path to resource, works for PyInstaller """
+    base_path = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_path, relative_path)
+
+@dataclass(frozen=True)
+class SessionState:
+    """ Login state, pending QR code and connection health of the WhatsApp session.
+
+    `state` is one of 'unknown', 'starting', 'qr', 'authenticated', 'syncing',
+    'ready', 'disconnected', 'auth_failure', 'error' or 'stopped'.
+    """
+    state: str = 'unknown'
+    logged_in: bool = False
+    qr: Optional[str] = None
+    qr_image: Optional[str] = None
+    connected: bool = False
+    last_error: Optional[str] = None
+    source: Optional[str] = None
+    updated_at: Optional[str] = None
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(
+            state=data.get('state') or 'unknown',
+            logged_in=bool(data.get('loggedIn')),
+            qr=data.get('qr'),
+            qr_image=data.get('qrImage'),
+            connected=bool(data.get('connected')),
+            last_error=data.get('lastError'),
+            source=data.get('source'),
+            updated_at=data.get('updatedAt'),
+        )
+
+    @property
+    def waiting_for_scan(self):
+        return not self.logged_in and self.qr is not None
+
+def read_session_state(path=SESSION_STATE_FILE):
+    """ Return the current SessionState, or None if the file cannot be read right now """
+    if not os.path.exists(path):
+        legacy_path = os.path.join(os.path.dirname(path), LEGACY_STATUS_FILE)
+        try:
+            with open(legacy_path, 'r') as file:
+                return SessionState(logged_in=bool(json.load(file).get('loggedIn')))
+        except (OSError, ValueError, AttributeError):
+            return SessionState()
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            return SessionState.from_json(json.load(file))
+    except (OSError, ValueError) as e:
+        logging.warning(f'Could not read session state: {e}')
+        return None
+
+class SessionService(QObject):
+    """ Watches the session state file and reports changes as Qt signals.
+
+    The Node scripts replace the file with a rename whenever the session
+    changes, so the UI reacts to QFileSystemWatcher notifications instead of
+    polling. The login script runs in a QProcess and never blocks the GUI.
+    """
+    changed = pyqtSignal(object)        # SessionState
+    login_changed = pyqtSignal(bool)
+    qr_changed = pyqtSignal(object)     # SessionState with a new QR code
+    connection_changed = pyqtSignal(bool)
+
+    def __init__(self, path=SESSION_STATE_FILE, parent=None):
+        super().__init__(parent)
+        self.path = os.path.abspath(path)
+        self.state = read_session_state(self.path) or SessionState()
+        self.login_process = None
+
+        # Watch the directory as well: a rename replaces the file and drops the file watch
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.addPath(os.path.dirname(self.path))
+        self.watch_file()
+        self.watcher.directoryChanged.connect(self.schedule_reload)
+        self.watcher.fileChanged.connect(self.schedule_reload)
+
+        # Writers touch the file more than once per update; read it once they settle
+        self.reload_timer = QTimer(self)
+        self.reload_timer.setSingleShot(True)
+        self.reload_timer.setInterval(50)
+        self.reload_timer.timeout.connect(self.reload)
+
+    def watch_file(self):
+        if os.path.exists(self.path) and self.path not in self.watcher.files():
+            self.watcher.addPath(self.path)
+
+    def schedule_reload(self, _path=None):
+        self.reload_timer.start()
+
+    def reload(self):
+        self.watch_file()
+        state = read_session_state(self.path)
+        if state is None or state == self.state:
+            return
+        previous, self.state = self.state, state
+        self.changed.emit(state)
+        if state.logged_in != previous.logged_in:
+            self.login_changed.emit(state.logged_in)
+        if state.qr and (state.qr, state.qr_image) != (previous.qr, previous.qr_image):
+            self.qr_changed.emit(state)
+        if state.connected != previous.connected:
+            self.connection_changed.emit(state.connected)
+
+    def login_running(self):
+        return self.login_process is not None and self.login_process.state() != QProcess.NotRunning
+
+    def start_login(self):
+        """ Run qrcode.js in the background; its QR code and progress arrive as state changes """
+        if self.login_running():
+            return
+        self.login_process = QProcess(self)
+        self.login_process.setProcessChannelMode(QProcess.ForwardedChannels)
+        self.login_process.errorOccurred.connect(
+            lambda error: logging.error(f'Login process failed: {self.login_process.errorString()}')
+        )
+        self.login_process.start('node', [resource_path('qrcode.js')])
+
+    def stop_login(self, timeout_ms=3000):
+        if not self.login_running():
+            return
+        self.login_process.terminate()
+        if not self.login_process.waitForFinished(timeout_ms):
+            self.login_process.kill()
@@ -0,0 +1,48 @@
+const fs = require('fs');
+const path = require('path');
+
+// WhatsApp account selected with --session <id>; each has its own LocalAuth directory
+// (.wwebjs_auth/session-<id>). Without it the original default session is used.
+function sessionArgument() {
+    const index = process.argv.indexOf('--session');
+    const sessionId = index >= 0 ? process.argv[index + 1] : null;
+    if (sessionId && !/^[A-Za-z0-9_-]+$/.test(sessionId)) {
+        throw new Error(`Invalid session id: ${sessionId}`);
+    }
+    return sessionId || null;
+}
+
+// Session state file shared by every script and watched by the desktop app (session.py);
+// additional accounts get a file of their own
+const sessionId = sessionArgument();
+const sessionStateFile = process.env.SESSION_STATE_FILE ||
+    (sessionId ? `session_state_${sessionId}.json` : 'session_state.json');
+
+// Fields: state, loggedIn, qr, qrImage, connected, lastError, source, session, updatedAt
+function readSessionState() {
+    try {
+        return JSON.parse(fs.readFileSync(sessionStateFile, 'utf8'));
+    } catch (err) {
+        return {};
+    }
+}
+
+// Merge `changes` into the stored state. The file is replaced with a rename,
+// so a reader never sees half-written JSON.
+function updateSessionState(changes) {
+    const state = Object.assign(readSessionState(), changes, {
+        source: process.argv[1] ? path.basename(process.argv[1]) : 'node',
+        session: sessionId || 'default',
+        updatedAt: new Date().toISOString()
+    });
+    const tempFile = `${sessionStateFile}.${process.pid}.tmp`;
+    try {
+        fs.writeFileSync(tempFile, JSON.stringify(state, null, 2), 'utf8');
+        fs.renameSync(tempFile, sessionStateFile);
+    } catch (err) {
+        process.stderr.write(`Failed to update ${sessionStateFile}: ${err}\n`);
+    }
+    return state;
+}
+
+module.exports = { sessionId, sessionStateFile, readSessionState, updateSessionState };
@@ -0,0 +1,278 @@
+""" Local simulator of the WhatsApp sender service, for load tests without a phone or an account.
+
+SimulatedTransport is used in-process wherever a SenderClient would be. Run
+as a script, the module speaks the sender service's protocol (JSON lines on
+stdin and stdout, see senderservice.js), so the real SenderClient can be
+pointed at it:
+
+    SenderClient(command=[sys.executable, 'simulator.py', '--latency', '0.2', '--rate-limit', '600'])
+"""
+import sys
+import json
+import time
+import math
+import heapq
+import random
+import argparse
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+# WhatsApp's acknowledgement levels, as in receipts.py
+ACK_DEVICE = 2
+ACK_READ = 3
+
+class SimulatedTransport:
+    """ Stand-in for SenderClient with configurable latency, throttling and failures.
+
+    Sends are processed by `workers` simulated slots, each send taking
+    `latency` seconds scaled by a log-normal factor with sigma `jitter`.
+    Above `rate_limit` sends in any 60 seconds, sends fail as throttled, as
+    WhatsApp's do. `throttle_rate`, `failure_rate` and `permanent_rate` add
+    random rate-limit, transient and permanent failures (see retry.py), and
+    numbers starting with `unregistered_prefix` are not on WhatsApp. Sent
+    messages are delivered with probability `delivery_rate` and then read
+    with probability `read_rate`, each reported to receipt listeners after
+    about `receipt_delay` seconds.
+
+    Nothing sleeps per send: one scheduler thread resolves each Future when
+    its simulated time is up, so sends in flight cost a heap entry each
+    instead of a thread. With `record`, every request is kept in `received`
+    as (to, message, media sha256); `counts` tallies the outcomes either way.
+    """
+
+    def __init__(self, latency=0.05, jitter=0.5, workers=8, rate_limit=None, throttle_rate=0.0, failure_rate=0.0,
+                 permanent_rate=0.0, unregistered_prefix='999', delivery_rate=0.0, read_rate=0.0, receipt_delay=2.0,
+                 check_latency=0.05, record=True, seed=None, clock=time.monotonic):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.throttle_rate = throttle_rate
+        self.failure_rate = failure_rate
+        self.permanent_rate = permanent_rate
+        self.unregistered_prefix = unregistered_prefix
+        self.delivery_rate = delivery_rate
+        self.read_rate = read_rate
+        self.receipt_delay = receipt_delay
+        self.check_latency = check_latency
+        self.record = record
+        self.clock = clock
+        self.random = random.Random(seed)
+        self.received = []
+        self.counts = {'received': 0, 'sent': 0, 'throttled': 0, 'failed': 0, 'checked': 0, 'receipts': 0}
+
+        self._slots = [0.0] * workers if workers else None  # When each worker is next free
+        self._recent = deque()  # Start times of the sends in the last minute, for rate_limit
+        self._ids = itertools.count(1)
+        self._sequence = itertools.count()
+        self._events = []  # Heap of (due, sequence, callback)
+        self._receipt_listeners = []
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def start(self):
+        pass
+
+    def wait_ready(self, timeout=None):
+        return not self._stopped
+
+    def add_receipt_listener(self, listener):
+        if listener not in self._receipt_listeners:
+            self._receipt_listeners.append(listener)
+
+    def send(self, to, message, media=None, request_id=None):
+        """ Return a Future resolved with a 'sent' or 'failed' event when the simulated send finishes """
+        future = Future()
+        request_id = request_id if request_id is not None else next(self._ids)
+        phone = to.split('@')[0]
+        with self._condition:
+            if self._stopped:
+                future.set_result({'event': 'failed', 'id': request_id, 'to': to, 'error': 'Sender service stopped'})
+                return future
+            now = self.clock()
+            self.counts['received'] += 1
+            if self.record:
+                self.received.append((to, message, media['sha256'] if media else None))
+            event = self._outcome(request_id, to, phone, now)
+            if self._slots is None:
+                start = now
+            else:
+                start = max(now, heapq.heappop(self._slots))
+            duration = self.latency * (self.random.lognormvariate(0, self.jitter) if self.jitter else 1.0)
+            done = start + duration
+            if self._slots is not None:
+                heapq.heappush(self._slots, done)
+            event['latency_ms'] = round(duration * 1000, 3)
+            event['lookup_ms'] = round(duration * 300, 3)  # The chat lookup is about a third of a send
+            self._schedule(done, lambda: future.set_result(event))
+            if event['event'] == 'sent':
+                self._schedule_receipts(event['message_id'], done)
+        return future
+
+    def _outcome(self, request_id, to, phone, now):
+        # Called with the lock held
+        if self.rate_limit:
+            while self._recent and now - self._recent[0] >= 60:
+                self._recent.popleft()
+            if len(self._recent) >= self.rate_limit:
+                self.counts['throttled'] += 1
+                return {'event': 'failed', 'id': request_id, 'to': to, 'throttled': True,
+                        'error': 'Error: rate limit exceeded'}
+            self._recent.append(now)
+        roll = self.random.random()
+        if roll < self.throttle_rate:
+            self.counts['throttled'] += 1
+            return {'event': 'failed', 'id': request_id, 'to': to, 'throttled': True,
+                    'error': 'Error: rate limit exceeded'}
+        error = None
+        if self.unregistered_prefix and phone.startswith(self.unregistered_prefix):
+            error = 'Error: not registered'
+        elif roll < self.throttle_rate + self.failure_rate:
+            error = 'Error: Protocol error (Runtime.callFunctionOn): Target closed.'
+        elif roll < self.throttle_rate + self.failure_rate + self.permanent_rate:
+            error = 'Error: wid error: invalid wid'
+        if error is not None:
+            self.counts['failed'] += 1
+            return {'event': 'failed', 'id': request_id, 'to': to, 'error': error}
+        self.counts['sent'] += 1
+        return {'event': 'sent', 'id': request_id, 'to': to, 'message_id': f"true_{to}_SIM{request_id:012X}"}
+
+    def _schedule_receipts(self, message_id, sent_at):
+        # Called with the lock held
+        if self.random.random() >= self.delivery_rate:
+            return
+        delivered_at = sent_at + self.random.expovariate(1 / self.receipt_delay) if self.receipt_delay else sent_at
+        self._schedule(delivered_at, lambda: self._receipt(message_id, ACK_DEVICE))
+        if self.random.random() < self.read_rate:
+            read_at = delivered_at + (self.random.expovariate(1 / self.receipt_delay) if self.receipt_delay else 0)
+            self._schedule(read_at, lambda: self._receipt(message_id, ACK_READ))
+
+    def _receipt(self, message_id, ack):
+        self.counts['receipts'] += 1
+        for listener in self._receipt_listeners:
+            listener(message_id, ack)
+
+    def check_numbers(self, phones):
+        """ Return a Future resolved with {phone: registered}, after `check_latency` per 8 numbers """
+        phones = list(phones)
+        future = Future()
+        results = {phone: not phone.startswith(self.unregistered_prefix or '\0') for phone in phones}
+        with self._condition:
+            self.counts['checked'] += len(phones)
+            # The service checks 8 numbers at a time
+            self._schedule(self.clock() + self.check_latency * math.ceil(len(phones) / 8),
+                           lambda: future.set_result(results))
+        return future
+
+    def _schedule(self, due, callback):
+        # Called with the lock held
+        heapq.heappush(self._events, (due, next(self._sequence), callback))
+        if self._events[0][2] is callback:
+            # Only a new earliest event changes how long the scheduler sleeps
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped:
+                    wait = self._events[0][0] - self.clock() if self._events else None
+                    if wait is not None and wait <= 0:
+                        break
+                    self._condition.wait(wait)
+                if self._stopped:
+                    return
+                now = self.clock()
+                due = []
+                while self._events and self._events[0][0] <= now:
+                    due.append(heapq.heappop(self._events)[2])
+            for callback in due:
+                callback()
+
+    def stop(self, timeout=5):
+        """ Stop the scheduler, resolving the sends still in progress at once """
+        with self._condition:
+            if self._stopped:
+                return
+            self._stopped = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+        for _, _, callback in self._events:
+            callback()
+
+    close = stop
+
+def serve(transport, requests=sys.stdin, output=sys.stdout, record=None):
+    """ Answer sender service requests read from `requests` as JSON lines, like senderservice.js """
+    lock = threading.Lock()
+
+    def emit(event):
+        line = json.dumps(event)
+        with lock:
+            output.write(line + '\n')
+            output.flush()
+
+    transport.add_receipt_listener(lambda message_id, ack: emit(
+        {'event': 'message_ack', 'message_id': message_id, 'ack': ack}
+    ))
+    emit({'event': 'ready'})
+    for line in requests:
+        try:
+            request = json.loads(line)
+        except ValueError:
+            emit({'event': 'error', 'error': f'Invalid request: {line.strip()}'})
+            continue
+        kind = request.get('type')
+        if kind == 'send':
+            if record is not None:
+                record.write(line if line.endswith('\n') else line + '\n')
+            future = transport.send(request.get('to', ''), request.get('message', ''), request.get('media'),
+                                    request_id=request.get('id'))
+            future.add_done_callback(lambda future: emit(future.result()))
+        elif kind == 'check':
+            request_id = request.get('id')
+            future = transport.check_numbers(request.get('numbers') or [])
+            future.add_done_callback(lambda future, request_id=request_id: emit(
+                {'event': 'checked', 'id': request_id, 'results': future.result()}
+            ))
+        elif kind == 'shutdown':
+            break
+        else:
+            emit({'event': 'error', 'id': request.get('id'), 'error': f'Unknown request type: {kind}'})
+    transport.stop()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulated sender service: JSON lines in, JSON lines out")
+    parser.add_argument('--latency', type=float, default=0.05, help="mean seconds per send")
+    parser.add_argument('--jitter', type=float, default=0.5, help="log-normal sigma of the latency")
+    parser.add_argument('--workers', type=int, default=8, help="sends processed at once, 0 for no limit")
+    parser.add_argument('--rate-limit', type=int, help="sends per minute above which sends are throttled")
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="transient failures")
+    parser.add_argument('--permanent-rate', type=float, default=0.0)
+    parser.add_argument('--delivery-rate', type=float, default=0.0)
+    parser.add_argument('--read-rate', type=float, default=0.0)
+    parser.add_argument('--receipt-delay', type=float, default=2.0)
+    parser.add_argument('--check-latency', type=float, default=0.05, help="seconds per 8 numbers checked")
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--record', help="append every send request to this file as JSON lines")
+    parser.add_argument('--session', help="accepted for compatibility with the sender service; ignored")
+    args = parser.parse_args(argv)
+
+    transport = SimulatedTransport(
+        latency=args.latency, jitter=args.jitter, workers=args.workers, rate_limit=args.rate_limit,
+        throttle_rate=args.throttle_rate, failure_rate=args.failure_rate, permanent_rate=args.permanent_rate,
+        delivery_rate=args.delivery_rate, read_rate=args.read_rate, receipt_delay=args.receipt_delay,
+        check_latency=args.check_latency, record=False, seed=args.seed
+    )
+    record = open(args.record, 'a', encoding='utf-8') if args.record else None
+    try:
+        serve(transport, record=record)
+    finally:
+        if record is not None:
+            record.close()
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,7 @@
-const fs = require('fs');
+const { updateSessionState } = require('./sessionstate');
 const { Client, LocalAuth } = require('whatsapp-web.js');  // Import Client and LocalAuth
 const puppeteer = require('puppeteer');                    // Import puppeteer for Chromium management
 
-// Path to the status file
-const statusFilePath = 'client_status.json';
-
 // Function to ensure Chromium is installed and get the executable path
 async function ensureChromium() {
     console.log('Checking for Chromium...');
@@ -14,14 +11,14 @@ async function ensureChromium() {
     return chromiumExecutablePath;
 }
 
-// Initialize or reset the status file to loggedIn: false
+// Reset the session state while the client starts
 const initializeStatusFile = () => {
-    fs.writeFileSync(statusFilePath, JSON.stringify({ loggedIn: false }));
+    updateSessionState({ state: 'starting', loggedIn: false, connected: false, lastError: null });
 };
 
-// Update the status file based on client status
-const updateStatusFile = (loggedIn) => {
-    fs.writeFileSync(statusFilePath, JSON.stringify({ loggedIn }));
+// Update the session state based on client status
+const updateStatusFile = (loggedIn, lastError = null) => {
+    updateSessionState({ state: loggedIn ? 'ready' : 'disconnected', loggedIn, connected: loggedIn, lastError });
 };
 
 // Initialize the client and database
@@ -58,6 +55,6 @@ const updateStatusFile = (loggedIn) => {
 
     } catch (error) {
         console.error('Error initializing the client:', error);
-        updateStatusFile(false); // Ensure loggedIn is false if there's an error during initialization
+        updateStatusFile(false, String(error)); // Ensure loggedIn is false if there's an error during initialization
     }
 })();
@@ -0,0 +1,112 @@
+import re
+import hashlib
+import itertools
+from collections import OrderedDict
+
+# {field} or {field|fallback}; {{ and }} are literal braces
+_TOKEN = re.compile(r'\{\{|\}\}|\{(\w+)(?:\|([^{}]*))?\}')
+
+# Fields every recipient has; anything else is looked up in contact_fields
+BUILTIN_FIELDS = ('name', 'phone')
+
+CACHE_SIZE = 128
+_cache = OrderedDict()
+
+class Template:
+    """ A message template parsed once into literal text and field lookups """
+
+    def __init__(self, text):
+        self.text = text
+        self.parts = []
+        self.fields = set()
+        position = 0
+        for match in _TOKEN.finditer(text):
+            self._add_literal(text[position:match.start()])
+            token = match.group(0)
+            if token in ('{{', '}}'):
+                self._add_literal(token[0])
+            else:
+                field, fallback = match.group(1), match.group(2) or ''
+                self.parts.append((field, fallback))
+                self.fields.add(field)
+            position = match.end()
+        self._add_literal(text[position:])
+        self.custom_fields = self.fields.difference(BUILTIN_FIELDS)
+
+    def _add_literal(self, literal):
+        if not literal:
+            return
+        # Merge neighbouring literals so render() does as few joins as possible
+        if self.parts and isinstance(self.parts[-1], str):
+            self.parts[-1] += literal
+        else:
+            self.parts.append(literal)
+
+    @property
+    def is_static(self):
+        return not self.fields
+
+    def render(self, values):
+        """ Render with a dict of field values; missing or empty fields use their fallback """
+        return ''.join(
+            part if isinstance(part, str) else (values.get(part[0]) or part[1])
+            for part in self.parts
+        )
+
+def compile_template(text):
+    """ Return the compiled Template for `text`, cached by content hash """
+    key = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    template = _cache.get(key)
+    if template is None:
+        template = _cache[key] = Template(text)
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    else:
+        _cache.move_to_end(key)
+    return template
+
+def _load_fields(db_connection, contact_ids, custom_fields):
+    """ Return {contact_id: {field: value}} for one chunk of recipients """
+    values = {contact_id: {} for contact_id in contact_ids}
+    if not contact_ids:
+        return values
+    id_marks = ', '.join('?' * len(contact_ids))
+    cursor = db_connection.execute(
+        f"SELECT id, name, phone FROM contacts WHERE id IN ({id_marks})", list(contact_ids)
+    )
+    for contact_id, name, phone in cursor:
+        values[contact_id].update(name=name if name != 'Unknown' else '', phone=phone or '')
+    if custom_fields:
+        field_marks = ', '.join('?' * len(custom_fields))
+        cursor = db_connection.execute(f"""
+            SELECT contact_id, key, value FROM contact_fields
+            WHERE contact_id IN ({id_marks}) AND key IN ({field_marks})
+        """, list(contact_ids) + sorted(custom_fields))
+        for contact_id, key, value in cursor:
+            values[contact_id][key] = value
+    return values
+
+def render_stream(db_connection, text, items, chunk_size=500):
+    """ Lazily yield (key, phone, message) for (key, phone, contact_id) items.
+
+    Field values are loaded one chunk of recipients at a time, so memory stays
+    bounded by chunk_size however many recipients the campaign has.
+    """
+    template = compile_template(text)
+    if template.is_static:
+        # Still rendered once, so {{ and }} escapes are decoded
+        message = template.render({})
+        for key, phone, _ in items:
+            yield key, phone, message
+        return
+
+    items = iter(items)
+    while True:
+        chunk = list(itertools.islice(items, chunk_size))
+        if not chunk:
+            return
+        values = _load_fields(db_connection, {contact_id for _, _, contact_id in chunk if contact_id is not None},
+                              template.custom_fields)
+        for key, phone, contact_id in chunk:
+            fields = values.get(contact_id) or {'phone': phone}
+            yield key, phone, template.render(fields)
@@ -0,0 +1,118 @@
+import time
+import logging
+from contactsync import normalize_phone, DEFAULT_COUNTRY_CODE
+from sendqueue import SendQueue, SKIPPED
+
+# How long a lookup result is trusted; people join WhatsApp more often than they leave it
+REGISTERED_TTL = 30 * 24 * 3600
+UNREGISTERED_TTL = 7 * 24 * 3600
+CHECK_BATCH_SIZE = 100
+CHECK_TIMEOUT = 120
+# SQLite's default limit on bound parameters is 999 on older builds
+_QUERY_CHUNK = 500
+
+MALFORMED = 'Malformed phone number'
+UNREGISTERED = 'Not on WhatsApp'
+
+class NumberCache:
+    """ Registration status of phone numbers, kept in number_cache with a TTL """
+
+    def __init__(self, db_connection, registered_ttl=REGISTERED_TTL, unregistered_ttl=UNREGISTERED_TTL,
+                 clock=time.time):
+        self.db_connection = db_connection
+        self.registered_ttl = registered_ttl
+        self.unregistered_ttl = unregistered_ttl
+        self.clock = clock
+
+    def get_many(self, phones):
+        """ Return {phone: registered} for the phones with a result that has not expired """
+        phones = list(phones)
+        now = self.clock()
+        known = {}
+        for start in range(0, len(phones), _QUERY_CHUNK):
+            chunk = phones[start:start + _QUERY_CHUNK]
+            cursor = self.db_connection.execute(
+                f"SELECT phone, registered, checked_at FROM number_cache WHERE phone IN ({','.join('?' * len(chunk))})",
+                chunk
+            )
+            for phone, registered, checked_at in cursor:
+                ttl = self.registered_ttl if registered else self.unregistered_ttl
+                if now - checked_at < ttl:
+                    known[phone] = bool(registered)
+        return known
+
+    def store(self, results):
+        """ Save {phone: registered} lookup results """
+        now = self.clock()
+        with self.db_connection:
+            self.db_connection.executemany("""
+                INSERT INTO number_cache (phone, registered, checked_at) VALUES (?, ?, ?)
+                ON CONFLICT (phone) DO UPDATE SET registered = excluded.registered, checked_at = excluded.checked_at
+            """, ((phone, int(registered), now) for phone, registered in results.items()))
+
+def validate_job(db_connection, job_id, transport=None, cache=None, on_skip=None, batch_size=CHECK_BATCH_SIZE,
+                 default_country_code=DEFAULT_COUNTRY_CODE, metrics=None):
+    """ Pre-flight check of a job's pending recipients.
+
+    Phones are normalized to E.164 digits and malformed ones are skipped.
+    Registration comes from the number cache where it is fresh; the rest is
+    looked up in batches with `transport.check_numbers()` and cached. Numbers
+    not on WhatsApp are skipped, so they never cost a chat lookup or a failed
+    send. Transports without check_numbers(), and lookups that fail, leave
+    the numbers to be sent as before. `on_skip(item_id, phone, reason)` is
+    called for every skipped item. Returns counts of the outcome.
+    """
+    queue = SendQueue(db_connection)
+    cache = cache or NumberCache(db_connection)
+    check_numbers = getattr(transport, 'check_numbers', None)
+    counts = {'valid': 0, 'malformed': 0, 'unregistered': 0, 'cached': 0, 'checked': 0}
+    items = queue.pending_items(job_id)
+
+    while True:
+        batch = [item for _, item in zip(range(batch_size), items)]
+        if not batch:
+            return counts
+        skipped, renamed, phones = [], [], {}
+        for item_id, phone, _ in batch:
+            normalized = normalize_phone(phone, default_country_code)
+            if normalized is None:
+                skipped.append((SKIPPED, MALFORMED, item_id, phone))
+                continue
+            if normalized != phone:
+                renamed.append((normalized, item_id))
+            phones.setdefault(normalized, []).append(item_id)
+        counts['malformed'] += len(skipped)
+
+        known = cache.get_many(phones)
+        counts['cached'] += len(known)
+        unknown = [phone for phone in phones if phone not in known]
+        if unknown and check_numbers is not None:
+            started = time.perf_counter()
+            try:
+                results = check_numbers(unknown).result(CHECK_TIMEOUT)
+            except Exception as e:
+                # Sending still works without the check; give up on it for this job
+                logging.warning(f'Number lookup failed, sending without it: {e}')
+                check_numbers = None
+                results = {}
+            if metrics is not None:
+                metrics.observe('number_check', time.perf_counter() - started)
+            counts['checked'] += len(results)
+            cache.store(results)
+            known.update(results)
+
+        for phone, item_ids in phones.items():
+            if known.get(phone) is False:
+                skipped.extend((SKIPPED, UNREGISTERED, item_id, phone) for item_id in item_ids)
+                counts['unregistered'] += len(item_ids)
+            else:
+                counts['valid'] += len(item_ids)
+
+        with db_connection:
+            db_connection.executemany("UPDATE send_items SET phone = ? WHERE id = ?", renamed)
+            db_connection.executemany("""
+                UPDATE send_items SET status = ?, last_error = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?
+            """, (row[:3] for row in skipped))
+        if on_skip is not None:
+            for _, reason, item_id, phone in skipped:
+                on_skip(item_id, phone, reason)
@@ -0,0 +1,154 @@
+import re
+import hashlib
+from collections import OrderedDict
+from html.parser import HTMLParser
+
+# Inline tags and the WhatsApp markers they turn into
+INLINE_MARKERS = {
+    'strong': '*', 'b': '*',
+    'em': '_', 'i': '_',
+    's': '~', 'strike': '~', 'del': '~',
+    'code': '```',
+}
+BLOCK_TAGS = {'p', 'div', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'blockquote', 'pre', 'figure', 'table', 'tr'}
+HEADING_TAGS = {'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+SKIPPED_TAGS = {'script', 'style', 'head', 'title'}
+
+CACHE_SIZE = 64
+_cache = OrderedDict()
+_WHITESPACE = re.compile(r'\s+')
+_EXTRA_NEWLINES = re.compile(r'\n{3,}')
+
+class WhatsAppMarkupConverter(HTMLParser):
+    """ Streams editor HTML into WhatsApp markup: *bold*, _italic_, ~strike~ and lists.
+
+    Works on parser events without building a document tree. WhatsApp only
+    honours a marker that touches the text it wraps, so whitespace at the
+    edges of a span is moved outside the markers.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out = []
+        self.spans = []  # (tag, marker, index into out where the span starts)
+        self.lists = []  # [tag, next item number]
+        self.last_span = None  # (marker, index into out) of the last span closed, if it ends with its marker
+        self.skip_depth = 0
+        self.preformatted = 0
+
+    def text(self):
+        return _EXTRA_NEWLINES.sub('\n\n', ''.join(self.out)).strip()
+
+    def _ends_with_newline(self):
+        for chunk in reversed(self.out):
+            if chunk:
+                return chunk.endswith('\n')
+        return True
+
+    def _newlines(self, count):
+        """ Make the output end with at least `count` newlines (none at the very start) """
+        if not self.out:
+            return
+        tail = ''.join(self.out[-4:])
+        existing = len(tail) - len(tail.rstrip('\n'))
+        if existing < count:
+            self.out.append('\n' * (count - existing))
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self.skip_depth += 1
+        elif tag == 'br':
+            self.out.append('\n')
+        elif tag in ('ul', 'ol'):
+            self._newlines(1)
+            self.lists.append([tag, 1])
+        elif tag == 'li':
+            self._newlines(1)
+            indent = '   ' * (len(self.lists) - 1)
+            if self.lists and self.lists[-1][0] == 'ol':
+                self.out.append(f"{indent}{self.lists[-1][1]}. ")
+                self.lists[-1][1] += 1
+            else:
+                self.out.append(f"{indent}• ")
+        elif tag in BLOCK_TAGS:
+            self._newlines(2)
+            if tag == 'blockquote':
+                self.out.append('> ')
+            elif tag == 'pre':
+                self.preformatted += 1
+            if tag in HEADING_TAGS:
+                self.spans.append((tag, '*', len(self.out)))
+        elif tag in INLINE_MARKERS:
+            marker = INLINE_MARKERS[tag]
+            if not any(span[1] == marker for span in self.spans):
+                self.spans.append((tag, marker, len(self.out)))
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif tag in ('ul', 'ol'):
+            if self.lists:
+                self.lists.pop()
+            self._newlines(1 if self.lists else 2)
+        elif tag == 'li':
+            self._newlines(1)
+        elif tag in INLINE_MARKERS or tag in HEADING_TAGS:
+            self._close_span(tag)
+            if tag in HEADING_TAGS:
+                self._newlines(2)
+        elif tag in BLOCK_TAGS:
+            if tag == 'pre':
+                self.preformatted = max(0, self.preformatted - 1)
+            self._newlines(2)
+
+    def _close_span(self, tag):
+        for position in range(len(self.spans) - 1, -1, -1):
+            if self.spans[position][0] == tag:
+                break
+        else:
+            return
+        _, marker, start = self.spans.pop(position)
+        content = ''.join(self.out[start:])
+        core = content.strip()
+        if not core:
+            return
+        lead = content[:len(content) - len(content.lstrip())]
+        trail = content[len(content.rstrip()):]
+        if not lead and self.last_span == (marker, start - 1) and all(span[2] < start for span in self.spans):
+            # Right after a span with the same marker: '*a**b*' is not bold in WhatsApp, so extend that span
+            start -= 1
+            self.out[start:] = [f"{self.out[start][:-len(marker)]}{core}{marker}{trail}"]
+        else:
+            self.out[start:] = [f"{lead}{marker}{core}{marker}{trail}"]
+        self.last_span = None if trail else (marker, start)
+        # Spans left open inside this one (mis-nested HTML) continue after it
+        self.spans = [(tag, marker, min(index, len(self.out))) for tag, marker, index in self.spans]
+
+    def handle_data(self, data):
+        if self.skip_depth:
+            return
+        if not self.preformatted:
+            data = _WHITESPACE.sub(' ', data)
+            if self._ends_with_newline():
+                data = data.lstrip(' ')
+        if data:
+            self.out.append(data)
+
+def convert(html):
+    """ Convert HTML to WhatsApp markup without caching """
+    converter = WhatsAppMarkupConverter()
+    converter.feed(html or '')
+    converter.close()
+    return converter.text()
+
+def html_to_whatsapp(html):
+    """ Convert editor HTML to WhatsApp markup, memoized by content hash """
+    key = hashlib.sha256((html or '').encode('utf-8')).hexdigest()
+    text = _cache.get(key)
+    if text is None:
+        text = _cache[key] = convert(html)
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    else:
+        _cache.move_to_end(key)
+    return text